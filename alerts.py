@@ -0,0 +1,388 @@
+import os
+import json
+import sqlite3
+import threading
+import datetime
+import argparse
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import requests
+
+import engine
+from portfolio import DOMESTIC_PORTFOLIO, OVERSEAS_PORTFOLIO
+
+# Recovery rate at which render_market_card shows "강력 매수 기회"
+RECOVERY_SIGNAL = 0.8
+
+ALERT_OUTBOX = os.path.join(engine.CACHE_DIR, "alerts", "outbox.sqlite3")
+
+# --- Outbox / Sinks ---
+
+class SQLiteOutbox:
+    """
+    Local alert outbox. Every alert carries a dedupe key; inserting a key that
+    already exists is a no-op, so the same firing is never delivered twice
+    (also across restarts). It also keeps the last state (condition held or
+    not) of each price rule, so crossings are detected across restarts.
+    """
+
+    def __init__(self, path=ALERT_OUTBOX):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dedupe_key TEXT UNIQUE NOT NULL,
+                created_at TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                message TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rule_state (
+                rule_id TEXT PRIMARY KEY,
+                active INTEGER NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def put(self, alert):
+        """Stores the alert. Returns False if it was already in the outbox."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO alerts (dedupe_key, created_at, kind, ticker, message, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (alert["dedupe_key"], alert["created_at"], alert["kind"], alert["ticker"],
+                 alert["message"], json.dumps(alert, ensure_ascii=False, default=str))
+            )
+            self._conn.commit()
+            return cur.rowcount == 1
+
+    def recent(self, limit=50):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM alerts ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def rule_states(self):
+        """{rule id: True if its condition held at the last evaluation}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT rule_id, active FROM rule_state").fetchall()
+        return {rule_id: bool(active) for rule_id, active in rows}
+
+    def set_rule_state(self, rule_id, active):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO rule_state (rule_id, active) VALUES (?, ?)",
+                               (rule_id, int(active)))
+            self._conn.commit()
+
+class JsonlOutbox:
+    """
+    File outbox: one JSON alert per line. Dedupe keys are loaded on start;
+    rule states are kept next to it in <path>.state.json.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state_path = path + ".state.json"
+        self._lock = threading.Lock()
+        self._seen = set()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._seen.add(json.loads(line)["dedupe_key"])
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self._states = json.load(f)
+        except FileNotFoundError:
+            self._states = {}
+
+    def put(self, alert):
+        with self._lock:
+            if alert["dedupe_key"] in self._seen:
+                return False
+            self._seen.add(alert["dedupe_key"])
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(alert, ensure_ascii=False, default=str) + "\n")
+            return True
+
+    def rule_states(self):
+        with self._lock:
+            return dict(self._states)
+
+    def set_rule_state(self, rule_id, active):
+        with self._lock:
+            self._states[rule_id] = bool(active)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._states, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+
+class WebhookSink:
+    """Posts each new alert as JSON to a webhook URL (Slack/Discord compatible 'text' field)."""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        try:
+            requests.post(self.url, json={"text": alert["message"], "alert": alert}, timeout=self.timeout)
+        except Exception as e:
+            print(f"Error sending alert to webhook: {e}")
+
+# --- Rule Index ---
+
+class PriceRuleIndex:
+    """
+    Price-threshold rules indexed by ticker.
+
+    Each ticker keeps its rules as parallel NumPy arrays (threshold, direction,
+    rule position), so a quote evaluates all of that ticker's rules in one
+    vectorized comparison and tickers without rules cost a dict lookup.
+    direction = +1 fires when price >= threshold, -1 when price <= threshold.
+    """
+
+    def __init__(self):
+        self._rules = []
+        self._by_ticker = {}
+
+    def build(self, rules):
+        self._rules = list(rules)
+        grouped = defaultdict(list)
+        for pos, rule in enumerate(self._rules):
+            grouped[rule["ticker"]].append(pos)
+        self._by_ticker = {
+            ticker: (
+                np.array([self._rules[p]["threshold"] for p in positions], dtype=np.float64),
+                np.array([self._rules[p]["direction"] for p in positions], dtype=np.int8),
+                np.array(positions, dtype=np.int64)
+            )
+            for ticker, positions in grouped.items()
+        }
+
+    def __len__(self):
+        return len(self._rules)
+
+    def tickers(self):
+        return list(self._by_ticker)
+
+    def rules_for(self, ticker):
+        entry = self._by_ticker.get(ticker)
+        return [] if entry is None else [self._rules[p] for p in entry[2]]
+
+    def match(self, ticker, price):
+        entry = self._by_ticker.get(ticker)
+        if entry is None:
+            return []
+        thresholds, directions, positions = entry
+        hit = directions * (price - thresholds) >= 0
+        return [self._rules[p] for p in positions[hit]]
+
+# --- Rule Builders ---
+
+def position_rules(positions):
+    """
+    Stop-loss (buy_price - 2N) and pyramiding (buy_price + 2N) rules for turtle positions.
+    N is the 20-day ATR from the daily history, refreshed once per session.
+    """
+    rules = []
+    for item in positions:
+        ticker = item['ticker']
+        df = engine.fetch_data(ticker)
+        n_val = engine.calculate_atr(df)
+        if n_val is None:
+            continue
+        name = item.get('name', ticker)
+        buy_price = item['buy_price']
+        rules.append({
+            "id": f"stop_loss:{ticker}:{buy_price}", "kind": "stop_loss", "ticker": ticker,
+            "threshold": buy_price - 2 * n_val, "direction": -1,
+            "message": f"🛑 {name} 손절가 도달 (매수가 {buy_price:,.2f} - 2N = {buy_price - 2 * n_val:,.2f})"
+        })
+        rules.append({
+            "id": f"pyramid:{ticker}:{buy_price}", "kind": "pyramid", "ticker": ticker,
+            "threshold": buy_price + 2 * n_val, "direction": 1,
+            "message": f"🔥 {name} 불타기 가능 (매수가 {buy_price:,.2f} + 2N = {buy_price + 2 * n_val:,.2f})"
+        })
+    return rules
+
+def recovery_rules(histories):
+    """
+    80% recovery ("강력 매수 기회") as a price threshold per index:
+    recovery_rate >= 0.8  <=>  price >= low_since_high + 0.8 * (high_1y - low_since_high)
+    """
+    rules = []
+    for name, (ticker, df) in histories.items():
+        _, mdd_info = engine.track_mdd(df, calendar=engine.ticker_calendar(ticker))
+        if not mdd_info or mdd_info["high_1y"] == mdd_info["low_since_high"]:
+            continue
+        high, low = mdd_info["high_1y"], mdd_info["low_since_high"]
+        rules.append({
+            "id": f"recovery:{ticker}", "kind": "recovery", "ticker": ticker,
+            "threshold": low + RECOVERY_SIGNAL * (high - low), "direction": 1,
+            "message": f"✨ {name} 강력 매수 기회 (회복률 {RECOVERY_SIGNAL:.0%} 이상)"
+        })
+    return rules
+
+# --- Engine ---
+
+class AlertEngine:
+    """
+    Evaluates stop-loss, +2N pyramiding, 80% recovery and market-phase-change
+    triggers on every new quote and writes new firings to the outbox.
+
+    Price-threshold rules live in a PriceRuleIndex. Phase changes depend on the
+    moving averages, so they are evaluated per index against its cached daily
+    history with the quote as the latest close.
+
+    Price rules fire once per crossing: only when their condition goes from not
+    held to held. The last state of every rule is kept in the outbox, so a
+    condition that keeps holding does not fire again on later days or after a
+    restart. Firings are also deduplicated by (rule, session date) in the outbox.
+    """
+
+    def __init__(self, outbox=None, sinks=None, positions=None, indices=None):
+        self.outbox = outbox or SQLiteOutbox()
+        self.sinks = list(sinks or [])
+        self.positions = positions if positions is not None else DOMESTIC_PORTFOLIO + OVERSEAS_PORTFOLIO
+        self.indices = indices if indices is not None else engine.TARGET_INDICES
+        self.rules = PriceRuleIndex()
+        self._histories = {}
+        self._phases = {}
+        self._last_quotes = {}
+        self._rule_states = self.outbox.rule_states()
+        self._built_on = None
+
+    def refresh_rules(self):
+        """Rebuilds thresholds from the latest daily histories (N, 1y high/low, MAs)."""
+        self._histories = {}
+        for name, ticker in self.indices.items():
+            df = engine.fetch_data(ticker)
+            if df is None:
+                continue
+            self._histories[name] = (ticker, df)
+            phase, _ = engine.analyze_market_phase(df, calendar=engine.ticker_calendar(ticker))
+            self._phases.setdefault(ticker, phase)
+
+        self.rules.build(position_rules(self.positions) + recovery_rules(self._histories))
+        self._built_on = datetime.date.today()
+        print(f"Alert rules: {len(self.rules)} price rules on {len(self.rules.tickers())} tickers, "
+              f"{len(self._histories)} indices for phase tracking")
+
+    def tickers(self):
+        return sorted(set(self.rules.tickers()) | {ticker for ticker, _ in self._histories.values()})
+
+    def on_quote(self, ticker, price, bar_date=None):
+        """Evaluates every trigger for one quote. Returns the newly fired alerts."""
+        bar_date = bar_date or datetime.date.today().isoformat()
+        fired = []
+        matched = {rule["id"] for rule in self.rules.match(ticker, price)}
+        for rule in self.rules.rules_for(ticker):
+            active = rule["id"] in matched
+            if active == self._rule_states.get(rule["id"], False):
+                continue
+            self._rule_states[rule["id"]] = active
+            self.outbox.set_rule_state(rule["id"], active)
+            if active:
+                fired.append(self._alert(rule["kind"], ticker, rule["message"], f"{rule['id']}:{bar_date}",
+                                         price=float(price), threshold=float(rule["threshold"])))
+
+        for name, (idx_ticker, df) in self._histories.items():
+            if idx_ticker != ticker:
+                continue
+            phase = self._phase_with_quote(ticker, df, price, bar_date)
+            prev_phase = self._phases.get(ticker)
+            if phase is not None and prev_phase is not None and phase != prev_phase:
+                fired.append(self._alert(
+                    "phase_change", ticker,
+                    f"🌐 {name} 국면 전환: {prev_phase}국면 → {phase}국면",
+                    f"phase:{ticker}:{prev_phase}->{phase}:{bar_date}",
+                    price=price, phase=phase, prev_phase=prev_phase
+                ))
+            if phase is not None:
+                self._phases[ticker] = phase
+
+        return [alert for alert in fired if self._deliver(alert)]
+
+    def poll_once(self):
+        """Fetches the latest bars for every watched ticker and evaluates changed quotes."""
+        if self._built_on != datetime.date.today():
+            self.refresh_rules()
+
+        fired = []
+        for ticker, (bar_date, close, _) in engine.latest_bars(self.tickers()).items():
+            if self._last_quotes.get(ticker) == (bar_date, close):
+                continue
+            self._last_quotes[ticker] = (bar_date, close)
+            fired.extend(self.on_quote(ticker, close, bar_date))
+        return fired
+
+    def run_forever(self, interval=60, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                for alert in self.poll_once():
+                    print(f"[ALERT] {alert['message']}")
+            except Exception as e:
+                print(f"Error evaluating alerts: {e}")
+            stop_event.wait(interval)
+
+    def start_background(self, interval=60):
+        """Runs the polling loop in a daemon thread. Returns the stop event."""
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self.run_forever, args=(interval, stop_event), daemon=True)
+        thread.start()
+        return stop_event
+
+    def _phase_with_quote(self, ticker, df, price, bar_date):
+        closes = df['Close']
+        if closes.index[-1].strftime("%Y-%m-%d") == bar_date:
+            closes = closes.iloc[:-1]
+        quote_df = {"Close": np.append(closes.to_numpy(), price)}
+        phase, _ = engine.analyze_market_phase(pd.DataFrame(quote_df), calendar=engine.ticker_calendar(ticker))
+        return phase
+
+    def _alert(self, kind, ticker, message, dedupe_key, **details):
+        return {
+            "dedupe_key": dedupe_key,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "kind": kind,
+            "ticker": ticker,
+            "message": message,
+            **details
+        }
+
+    def _deliver(self, alert):
+        if not self.outbox.put(alert):
+            return False
+        for sink in self.sinks:
+            sink.send(alert)
+        return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background alert engine (stop-loss, +2N, phase change, 80% recovery)")
+    parser.add_argument("--interval", type=int, default=60, help="Polling interval in seconds")
+    parser.add_argument("--once", action="store_true", help="Evaluate once and exit")
+    parser.add_argument("--outbox", default=ALERT_OUTBOX, help="SQLite outbox path (*.jsonl for a file outbox)")
+    parser.add_argument("--webhook", action="append", default=[], help="Webhook URL to notify (repeatable)")
+    args = parser.parse_args()
+
+    outbox = JsonlOutbox(args.outbox) if args.outbox.endswith(".jsonl") else SQLiteOutbox(args.outbox)
+    alert_engine = AlertEngine(outbox=outbox, sinks=[WebhookSink(url) for url in args.webhook])
+
+    if args.once:
+        for alert in alert_engine.poll_once():
+            print(f"[ALERT] {alert['message']}")
+    else:
+        alert_engine.run_forever(args.interval)
@@ -0,0 +1,300 @@
+import os
+import gzip
+import json
+import math
+import time
+import hashlib
+import datetime
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+import engine
+from portfolio import DOMESTIC_PORTFOLIO, OVERSEAS_PORTFOLIO, DCA_PORTFOLIO, DCA_CASH, DIVIDEND_PORTFOLIO, TURTLE_EQUITY
+
+API_PREFIX = "/api/v1"
+API_SNAPSHOT = os.path.join(engine.CACHE_DIR, "api", "snapshot.pkl")
+SNAPSHOT_REFRESH = 300 # seconds between snapshot rebuilds
+CLIENT_MAX_AGE = 60 # Cache-Control max-age for clients
+
+# --- JSON ---
+
+def to_plain(obj):
+    """Converts engine results (NumPy / pandas values, timestamps, NaN) into JSON-safe Python objects."""
+    if isinstance(obj, dict):
+        return {str(k): to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_plain(v) for v in obj]
+    if isinstance(obj, pd.DataFrame):
+        return [to_plain(row) for row in obj.to_dict(orient="records")]
+    if isinstance(obj, pd.Series):
+        return to_plain(obj.to_dict())
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    return obj
+
+# --- Payloads ---
+
+def market_payload(results):
+    """Market board cards: phase, MDD / recovery, N and the last close per index."""
+    board = {}
+    for name, res in results.items():
+        df = res.get("data")
+        last = {}
+        if df is not None and len(df) >= 2:
+            recent = df.tail(2)
+            close, prev = float(recent["Close"].iloc[-1]), float(recent["Close"].iloc[-2])
+            last = {"date": recent.index[-1], "close": close, "change_pct": (close - prev) / prev * 100}
+        board[name] = {
+            "ticker": engine.TARGET_INDICES.get(name),
+            "phase": res["phase"],
+            "phase_info": res["phase_info"],
+            "mdd": res["mdd"],
+            "mdd_info": res["mdd_info"],
+            "n_value": res["n_value"],
+            **last
+        }
+    return board
+
+def scan_payload(market_type):
+    """Last cached scan (no new scan is started) with turtle unit sizes."""
+    scan = engine.latest_cached_scan(market_type)
+    if scan is None:
+        return {"session": None, "created": None, "results": []}
+    df = pd.DataFrame(scan["results"])
+    if not df.empty:
+        df = engine.size_candidates(df.sort_values("rank"), TURTLE_EQUITY)
+    return {"session": scan["session"], "created": scan["created"], "results": df}
+
+def portfolio_payload():
+    """Current value per account (KRW) and drawdown of the combined equity curve."""
+    accounts = {
+        "터틀": DOMESTIC_PORTFOLIO + OVERSEAS_PORTFOLIO,
+        "적립식": DCA_PORTFOLIO,
+        "배당주": DIVIDEND_PORTFOLIO,
+    }
+    curve, info = engine.portfolio_equity_curve(accounts, base_ccy="KRW", cash={"적립식": DCA_CASH})
+    if curve.empty:
+        return {}
+    last = curve.iloc[-1]
+    return {
+        "date": curve.index[-1],
+        "accounts": {account: last[account] for account in accounts if account in curve.columns},
+        "total": last["Total"],
+        **info
+    }
+
+def phases_payload():
+    """Current phase run per index plus the outlook for that phase."""
+    phases = {}
+    for name, stats in engine.phase_regime_stats().items():
+        current = stats["current"]
+        phases[name] = {
+            "current": current,
+            "next_phase_probs": stats["transitions"].loc[current["phase"]],
+            "forward_returns": stats["forward"].loc[current["phase"]]
+        }
+    return phases
+
+PAYLOADS = {
+    "market": lambda: market_payload(engine.run_analysis()),
+    "scan/US": lambda: scan_payload("US"),
+    "scan/KR": lambda: scan_payload("KR"),
+    "portfolio": portfolio_payload,
+    "phases": phases_payload,
+}
+
+# --- Snapshot ---
+
+def _encode(generated_at, key, value):
+    data = json.dumps(to_plain(value), ensure_ascii=False, separators=(",", ":"))
+    body = f'{{"generated_at":"{generated_at}","{key}":{data}}}'.encode("utf-8")
+    return {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=6),
+        # ETag from the data only: an unchanged payload stays 304 across rebuilds
+        "etag": '"' + hashlib.sha1(data.encode("utf-8")).hexdigest()[:20] + '"'
+    }
+
+def build_snapshot(previous=None):
+    """
+    Computes every payload once and pre-encodes it (JSON bytes, gzip bytes, ETag).
+    A payload that fails keeps its previous version.
+    """
+    generated_at = datetime.datetime.now().isoformat(timespec="seconds")
+    documents = {}
+    for name, build in PAYLOADS.items():
+        try:
+            documents[name] = _encode(generated_at, "data", build())
+        except Exception as e:
+            print(f"Error building API payload {name}: {e}")
+            if previous is not None and name in previous["documents"]:
+                documents[name] = previous["documents"][name]
+    documents["index"] = _encode(generated_at, "endpoints", [f"{API_PREFIX}/{name}" for name in documents])
+    return {"generated_at": generated_at, "documents": documents}
+
+class SnapshotStore:
+    """
+    The snapshot every request is served from.
+    The leader process rebuilds it periodically and writes it to `path`;
+    followers (refresh=False) only reload that file when it changes, so many
+    server processes share one computation.
+    """
+
+    def __init__(self, path=API_SNAPSHOT, interval=SNAPSHOT_REFRESH, refresh=True):
+        self.path = path
+        self.interval = interval
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        """Loads the snapshot file if it changed since the last load."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        snapshot = engine._read_pickle(self.path)
+        if snapshot is not None:
+            with self._lock:
+                self._snapshot, self._mtime = snapshot, mtime
+
+    def rebuild(self):
+        try:
+            # Daily bulk refresh of the fundamentals store; a no-op while it is fresh
+            engine.refresh_fundamentals()
+        except Exception as e:
+            print(f"Error refreshing fundamentals: {e}")
+        snapshot = build_snapshot(self._snapshot)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        engine._write_pickle(self.path, snapshot)
+        with self._lock:
+            self._snapshot, self._mtime = snapshot, os.path.getmtime(self.path)
+        return snapshot
+
+    def get(self, name):
+        with self._lock:
+            if self._snapshot is None:
+                return None
+            return self._snapshot["documents"].get(name)
+
+    def run_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            started = time.time()
+            try:
+                if self.refresh:
+                    self.rebuild()
+                else:
+                    self.reload()
+            except Exception as e:
+                print(f"Error refreshing API snapshot: {e}")
+            stop_event.wait(max(self.interval - (time.time() - started), 1) if self.refresh else min(self.interval, 5))
+
+    def start_background(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self.run_forever, args=(stop_event,), daemon=True)
+        thread.start()
+        return stop_event
+
+# --- HTTP ---
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """GET/HEAD of pre-encoded snapshot documents with ETag / If-None-Match and gzip."""
+
+    store = None
+    server_version = "StockAppAPI/1.0"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path in ("", API_PREFIX):
+            path = f"{API_PREFIX}/index"
+        name = path[len(API_PREFIX) + 1:] if path.startswith(API_PREFIX + "/") else None
+        document = self.store.get(name) if name else None
+
+        if document is None:
+            status = 503 if name in PAYLOADS else 404
+            body = json.dumps({"error": "snapshot not ready" if status == 503 else "not found"}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+            return
+
+        etag = document["etag"]
+        client_tags = [tag.strip().removeprefix("W/") for tag in self.headers.get("If-None-Match", "").split(",")]
+        if etag in client_tags or "*" in client_tags:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"max-age={CLIENT_MAX_AGE}")
+            self.end_headers()
+            return
+
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = document["gzip"] if use_gzip else document["body"]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"max-age={CLIENT_MAX_AGE}")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Widgets poll constantly; keep the console for errors only
+        pass
+
+def serve(store, host="127.0.0.1", port=8765):
+    handler = type("BoundApiHandler", (ApiHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {API_PREFIX} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the engine, served from a precomputed snapshot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=int, default=SNAPSHOT_REFRESH, help="Snapshot rebuild interval in seconds")
+    parser.add_argument("--snapshot", default=API_SNAPSHOT, help="Snapshot file shared between server processes")
+    parser.add_argument("--follow", action="store_true", help="Serve the snapshot another process maintains (no rebuilds)")
+    parser.add_argument("--once", action="store_true", help="Rebuild the snapshot once and exit")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.snapshot, interval=args.interval, refresh=not args.follow)
+    if args.once:
+        snapshot = store.rebuild()
+        for name, doc in snapshot["documents"].items():
+            print(f"{API_PREFIX}/{name}: {len(doc['body']):,} bytes ({len(doc['gzip']):,} gzip) {doc['etag']}")
+    else:
+        store.start_background()
+        serve(store, args.host, args.port)
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 import datetime
+import time
+from collections import OrderedDict
 import plotly.graph_objects as go
 import engine
 
@@ -68,33 +70,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Portfolio Data ---
-DOMESTIC_PORTFOLIO = [
-    {"ticker": "005930.KS", "buy_price": 77800.0, "quantity": 2, "name": "삼성전자"},
-    {"ticker": "015760.KS", "buy_price": 44600.0, "quantity": 6, "name": "한국전력"},
-]
-
-OVERSEAS_PORTFOLIO = [
-    {"ticker": "AMZN", "buy_price": 216.20, "quantity": 1, "name": "아마존닷컴"},
-    {"ticker": "GOOGL", "buy_price": 265.11, "quantity": 2, "name": "알파벳 A"},
-]
-
-# DCA (적립식) Portfolio Data
-DCA_PORTFOLIO = [
-    {"ticker": "133690.KS", "buy_price": 108900, "quantity": 3, "name": "TIGER 미국나스닥100"},
-    {"ticker": "360750.KS", "buy_price": 18125.78, "quantity": 32, "name": "TIGER 미국S&P500"},
-    {"ticker": "453870.KS", "buy_price": 13439.32, "quantity": 125, "name": "TIGER 인도니프티50"},
-    {"ticker": "102110.KS", "buy_price": 31460, "quantity": 16, "name": "TIGER 200"},
-    {"ticker": "GC=F", "buy_price": 181778.91, "quantity": 11, "name": "금 99.99K"},
-]
-DCA_CASH = 2073504.0 + 294975.0 # 이전에 있던 예수금 + 금 계좌의 예수금
-
-# Dividend (배당주) Portfolio Data
-DIVIDEND_PORTFOLIO = [
-    {"ticker": "JEPI", "buy_price_usd": 54.4955, "quantity": 29, "name": "JP Morgan Equity Premium Income"},
-    {"ticker": "SCHD", "buy_price_usd": 25.5364, "quantity": 305, "name": "Schwab US Dividend Equity"},
-    {"ticker": "SCHG", "buy_price_usd": 22.59, "quantity": 33, "name": "Schwab US Large-Cap Growth"},
-    {"ticker": "SPYM", "buy_price_usd": 58.9975, "quantity": 16, "name": "SPDR Portfolio S&P 500 ETF"},
-]
+# 보유 종목 데이터는 portfolio.py 에서 관리 (알림 엔진 등 Streamlit 외부에서도 사용)
+from portfolio import DOMESTIC_PORTFOLIO, OVERSEAS_PORTFOLIO, DCA_PORTFOLIO, DCA_CASH, DCA_MONTHLY_BUDGET, DCA_BUY_WINDOW, DCA_GOLD_UNITS, DCA_TARGET_PLAN, DIVIDEND_PORTFOLIO, TURTLE_EQUITY
 
 # --- Helper Functions ---
 # --- Helper Functions (Existing) ---
@@ -119,8 +96,9 @@ def render_market_card(key, data):
     change_html = ""
     
     if df is not None and len(df) >= 2:
-        last_row = df.iloc[-1]
-        prev_row = df.iloc[-2]
+        recent = df.tail(2)
+        last_row = recent.iloc[-1]
+        prev_row = recent.iloc[-2]
         current_price = last_row['Close']
         prev_price = prev_row['Close']
         change_point = current_price - prev_price
@@ -184,9 +162,99 @@ def get_phase_info(phase):
     else:
         return "gray", "➖", "알 수 없음"
 
+def phase_outlook_text(stats):
+    """현재 국면 지속 기간, 가장 유력한 다음 국면, 과거 20일 평균 수익률 요약"""
+    if not stats:
+        return ""
+    current = stats["current"]
+    phase = current["phase"]
+    next_probs = stats["transitions"].loc[phase].dropna()
+    fwd = stats["forward"].loc[phase].get("fwd_20")
+    text = f"국면 지속: {current['bars']}일째"
+    if not next_probs.empty:
+        text += f" · 다음 국면: {next_probs.idxmax()}국면 ({next_probs.max():.0%})"
+    if pd.notna(fwd):
+        text += f" · 과거 20일 평균: {fwd:+.2%}"
+    return text
+
+# --- Session Memo ---
+# 페이지 이동/위젯 조작 시 같은 계산을 반복하지 않도록 세션별로 결과를 보관
+# 키: (함수, 입력값, 데이터 버전) / 데이터 버전이 바뀌면 전체 무효화
+MEMO_MAX_ENTRIES = 64
+
+def data_version():
+    """시세 데이터 버전: 가격 캐시 TTL 구간마다, 그리고 '데이터 새로고침' 시 변경"""
+    return (int(time.time() // engine.PRICE_CACHE_TTL), st.session_state.get("data_epoch", 0))
+
+def _freeze(value):
+    """dict/list 입력을 해시 가능한 키로 변환"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def session_memo(func, *args, **kwargs):
+    """세션 범위 LRU 메모 (최대 MEMO_MAX_ENTRIES개)"""
+    version = data_version()
+    if st.session_state.get("_memo_version") != version:
+        st.session_state["_memo"] = OrderedDict()
+        st.session_state["_memo_version"] = version
+    memo = st.session_state["_memo"]
+
+    key = (func.__module__, func.__qualname__, _freeze(args), _freeze(kwargs))
+    if key in memo:
+        memo.move_to_end(key)
+        return memo[key]
+    value = func(*args, **kwargs)
+    memo[key] = value
+    while len(memo) > MEMO_MAX_ENTRIES:
+        memo.popitem(last=False)
+    return value
+
+def _holding_quotes(tickers):
+    histories = engine.fetch_many(list(tickers), cached=False)
+    quotes = {}
+    for ticker, df in histories.items():
+        if df is None or df.empty:
+            continue
+        last_close = float(df['Close'].iloc[-1])
+        quotes[ticker] = {
+            "last_close": last_close,
+            "prev_close": float(df['Close'].iloc[-2]) if len(df) >= 2 else last_close,
+            "n_val": engine.calculate_atr(df)
+        }
+    return quotes
+
+def holding_quotes(tickers):
+    """종목별 종가/전일 종가/N값 - 보유 종목, 불타기 페이지가 같은 메모를 공유"""
+    return session_memo(_holding_quotes, tuple(sorted(set(tickers))))
+
+def turtle_equity():
+    """사이드바 터틀 계좌 기준 자산 - 입력값은 세션에 보관되어 보유 종목/스캐너 페이지가 함께 사용"""
+    equity = st.sidebar.number_input(
+        "터틀 계좌 기준 자산 (원)", min_value=0.0,
+        value=st.session_state.get("turtle_equity", TURTLE_EQUITY), step=1_000_000.0
+    )
+    st.session_state["turtle_equity"] = equity
+    return equity
+
+def turtle_book(equity):
+    """현재 터틀 보유 종목의 유닛 수 (ticker, units) - 스캔 후보의 유닛 한도 계산용"""
+    holdings = DOMESTIC_PORTFOLIO + OVERSEAS_PORTFOLIO
+    quotes = holding_quotes([item['ticker'] for item in holdings])
+    positions = [
+        {"ticker": item['ticker'], "quantity": item['quantity'], "buy_price": item['buy_price'],
+         "n_val": quotes[item['ticker']]['n_val'], "last_close": quotes[item['ticker']]['last_close']}
+        for item in holdings
+        if item['ticker'] in quotes and quotes[item['ticker']]['n_val'] is not None
+    ]
+    heat_df, _ = engine.portfolio_heat(positions, equity)
+    return heat_df[["ticker", "units"]] if not heat_df.empty else None
+
 def check_dca_status():
     today = datetime.date.today()
-    if 15 <= today.day <= 20:
+    if DCA_BUY_WINDOW[0] <= today.day <= DCA_BUY_WINDOW[1]:
         return "BUY"
     return "WAIT"
 
@@ -197,12 +265,17 @@ def show_market_board():
     
     if st.sidebar.button("데이터 새로고침"):
         st.cache_data.clear()
+        st.session_state["data_epoch"] = st.session_state.get("data_epoch", 0) + 1
         
-    days_to_show = st.sidebar.slider("차트 조회 기간 (일)", 30, 365, 100)
+    # 일봉/주봉/월봉 (주봉·월봉은 engine에서 증분 집계된 봉으로 국면/MDD/N값 계산)
+    timeframes = {"일봉": "D", "주봉": "W", "월봉": "M"}
+    timeframe = timeframes[st.sidebar.radio("차트 주기", list(timeframes.keys()), horizontal=True)]
+    bar_limits = {"D": (30, 365, 100), "W": (26, 260, 104), "M": (12, 120, 60)}
+    bars_to_show = st.sidebar.slider("차트 조회 기간 (봉 개수)", *bar_limits[timeframe])
         
     # 데이터 로드
     with st.spinner("시장 데이터 분석 중..."):
-        results = engine.run_analysis()
+        results = session_memo(engine.run_analysis, timeframe=timeframe)
 
     # 카드 형태로 표시
     cols = st.columns(3)
@@ -216,7 +289,7 @@ def show_market_board():
             # 차트 렌더링
             df = results[key].get('data')
             if df is not None and not df.empty:
-                chart_data = df.tail(days_to_show)
+                chart_data = df.tail(bars_to_show)
                 fig = go.Figure()
                 fig.add_trace(go.Candlestick(
                     x=chart_data.index, open=chart_data['Open'], high=chart_data['High'],
@@ -238,38 +311,88 @@ def show_market_board():
             else:
                 st.warning("차트 데이터 없음")
 
+    # 지수 간 상관관계 (63일 롤링, 증분 갱신) 및 단일연결 군집
+    with st.expander("📊 지수 상관관계"):
+        corr = session_memo(engine.rolling_correlation, list(engine.TARGET_INDICES.values()))
+        if corr.empty:
+            st.warning("상관관계 데이터 없음")
+        else:
+            names = {v: k for k, v in engine.TARGET_INDICES.items()}
+            corr = corr.rename(index=names, columns=names)
+            fig = go.Figure(go.Heatmap(
+                z=corr.values, x=corr.columns, y=corr.index,
+                zmin=-1, zmax=1, colorscale='RdBu_r', text=corr.round(2).values, texttemplate="%{text}"
+            ))
+            fig.update_layout(height=450, margin=dict(l=0, r=0, t=10, b=0))
+            st.plotly_chart(fig, use_container_width=True)
+
+            clusters = engine.cluster_correlations(corr, threshold=0.7)
+            groups = {}
+            for name, label in clusters.items():
+                groups.setdefault(label, []).append(name)
+            linked = [", ".join(g) for g in groups.values() if len(g) > 1]
+            st.caption("상관계수 0.7 이상 군집: " + (" / ".join(linked) or "없음"))
+
+    # 국면 이력 통계 (국면 구간, 전이 확률, 국면별 평균 선행 수익률)
+    with st.expander("🧭 국면 이력 통계"):
+        regime = session_memo(engine.phase_regime_stats)
+        if not regime:
+            st.warning("국면 이력 데이터 없음")
+        else:
+            name = st.selectbox("지수 선택", list(regime.keys()))
+            stats = regime[name]
+            current = stats["current"]
+            st.markdown(f"**현재 {current['phase']}국면 {current['bars']}일째** (구간 수익률 {current['return']:+.2%}, {current['start']:%Y-%m-%d} 시작)")
+
+            col_t, col_f = st.columns(2)
+            with col_t:
+                st.caption("다음 국면 전이 확률")
+                trans = stats["transitions"]
+                fig = go.Figure(go.Heatmap(
+                    z=trans.values, x=[f"{p}국면" for p in trans.columns], y=[f"{p}국면" for p in trans.index],
+                    zmin=0, zmax=1, colorscale='Blues', text=trans.round(2).values, texttemplate="%{text}"
+                ))
+                fig.update_layout(height=350, margin=dict(l=0, r=0, t=10, b=0), yaxis_autorange='reversed')
+                st.plotly_chart(fig, use_container_width=True)
+            with col_f:
+                st.caption("국면별 평균 선행 수익률")
+                fwd = stats["forward"].copy()
+                fwd.index = [f"{p}국면" for p in fwd.index]
+                fwd.columns = [f"{c.split('_')[1]}일 후" for c in fwd.columns]
+                st.dataframe(fwd.style.format("{:+.2%}", na_rep="-"), use_container_width=True)
+
+            runs = stats["runs"].tail(10).iloc[::-1].copy()
+            runs.columns = ["국면", "시작", "종료", "기간(일)", "구간 수익률"]
+            st.dataframe(runs.style.format({"구간 수익률": "{:+.2%}", "시작": "{:%Y-%m-%d}", "종료": "{:%Y-%m-%d}"}),
+                         use_container_width=True, hide_index=True)
+
 def render_portfolio_table(portfolio, title, is_overseas=False):
     st.subheader(title)
     
     # 환율 정보 (미장의 경우)
-    exchange_rate = 1.0
-    if is_overseas:
-        try:
-            ex_data = engine.fetch_data("USDKRW=X", period="5d")
-            if ex_data is not None and not ex_data.empty:
-                exchange_rate = ex_data['Close'].iloc[-1]
-            else:
-                exchange_rate = 1450.0 # 기본값
-        except:
-            exchange_rate = 1450.0
+    # 환율은 engine의 FX 매트릭스(캐시)에서 조회 - 새로고침당 1회만 다운로드
+    exchange_rate = engine.fx_rate("USD", "KRW") if is_overseas else 1.0
 
     portfolio_data_mgt = []
     portfolio_data_pnl = []
+    positions = [] # 전체 북 리스크(heat) 계산용
     
     with st.spinner(f"{title} 분석 중..."):
+        # 전 종목 시세를 동시에 조회 (engine 비동기 I/O), 세션 메모로 페이지 간 재사용
+        quotes = holding_quotes([item['ticker'] for item in portfolio])
         for item in portfolio:
             ticker = item['ticker']
             buy_price = item['buy_price']
             qty = item['quantity']
             name = item.get('name', ticker)
             
-            df_ticker = engine.fetch_data(ticker)
-            if df_ticker is None or df_ticker.empty: continue
+            quote = quotes.get(ticker)
+            if quote is None: continue
                 
-            last_close = df_ticker['Close'].iloc[-1]
-            prev_close = df_ticker['Close'].iloc[-2] if len(df_ticker) >= 2 else last_close
+            last_close = quote['last_close']
+            prev_close = quote['prev_close']
             change_1d = ((last_close - prev_close) / prev_close) * 100
-            n_val = engine.calculate_atr(df_ticker)
+            n_val = quote['n_val']
             if n_val is None: continue
             
             # --- 1. 터틀 자금 관리 및 손절 데이터 ---
@@ -306,6 +429,8 @@ def render_portfolio_table(portfolio, title, is_overseas=False):
             target_4n = buy_price + (4 * n_val)
             exit_status = "도달" if last_close >= target_4n else "미도달"
             
+            positions.append({"ticker": ticker, "quantity": qty, "buy_price": buy_price, "n_val": n_val, "last_close": last_close})
+
             portfolio_data_pnl.append({
                 "종목": name,
                 "티커": ticker,
@@ -365,6 +490,8 @@ def render_portfolio_table(portfolio, title, is_overseas=False):
     else:
         st.write(f"{title} 데이터가 없습니다.")
 
+    return positions
+
 def show_turtle_portfolio():
     st.header("🐢 터틀 보유 종목")
     st.markdown("""
@@ -373,16 +500,41 @@ def show_turtle_portfolio():
     </div>
     """, unsafe_allow_html=True)
     
-    render_portfolio_table(DOMESTIC_PORTFOLIO, "🇰🇷 국내 주식 (국장)", is_overseas=False)
+    equity = turtle_equity()
+
+    positions = render_portfolio_table(DOMESTIC_PORTFOLIO, "🇰🇷 국내 주식 (국장)", is_overseas=False)
+    st.markdown("---")
+    positions += render_portfolio_table(OVERSEAS_PORTFOLIO, "🇺🇸 해외 주식 (미장)", is_overseas=True)
+
+    # 전체 북 리스크 (모든 종목이 손절가에 도달할 경우의 총 손실)
     st.markdown("---")
-    render_portfolio_table(OVERSEAS_PORTFOLIO, "🇺🇸 해외 주식 (미장)", is_overseas=True)
+    st.subheader("🔥 포트폴리오 리스크 (Heat)")
+    heat_df, heat = engine.portfolio_heat(positions, equity)
+    if heat_df.empty:
+        st.write("보유 종목이 없습니다.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("손절 시 총 손실", f"{heat['risk_base']:,.0f}원")
+    col2.metric("계좌 대비 Heat", f"{heat['heat']:.2%}")
+    col3.metric("보유 유닛 합계", f"{heat_df['units'].sum():.1f} / {engine.TURTLE_UNIT_LIMITS['total']}")
+    st.dataframe(
+        heat_df[["ticker", "market", "quantity", "stop_price", "units", "risk_base", "heat"]]
+        .rename(columns={"ticker": "티커", "market": "시장", "quantity": "보유수량", "stop_price": "손절가",
+                         "units": "유닛", "risk_base": "손절 시 손실(원)", "heat": "Heat"})
+        .style.format({"손절가": "{:,.2f}", "유닛": "{:.2f}", "손절 시 손실(원)": "{:,.0f}", "Heat": "{:.2%}"}),
+        use_container_width=True, hide_index=True
+    )
+    st.caption(f"💡 1유닛 = 기준 자산의 {engine.TURTLE_RISK_PER_UNIT:.0%}를 1N 변동에 거는 수량 | "
+               f"시장별 Heat: " + ", ".join(f"{m} {v:.2%}" for m, v in heat['by_market'].items()))
 
 def show_turtle_search():
     st.header("🔍 터틀 종목 검색 & 스캐너")
     
     # 1. 시장 국면 상태 확인 (스캐너 작동 조건)
     st.subheader("🌐 시장 상태 확인")
-    market_status = engine.run_analysis()
+    market_status = session_memo(engine.run_analysis)
+    regime = session_memo(engine.phase_regime_stats)
     
     col_stat1, col_stat2 = st.columns(2)
     with col_stat1:
@@ -395,7 +547,8 @@ def show_turtle_search():
         <div style="padding:15px; border-radius:10px; border-left:5px solid {status_color}; background-color:white; box-shadow: 0 2px 4px rgba(0,0,0,0.05);">
             <b>🇺🇸 미장 (NASDAQ): Phase {nasdaq_phase} {icon}</b><br>
             조언: {p1}<br>
-            스캐너 상태: {"✅ 가동 가능" if is_us_ok else "⚠️ 대기 (1,2국면 아님)"}
+            스캐너 상태: {"✅ 가동 가능" if is_us_ok else "⚠️ 대기 (1,2국면 아님)"}<br>
+            {phase_outlook_text(regime.get("NASDAQ"))}
         </div>
         """, unsafe_allow_html=True)
 
@@ -409,7 +562,8 @@ def show_turtle_search():
         <div style="padding:15px; border-radius:10px; border-left:5px solid {status_color}; background-color:white; box-shadow: 0 2px 4px rgba(0,0,0,0.05);">
             <b>🇰🇷 국장 (KOSPI): Phase {kospi_phase} {icon}</b><br>
             조언: {p1}<br>
-            스캐너 상태: {"✅ 가동 가능" if is_kr_ok else "⚠️ 대기 (1,2국면 아님)"}
+            스캐너 상태: {"✅ 가동 가능" if is_kr_ok else "⚠️ 대기 (1,2국면 아님)"}<br>
+            {phase_outlook_text(regime.get("KOSPI"))}
         </div>
         """, unsafe_allow_html=True)
 
@@ -417,7 +571,29 @@ def show_turtle_search():
 
     # 2. 개별 종목 검색
     st.subheader("🎯 개별 종목 분석")
-    ticker_input = st.text_input("종목 티커 입력 (예: TSLA, NVDA, 005930.KS)", "").upper()
+    query = st.text_input("종목 검색 (티커/종목명, 예: TSLA, 삼성전자, 005930)", "").strip()
+    
+    # 네트워크 조회 전에 로컬 종목 인덱스로 티커 확인 (오타는 후보 목록으로 안내)
+    # 인덱스에 없으면 입력한 티커 그대로 조회가 기본값 (후보는 사용자가 직접 선택할 때만 사용)
+    ticker_input = None
+    if query:
+        match = engine.resolve_symbol(query)
+        if match is None:
+            as_typed = {"ticker": query.upper(), "name": "", "name_en": "", "exchange": ""}
+            candidates = engine.search_symbols(query)
+            if candidates:
+                match = st.selectbox(
+                    "목록에서 일치하는 종목이 없습니다. 입력한 티커로 조회하거나 후보를 선택하세요.", [as_typed] + candidates,
+                    format_func=lambda c: f"{c['ticker']} (입력한 티커 그대로 조회)" if c is as_typed
+                    else f"{c['ticker']} · {c['name'] or c['name_en']} ({c['exchange']})"
+                )
+            else:
+                st.caption(f"'{query}'은(는) 종목 목록에 없어 입력한 티커 그대로 조회합니다.")
+                match = as_typed
+        if match is not None:
+            ticker_input = match["ticker"]
+            if match["name"] or match["name_en"]:
+                st.caption(f"{ticker_input} · {match['name'] or match['name_en']} ({match['exchange']})")
     
     if ticker_input:
         with st.spinner(f"{ticker_input} 데이터 분석 중..."):
@@ -456,44 +632,106 @@ def show_turtle_search():
 
     # 3. 실시간 종목 스캐너
     st.subheader("🔥 터틀 종목 스캐너 (20일 신고가 & 추세)")
+    # 유닛 사이즈/한도는 사이드바 기준 자산과 현재 보유 유닛을 반영
+    sizing = {"equity": turtle_equity()}
+    sizing["held"] = turtle_book(sizing["equity"])
+    sectors = sorted((set(engine.get_universe("US")["sector"]) | set(engine.get_universe("KR")["sector"])) - {""})
+    selected_sectors = st.multiselect("섹터 필터 (비우면 전체)", sectors)
+    # 밸류에이션 필터는 펀더멘털 저장소(일 1회 일괄 갱신)에서 평가 - 스캔 중 추가 네트워크 조회 없음
+    with st.expander("💹 밸류에이션 필터"):
+        col_v1, col_v2, col_v3 = st.columns(3)
+        max_per = col_v1.number_input("PER 상한 (0 = 제한 없음)", min_value=0.0, value=0.0, step=1.0)
+        max_pbr = col_v2.number_input("PBR 상한 (0 = 제한 없음)", min_value=0.0, value=0.0, step=0.1)
+        min_yield = col_v3.number_input("배당수익률 하한 (%)", min_value=0.0, value=0.0, step=0.5)
+    valuation_filters = {}
+    if max_per:
+        valuation_filters["per"] = (0, max_per)
+    if max_pbr:
+        valuation_filters["pbr"] = (0, max_pbr)
+    if min_yield:
+        valuation_filters["dividend_yield"] = (min_yield, None)
     col_scan1, col_scan2 = st.columns(2)
     
     with col_scan1:
         if st.button("🇺🇸 미장 종목 스캔", use_container_width=True):
             if not is_us_ok:
                 st.warning("미장이 현재 1, 2국면이 아닙니다. (보수적 접근 권장)")
-            
-            with st.spinner("미장 유니버스 스캔 중 (S&P/Nasdaq)..."):
-                results = engine.screen_stocks("US")
-                if not results.empty:
-                    st.success(f"{len(results)}개의 유망 종목 발견!")
-                    render_scan_results(results)
-                else:
-                    st.info("조건을 충족하는 종목이 현재 없습니다.")
+            st.caption("미장 유니버스 스캔 중 (S&P 500/NASDAQ-100)...")
+            run_streaming_scan("US", selected_sectors, valuation_filters, sizing)
+        else:
+            show_last_scan("US", sizing)
 
     with col_scan2:
         if st.button("🇰🇷 국장 종목 스캔", use_container_width=True):
             if not is_kr_ok:
                 st.warning("국장이 현재 1, 2국면이 아닙니다. (보수적 접근 권장)")
-                
-            with st.spinner("국장 유니버스 스캔 중 (KOSPI 50)..."):
-                results = engine.screen_stocks("KR")
-                if not results.empty:
-                    st.success(f"{len(results)}개의 유망 종목 발견!")
-                    render_scan_results(results)
-                else:
-                    st.info("조건을 충족하는 종목이 현재 없습니다.")
+            st.caption("국장 유니버스 스캔 중 (KOSPI/KOSDAQ)...")
+            run_streaming_scan("KR", selected_sectors, valuation_filters, sizing)
+        else:
+            show_last_scan("KR", sizing)
+
+def run_streaming_scan(market_type, sectors, valuation_filters=None, sizing=None):
+    """종목별 평가가 끝나는 대로 결과 표를 점진적으로 갱신 (당일 스캔 결과는 캐시에서 즉시 표시)"""
+    scan = {"results": [], "done": 0, "total": 0, "finished": False}
+    st.session_state[f"scan_{market_type}"] = scan
+
+    progress_bar = st.progress(0.0, text="스캔 준비 중...")
+    # 중지 버튼을 누르면 스크립트가 재실행되면서 진행 중인 스캔이 취소됨 (부분 결과는 유지)
+    st.button("⏹ 스캔 중지", key=f"cancel_scan_{market_type}")
+    table = st.empty()
+
+    for progress in engine.iter_cached_scan(market_type, sectors=sectors, fundamental_filters=valuation_filters):
+        scan["done"], scan["total"] = progress["done"], progress["total"]
+        if progress["results"]:
+            scan["results"].extend(progress["results"])
+            with table.container():
+                render_scan_results(pd.DataFrame(scan["results"]).sort_values("rank"), sizing)
+        progress_bar.progress(
+            scan["done"] / scan["total"],
+            text=f"{scan['done']}/{scan['total']} 종목 확인 ({len(scan['results'])}개 발견)"
+        )
+
+    scan["finished"] = True
+    progress_bar.empty()
+    if scan["results"]:
+        st.success(f"{len(scan['results'])}개의 유망 종목 발견!")
+    else:
+        st.info("조건을 충족하는 종목이 현재 없습니다.")
+
+def show_last_scan(market_type, sizing=None):
+    """직전 스캔 결과 (중지된 경우 부분 결과) 표시"""
+    scan = st.session_state.get(f"scan_{market_type}")
+    if not scan:
+        return
+    if not scan["finished"]:
+        st.warning(f"스캔이 중지되었습니다. ({scan['done']}/{scan['total']} 종목 확인)")
+    if scan["results"]:
+        render_scan_results(pd.DataFrame(scan["results"]).sort_values("rank"), sizing)
+
+def render_scan_results(df, sizing=None):
+    # 터틀 유닛 사이즈 및 유닛 한도 (종목/섹터/시장/전체) 적용 결과 - 보유 유닛 포함
+    # 그룹 한도: 63일 수익률 상관 0.7 이상 군집(후보 + 보유 종목), 나머지는 섹터 기준
+    sizing = sizing or {}
+    held = sizing.get("held")
+    tickers = sorted(set(df["ticker"]) | (set(held["ticker"]) if held is not None else set()))
+    groups = session_memo(engine.correlation_groups, tuple(tickers))
+    sized = engine.size_candidates(df, sizing.get("equity", TURTLE_EQUITY), held=held, groups=groups)
+    sized["한도"] = sized["accepted"].map(lambda ok: "✅" if ok else "⛔") + " " + sized["reason"]
 
-def render_scan_results(df):
     # 결과 테이블 스타일링
     st.dataframe(
-        df.style.format({
+        sized.style.format({
             "current_price": "{:,.2f}",
             "1N": "{:,.2f}",
-            "market_cap": "{:,.0f}"
+            "market_cap": "{:,.0f}",
+            "per": "{:,.1f}",
+            "pbr": "{:,.2f}",
+            "dividend_yield": "{:,.2f}%",
+            "unit_cost_base": "{:,.0f}",
+            "risk_at_stop_base": "{:,.0f}"
         }),
         use_container_width=True,
-        column_order=["name", "ticker", "current_price", "1N", "status"]
+        column_order=["name", "ticker", "current_price", "1N", "per", "pbr", "dividend_yield", "status", "unit_qty", "unit_cost_base", "risk_at_stop_base", "한도"]
     )
 
 def show_dca_page():
@@ -506,6 +744,8 @@ def show_dca_page():
         total_eval_val = 0
         total_buy_val = 0
         dca_results = []
+        dca_items = [] # 매수 가이드용 (ticker, last_close)
+        histories = session_memo(engine.fetch_many, [item['ticker'] for item in DCA_PORTFOLIO if item['ticker'] != "GC=F"], cached=False)
         
         for item in DCA_PORTFOLIO:
             ticker = item['ticker']
@@ -517,7 +757,7 @@ def show_dca_page():
             
             if ticker == "GC=F":
                 # 국내 금 시세 (네이버/KRX) 직접 크롤링
-                last_close = engine.get_domestic_gold_price()
+                last_close = session_memo(engine.get_domestic_gold_price)
                 # 만약 크롤링 실패 시 기존 보정 로직 (임시 방편)
                 if last_close is None:
                     df_gold = engine.fetch_data("GC=F")
@@ -525,7 +765,7 @@ def show_dca_page():
                         raw_gold = float(df_gold['Close'].iloc[-1])
                         last_close = raw_gold * 47.64
             else:
-                df_stock = engine.fetch_data(ticker)
+                df_stock = histories.get(ticker)
                 if df_stock is not None and not df_stock.empty:
                     # yfinance 데이터가 MultiIndex일 경우를 대비해 확실하게 스칼라 값 추출
                     close_val = df_stock['Close']
@@ -550,6 +790,7 @@ def show_dca_page():
                 "buy_price": buy_price,
                 "qty": qty
             }
+            dca_items.append(item_res)
             pl_val = eval_val - buy_val
             pl_pct = (pl_val / buy_val) * 100 if buy_val > 0 else 0
             
@@ -623,73 +864,102 @@ def show_dca_page():
     # 3. 매수 가이드
     st.markdown("---")
     st.subheader("📢 다음 달 매수 가이드")
-    
-    # 설정: 투자 예산 (ETF용) 및 목표 비중
-    monthly_budget = 500000
-    target_plan = [
-        {"name": "ACE 미국나스닥100", "ticker": "368590.KS", "weight": 0.30},
-        {"name": "TIGER 미국S&P500", "ticker": "360750.KS", "weight": 0.30},
-        {"name": "TIGER 인도니프티50", "ticker": "453870.KS", "weight": 0.20},
-        {"name": "TIGER 200", "ticker": "102110.KS", "weight": 0.20},
-    ]
 
-    guide_data = []
+    # 보유 수량/예수금을 반영해 목표 비중에 가장 가까워지는 정수 수량 계산 (engine.plan_dca_buys)
+    include_cash = st.checkbox(f"예수금({DCA_CASH:,.0f}원) 포함하여 리밸런싱", value=False)
+
     with st.spinner("매수 계획 계산 중..."):
-        # 1. ETF 매수 계획
-        for p in target_plan:
-            ticker = p['ticker']
-            df = engine.fetch_data(ticker, period="5d")
-            if df is not None and not df.empty:
-                close_val = df['Close']
-                if isinstance(close_val, pd.DataFrame): current_price = float(close_val.iloc[-1, 0])
-                else: current_price = float(close_val.iloc[-1])
-            else:
-                current_price = 0
-            
-            target_amount = monthly_budget * p['weight']
-            final_qty = int(target_amount / current_price) if current_price > 0 else 0
-            final_buy_amount = final_qty * current_price
-                
-            guide_data.append({
-                "종목명": p['name'],
-                "현재가": f"{current_price:,.0f}원",
-                "목표비중": f"{p['weight']*100:.0f}%",
-                "배정금액": f"{target_amount:,.0f}원",
-                "매수 수량": f"{final_qty}주",
-                "최종 매수액": f"{final_buy_amount:,.0f}원"
-            })
-        
-        # 2. 금 (고정 1주)
-        gold_price = engine.get_domestic_gold_price()
-        if gold_price is None: gold_price = 0
-        
-        guide_data.append({
-            "종목명": "금 99.99K (고정 매수)",
-            "현재가": f"{gold_price:,.0f}원",
-            "목표비중": "-",
-            "배정금액": "-",
-            "매수 수량": "1주",
-            "최종 매수액": f"{gold_price:,.0f}원"
-        })
+        prices = {d['ticker']: d['last_close'] for d in dca_items}
+        for p in DCA_TARGET_PLAN:
+            if p['ticker'] in prices:
+                continue
+            df = engine.load_history(p['ticker'], period="5d")
+            prices[p['ticker']] = float(df['Close'].iloc[-1]) if df is not None and not df.empty else 0.0
+
+        gold_price = session_memo(engine.get_domestic_gold_price) or 0
+        gold_cost = gold_price * DCA_GOLD_UNITS
+        budget = DCA_MONTHLY_BUDGET + (DCA_CASH - gold_cost if include_cash else 0)
+        plan_df, plan_summary = engine.plan_dca_buys(DCA_TARGET_PLAN, DCA_PORTFOLIO, prices, budget)
 
-    if guide_data:
+    if not plan_df.empty:
         st.markdown(f"""
         <div style="background-color: #f0f4f8; padding: 15px; border-radius: 10px; border-left: 5px solid #2196f3; margin-bottom: 20px;">
-        신규 계획: <b>ETF 예산 500,000원</b> (30/30/20/20) + <b>금 1주 고정 매수</b>
+        계획: <b>ETF 예산 {budget:,.0f}원</b> (목표 {"/".join(f"{w * 100:.0f}" for w in plan_df['weight'])}, 보유 비중 반영) + <b>금 {DCA_GOLD_UNITS}주 고정 매수</b>
         </div>
         """, unsafe_allow_html=True)
-        
-        st.table(pd.DataFrame(guide_data))
-        
-        total_planned = sum([float(d['최종 매수액'].replace('원','').replace(',','')) for d in guide_data])
-        st.info(f"💡 전체 실행 시 약 **{total_planned:,.0f}원**이 소요됩니다.")
+
+        guide = pd.DataFrame({
+            "종목명": plan_df['name'],
+            "현재가": plan_df['price'].map(lambda v: f"{v:,.0f}원"),
+            "목표비중": plan_df['weight'].map(lambda v: f"{v:.0%}"),
+            "현재 비중": plan_df['current_weight'].map(lambda v: f"{v:.1%}"),
+            "매수 수량": plan_df['qty'].map(lambda v: f"{v}주"),
+            "최종 매수액": plan_df['cost'].map(lambda v: f"{v:,.0f}원"),
+            "매수 후 비중": plan_df['final_weight'].map(lambda v: f"{v:.1%}")
+        })
+        gold_row = pd.DataFrame([{
+            "종목명": "금 99.99K (고정 매수)", "현재가": f"{gold_price:,.0f}원", "목표비중": "-", "현재 비중": "-",
+            "매수 수량": f"{DCA_GOLD_UNITS}주", "최종 매수액": f"{gold_cost:,.0f}원", "매수 후 비중": "-"
+        }])
+        st.table(pd.concat([guide, gold_row], ignore_index=True))
+
+        total_planned = plan_summary['spent'] + gold_cost
+        st.info(f"💡 전체 실행 시 약 **{total_planned:,.0f}원**이 소요됩니다. "
+                f"(잔여 예산 {plan_summary['leftover']:,.0f}원, 비중 괴리 {plan_summary['deviation_before']:.1%} → {plan_summary['deviation_after']:.1%})")
 
     # 기존 날짜 알림
     dca_status = check_dca_status()
     if dca_status == "BUY":
-        st.success("📢 **현재 적립식 매수 기간입니다!** (매월 15일 ~ 20일)", icon="💰")
+        st.success(f"📢 **현재 적립식 매수 기간입니다!** (매월 {DCA_BUY_WINDOW[0]}일 ~ {DCA_BUY_WINDOW[1]}일)", icon="💰")
     else:
-        st.warning("⏳ 현재는 정기 매수 기간이 아닙니다. (매월 15~20일 권장)", icon="⏰")
+        st.warning(f"⏳ 현재는 정기 매수 기간이 아닙니다. (매월 {DCA_BUY_WINDOW[0]}~{DCA_BUY_WINDOW[1]}일 권장)", icon="⏰")
+
+    # 4. 전략 백테스트 (매수일 x 비중 x 예산 x 금 수량 조합을 한 번에 시뮬레이션)
+    st.markdown("---")
+    st.subheader("🧪 적립식 전략 백테스트")
+    with st.expander("매수일 / 비중 / 예산 조합 비교"):
+        plan_tickers = [p['ticker'] for p in DCA_TARGET_PLAN]
+        weight_presets = {
+            "현재 계획": {p['ticker']: p['weight'] for p in DCA_TARGET_PLAN},
+            "동일 비중": {t: 1 / len(plan_tickers) for t in plan_tickers},
+            "미국 집중": dict(zip(plan_tickers, [0.4, 0.4, 0.1, 0.1])),
+            "분산 강화": dict(zip(plan_tickers, [0.2, 0.2, 0.3, 0.3]))
+        }
+        col_d, col_w = st.columns(2)
+        buy_days = col_d.multiselect("매수일 (매월)", list(range(1, 29)), default=[1, 10, DCA_BUY_WINDOW[0], 20, 25])
+        presets = col_w.multiselect("비중", list(weight_presets.keys()), default=list(weight_presets.keys()))
+        col_b, col_g = st.columns(2)
+        budgets = col_b.multiselect("월 ETF 예산", [300000, 500000, 700000, 1000000], default=[DCA_MONTHLY_BUDGET])
+        gold_units = col_g.multiselect("월 금 매수 (g)", [0, 1, 2, 3], default=[DCA_GOLD_UNITS])
+
+        if st.button("백테스트 실행") and buy_days and presets and budgets and gold_units:
+            with st.spinner("과거 가격으로 시뮬레이션 중..."):
+                prices = session_memo(engine.dca_price_panel, plan_tickers)
+                result = engine.dca_backtest(prices, buy_days, [weight_presets[p] for p in presets], budgets, gold_units)
+            if result.empty:
+                st.warning("백테스트 데이터 없음")
+            else:
+                preset_names = {"/".join(f"{w.get(t, 0) * 100:.0f}" for t in plan_tickers): name for name, w in weight_presets.items()}
+                result["weights"] = result["weights"].map(lambda w: preset_names.get(w, w))
+                by_day = result.groupby("buy_day")["irr"].mean()
+                fig = go.Figure(go.Bar(x=[f"{d}일" for d in by_day.index], y=by_day.values * 100, marker_color='#2196f3'))
+                fig.update_layout(height=250, margin=dict(l=0, r=0, t=30, b=0), title="매수일별 평균 IRR (%)")
+                st.plotly_chart(fig, use_container_width=True)
+
+                names = {p['ticker']: p['name'] for p in DCA_TARGET_PLAN}
+                table = result.sort_values("irr", ascending=False).rename(columns={
+                    "buy_day": "매수일", "weights": "비중", "budget": "월 예산", "gold_units": "금(g)",
+                    "invested": "투자원금", "final_value": "평가금액", "profit_pct": "수익률",
+                    "irr": "IRR(연)", "max_drawdown": "최대 낙폭", "cash": "잔여 현금",
+                    **{f"avg_cost_{t}": f"평단 {names.get(t, t)}" for t in plan_tickers}
+                })
+                won_cols = [c for c in table.columns if c in ("월 예산", "투자원금", "평가금액", "잔여 현금") or c.startswith("평단")]
+                st.dataframe(
+                    table.head(50).style.format({**{c: "{:,.0f}" for c in won_cols},
+                                                  "수익률": "{:+.2%}", "IRR(연)": "{:+.2%}", "최대 낙폭": "{:.2%}", "금(g)": "{:.0f}"}),
+                    use_container_width=True, hide_index=True
+                )
+                st.caption(f"{len(result):,}개 조합 · {prices.index[0]:%Y-%m-%d} ~ {prices.index[-1]:%Y-%m-%d} · 금은 GC=F 그램 환산 가격")
 
 def show_dividends_page():
     st.header("🏦 배당주 관리")
@@ -701,19 +971,20 @@ def show_dividends_page():
     
     # 1. 환율 및 기본 정보
     with st.spinner("배당주 및 환율 정보 분석 중..."):
-        ex_data = engine.fetch_data("USDKRW=X", period="5d")
-        exchange_rate = ex_data['Close'].iloc[-1] if ex_data is not None else 1450.0
+        # 가격/배당/환율 데이터는 로컬 캐시에서 읽음 (재방문 시 네트워크 호출 없음)
+        exchange_rate = engine.fx_rate("USD", "KRW")
         
         total_eval_krw = 0
         total_buy_krw = 0
         div_results = []
+        current_prices = {}
         
         for item in DIVIDEND_PORTFOLIO:
             ticker = item['ticker']
             curr_price_usd = 0.0
             change_1d = 0.0
             
-            df = engine.fetch_data(ticker, period="5d")
+            df = engine.load_history(ticker, period="5d")
             
             if df is not None and not df.empty:
                 curr_price_usd = float(df['Close'].iloc[-1])
@@ -725,6 +996,7 @@ def show_dividends_page():
                 
             buy_price_usd = item['buy_price_usd']
             qty = item['quantity']
+            current_prices[ticker] = curr_price_usd
             
             buy_val_usd = buy_price_usd * qty
             eval_val_usd = curr_price_usd * qty
@@ -764,11 +1036,17 @@ def show_dividends_page():
         total_pl_krw = total_eval_krw - total_buy_krw
         total_pl_pct = (total_pl_krw / total_buy_krw) * 100 if total_buy_krw > 0 else 0
 
+        # 전체 포트폴리오 배당 분석 (TTM 수익률, 향후 12개월 일정, 월별 수령액)
+        div_analytics = engine.dividend_analytics(DIVIDEND_PORTFOLIO, current_prices)
+        div_summary = div_analytics["summary"]
+        annual_income_usd = div_summary["annual_income"].sum() if not div_summary.empty else 0.0
+
         # 요약 메트릭
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         col1.metric("총 평가금액", f"{total_eval_krw:,.0f}원")
         col2.metric("총 매입금액", f"{total_buy_krw:,.0f}원")
         col3.metric("평가손익", f"{total_pl_krw:,.0f}원", f"{total_pl_pct:+.2f}%")
+        col4.metric("연간 배당금 (TTM)", f"${annual_income_usd:,.2f}", f"{annual_income_usd * exchange_rate:,.0f}원", delta_color="off")
 
     st.markdown("---")
     
@@ -825,13 +1103,41 @@ def show_dividends_page():
                     for d in divs:
                         st.write(f"- **{d['Date']}**: ${d['Amount']:.4f}")
                     
-                    # 예상 배당금 (최근 배당 기준)
-                    last_amount = divs[0]['Amount']
-                    total_payout = last_amount * item['quantity']
-                    st.info(f"💰 예상 수령: **${total_payout:,.2f}**")
+                    # 예상 배당금 (다음 예상 지급일 기준, 일정 추정 불가 시 최근 배당 기준)
+                    upcoming = div_analytics["calendar"]
+                    upcoming = upcoming[upcoming["ticker"] == ticker] if not upcoming.empty else upcoming
+                    if not upcoming.empty:
+                        next_pay = upcoming.iloc[0]
+                        st.info(f"💰 예상 수령: **${next_pay['income']:,.2f}** ({next_pay['date']:%Y-%m} 예정)")
+                    else:
+                        total_payout = divs[0]['Amount'] * item['quantity']
+                        st.info(f"💰 예상 수령: **${total_payout:,.2f}**")
                 else:
                     st.write("지급 내역이 없습니다.")
 
+    # 4. 배당 분석 (수익률 / 캘린더 / 월별 수령액)
+    if not div_summary.empty:
+        st.markdown("---")
+        st.subheader("📆 배당 캘린더 & 월별 예상 수령액 (향후 12개월)")
+
+        st.dataframe(
+            div_summary.reset_index().style.format({
+                "last_amount": "${:,.4f}", "ttm_dividend": "${:,.4f}", "price": "${:,.2f}",
+                "ttm_yield": "{:.2%}", "annual_income": "${:,.2f}", "payments_per_year": "{:.0f}"
+            }),
+            use_container_width=True,
+            column_order=["ticker", "last_date", "last_amount", "payments_per_year", "ttm_dividend", "ttm_yield", "annual_income"]
+        )
+
+        monthly = div_analytics["monthly"]
+        if not monthly.empty:
+            fig = go.Figure()
+            for ticker in [c for c in monthly.columns if c != "Total"]:
+                fig.add_trace(go.Bar(x=monthly.index.astype(str), y=monthly[ticker], name=ticker))
+            fig.update_layout(barmode="stack", height=350, margin=dict(l=0, r=0, t=10, b=0), yaxis_title="USD")
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption(f"💡 향후 12개월 예상 배당 합계: ${monthly['Total'].sum():,.2f} (최근 지급액이 같은 주기로 반복된다고 가정)")
+
 def show_index_value_page():
     st.header("📈 지수가치 (Index Valuation)")
     
@@ -841,33 +1147,26 @@ def show_index_value_page():
     
     with st.spinner("지수 데이터 분석 중..."):
         index_data = []
+        # 52주 고저/MDD/회복율은 engine의 롤링 통계 테이블(증분 갱신)에서 조회 - Market Board와 동일한 기준
+        stats = session_memo(engine.rolling_stats_latest, list(engine.TARGET_INDICES.values()))
         for name, ticker in engine.TARGET_INDICES.items():
-            df = engine.fetch_data(ticker, period="2y")
-            if df is not None and not df.empty:
-                current_price = float(df['Close'].iloc[-1])
-                prev_close = float(df['Close'].iloc[-2]) if len(df) > 1 else current_price
-                change_pct = ((current_price - prev_close) / prev_close) * 100
-                
-                # MDD 및 회복율 계산 (Market Board와 동일한 track_mdd 사용)
-                mdd, mdd_info = engine.track_mdd(df)
-                
-                # 52주 고저 (최근 1년 데이터 기반)
-                df_1y = df.tail(252)
-                high_52w = float(df_1y['Close'].max())
-                low_52w = float(df_1y['Close'].min())
-                pos_pct = ((current_price - low_52w) / (high_52w - low_52w)) * 100 if high_52w != low_52w else 0
-                
-                index_data.append({
-                    "지수명": name,
-                    "티커": ticker,
-                    "현재가": current_price,
-                    "전일대비": change_pct,
-                    "MDD": mdd * 100 if mdd is not None else 0,
-                    "회복율": mdd_info.get('recovery_rate', 0) * 100,
-                    "현재 위치(%)": pos_pct,
-                    "52주 최저": low_52w,
-                    "52주 최고": high_52w
-                })
+            if ticker not in stats.index:
+                continue
+            row = stats.loc[ticker]
+            mdd, mdd_info = engine.mdd_from_rolling_stats(row)
+
+            index_data.append({
+                "지수명": name,
+                "티커": ticker,
+                "현재가": float(row['close']),
+                "전일대비": float(row['change_pct']),
+                "MDD": mdd * 100 if mdd is not None else 0,
+                "회복율": mdd_info.get('recovery_rate', 0) * 100,
+                "현재 위치(%)": float(row['pos_pct']),
+                "52주 최저": float(row['low_52w']),
+                "52주 최고": float(row['high_52w']),
+                "고점 경과일": int(row['days_since_peak'])
+            })
 
     if index_data:
         df_index = pd.DataFrame(index_data)
@@ -919,15 +1218,55 @@ def show_index_value_page():
                 "52주 최고": "{:,.2f}"
             }).map(color_recovery_val, subset=["회복율"]),
             use_container_width=True,
-            column_order=["지수명", "현재가", "전일대비", "MDD", "회복율", "현재 위치(%)", "52주 최저", "52주 최고"]
+            column_order=["지수명", "현재가", "전일대비", "MDD", "회복율", "현재 위치(%)", "52주 최저", "52주 최고", "고점 경과일"]
         )
 
+def show_equity_curve_page():
+    st.header("📊 자산 추이 (Equity Curve)")
+    st.markdown("""<div style="background-color: white; padding: 20px; border-radius: 12px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); border: 1px solid #eee; margin-bottom: 20px; color: #333;">
+터틀 · 적립식 · 배당주 계좌 전체의 <b>일별 평가금액(원화)</b>과 고점 대비 <b>낙폭(MDD)</b>을 추적합니다.
+</div>""", unsafe_allow_html=True)
+
+    accounts = {
+        "터틀": DOMESTIC_PORTFOLIO + OVERSEAS_PORTFOLIO,
+        "적립식": DCA_PORTFOLIO,
+        "배당주": DIVIDEND_PORTFOLIO,
+    }
+
+    with st.spinner("자산 추이 계산 중..."):
+        curve, info = session_memo(engine.portfolio_equity_curve, accounts, base_ccy="KRW", cash={"적립식": DCA_CASH})
+
+    if curve.empty:
+        st.info("자산 추이 데이터가 없습니다.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("총 평가금액", f"{info['current_value']:,.0f}원")
+    col2.metric("현재 낙폭", f"{info['current_drawdown']:.2%}")
+    col3.metric("최대 낙폭 (MDD)", f"{info['max_drawdown']:.2%}")
+    col4.metric("회복률", f"{info['recovery_rate']:.1%}", f"고점 {info['peak_date']:%Y-%m-%d}", delta_color="off")
+
+    fig = go.Figure()
+    for account in accounts:
+        if account in curve.columns:
+            fig.add_trace(go.Scatter(x=curve.index, y=curve[account], stackgroup="accounts", name=account))
+    fig.add_trace(go.Scatter(x=curve.index, y=curve["Peak"], line=dict(color="gray", dash="dot", width=1), name="고점"))
+    fig.update_layout(height=400, margin=dict(l=0, r=0, t=10, b=0), yaxis_title="KRW")
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig_dd = go.Figure(go.Scatter(x=curve.index, y=curve["Drawdown"] * 100, fill="tozeroy", line=dict(color="#ff4b4b", width=1), name="Drawdown"))
+    fig_dd.update_layout(height=200, margin=dict(l=0, r=0, t=10, b=0), yaxis_title="낙폭 (%)")
+    st.plotly_chart(fig_dd, use_container_width=True)
+    st.caption("💡 매수일(buy_date)이 없는 종목은 조회 기간 전체를 보유한 것으로 계산됩니다.")
+
 # --- Main App Logic ---
 
 def main():
+    # 펀더멘털 저장소는 백그라운드에서 하루 단위로 갱신 (스캔 경로에서 일괄 조회하지 않음)
+    engine.start_fundamentals_refresher()
     st.sidebar.title("🚀 Strock Board Navigation")
     
-    pages = ["Market Board", "터틀 보유 종목", "터틀 불타기", "터틀 종목 검색", "적립식", "배당주", "지수가치"]
+    pages = ["Market Board", "터틀 보유 종목", "터틀 불타기", "터틀 종목 검색", "적립식", "배당주", "지수가치", "자산 추이"]
     
     # URL에서 현재 페이지 읽기 (새로고침 대응)
     query_params = st.query_params
@@ -965,6 +1304,8 @@ def main():
         show_dividends_page()
     elif menu == "지수가치":
         show_index_value_page()
+    elif menu == "자산 추이":
+        show_equity_curve_page()
 
 def show_pyramiding_page():
     st.header("🔥 터틀 불타기 (Pyramiding)")
@@ -975,74 +1316,72 @@ def show_pyramiding_page():
     </div>
     """, unsafe_allow_html=True)
 
+    # 로드맵 시나리오 설정 (슬라이더 변경 시 전체 종목 로드맵을 한 번에 재계산)
+    st.sidebar.subheader("🧮 불타기 시나리오")
+    units = st.sidebar.slider("매수 횟수 (유닛 수)", 2, 8, 5)
+    spacing_n = st.sidebar.slider("불타기 간격 (N)", 0.5, 4.0, 2.0, step=0.5)
+    stop_n = st.sidebar.slider("손절 기준 (N)", 0.5, 4.0, 2.0, step=0.5)
+    sizing_label = st.sidebar.selectbox("추가 매수 수량", ["1차의 절반", "1차와 동일"])
+    risk_cap = st.sidebar.number_input("종목당 최대 손실 한도 (원, 0 = 제한 없음)", min_value=0, value=0, step=100000)
+
     all_portfolio = DOMESTIC_PORTFOLIO + OVERSEAS_PORTFOLIO
     eligible_stocks = []
 
     with st.spinner("불타기 가능 종목 분석 중..."):
+        # 보유 종목 페이지와 같은 세션 메모 사용 (국내/해외 각각 조회한 결과 재사용)
+        quotes = {**holding_quotes([item['ticker'] for item in DOMESTIC_PORTFOLIO]),
+                  **holding_quotes([item['ticker'] for item in OVERSEAS_PORTFOLIO])}
         for item in all_portfolio:
             ticker = item['ticker']
-            df = engine.fetch_data(ticker)
-            if df is None or df.empty: continue
+            quote = quotes.get(ticker)
+            if quote is None: continue
             
-            last_close = df['Close'].iloc[-1]
-            n_val = engine.calculate_atr(df)
+            last_close = quote['last_close']
+            n_val = quote['n_val']
             if n_val is None: continue # ATR 계산 불가시 제외
             
             buy_price = item['buy_price']
             
             target_2n = buy_price + (2 * n_val)
             if last_close >= target_2n:
-                item['n_val'] = n_val
-                item['last_close'] = last_close
-                eligible_stocks.append(item)
+                eligible_stocks.append(dict(item, n_val=n_val, last_close=last_close))
 
     if not eligible_stocks:
         st.info("현재 불타기 조건(+2N 돌파)을 충족하는 종목이 없습니다.")
         return
 
+    roadmap, stage_risk = engine.pyramiding_roadmaps(
+        eligible_stocks, units=units, spacing_n=spacing_n, stop_n=stop_n,
+        sizing="half" if sizing_label == "1차의 절반" else "equal",
+        risk_cap=risk_cap or None
+    )
+
+    # 포트폴리오 전체 단계별 리스크
+    st.subheader("📊 단계별 포트폴리오 리스크 (손절 시 총 손실, 원화)")
+    st.dataframe(
+        stage_risk.rename(columns={"stage": "단계", "total_risk": "손절 시 총 손실", "positions_at_stage": "해당 단계 종목 수"})
+        .style.format({"손절 시 총 손실": "{:,.0f}원"}),
+        use_container_width=True, hide_index=True
+    )
+
     for item in eligible_stocks:
         with st.expander(f"✨ {item.get('name', item['ticker'])} (+2N 돌파 완료)", expanded=True):
-            render_pyramiding_roadmap(item)
+            render_pyramiding_roadmap(item, roadmap[roadmap["ticker"] == item['ticker']])
 
-def render_pyramiding_roadmap(item):
-    ticker = item['ticker']
-    buy_price = item['buy_price']
+def render_pyramiding_roadmap(item, item_roadmap):
     n_val = item['n_val']
-    qty_unit = item['quantity'] # 기본 단위 (1차 매수 수량 기준)
-    
-    roadmap = []
-    total_qty = 0
-    total_cost = 0
-    
-    for i in range(1, 6): # 1차 ~ 5차
-        # 불타기 간격은 2N (사용자 요청 기준)
-        entry_price = buy_price + (i-1) * (2 * n_val)
-        
-        # 추가 수량 (사용자 스크린샷 참고: 1차=6, 2차~5차=3 등으로 절반씩 하는 경향이 있으나 여기선 동일 수량 가상 시뮬레이션)
-        # 만약 실제 추가 매수가 이루어진다면 이 로직을 고도화할 수 있습니다.
-        add_qty = qty_unit if i == 1 else round(qty_unit / 2) if qty_unit > 1 else 1
-        
-        total_qty += add_qty
-        total_cost += entry_price * add_qty
-        avg_price = total_cost / total_qty
-        
-        # 손절가는 해당 회차 매수가 - 2N
-        stop_loss = entry_price - (2 * n_val)
-        # 손절 시 손실 = (평균단가 - 손절가) * 총 수량
-        loss_at_stop = (avg_price - stop_loss) * total_qty
-        
-        roadmap.append({
-            "매수 횟수": f"{i}차",
-            "매수 가격": entry_price,
-            "매수 수량": add_qty,
-            "총 매수 금액": total_cost,
-            "총 매수 수량": total_qty,
-            "평균 단가": avg_price,
-            "손절 가격": stop_loss,
-            "손절 시 손실": -abs(loss_at_stop) # 손실이므로 음수로 표시
-        })
-    
-    df_roadmap = pd.DataFrame(roadmap)
+
+    df_roadmap = pd.DataFrame({
+        "매수 횟수": item_roadmap["stage"].map(lambda i: f"{i}차"),
+        "매수 가격": item_roadmap["entry_price"],
+        "매수 수량": item_roadmap["add_qty"],
+        "총 매수 금액": item_roadmap["total_cost"],
+        "총 매수 수량": item_roadmap["total_qty"],
+        "평균 단가": item_roadmap["avg_price"],
+        "손절 가격": item_roadmap["stop_price"],
+        "손절 시 손익": item_roadmap["loss_at_stop"],
+        "한도 내": item_roadmap["within_cap"].map(lambda ok: "✅" if ok else "⛔")
+    }).reset_index(drop=True)
     
     # 현재 단계 표시 (어디까지 왔나)
     current_price = item['last_close']
@@ -1054,7 +1393,7 @@ def render_pyramiding_roadmap(item):
     st.dataframe(
         df_roadmap.style.format({
             "매수 가격": "{:,.2f}", "총 매수 금액": "{:,.2f}", 
-            "평균 단가": "{:,.2f}", "손절 가격": "{:,.2f}", "손절 시 손실": "{:,.2f}"
+            "평균 단가": "{:,.2f}", "손절 가격": "{:,.2f}", "손절 시 손익": "{:+,.2f}"
         }).apply(highlight_row, axis=1),
         use_container_width=True
     )
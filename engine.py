@@ -1,34 +1,65 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 import requests
 import re
+import ast
+import json
+import inspect
+import hashlib
+import os
+import time
+import tempfile
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+from functools import lru_cache
+from collections import deque
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+try:
+    import httpx # optional: async HTTP client for Naver; without it the sync request runs in a thread
+except ImportError:
+    httpx = None
+
+NAVER_GOLD_URL = "https://m.stock.naver.com/marketindex/metals/M04020000"
+NAVER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_2_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.0.3 Mobile/15E148 Safari/604.1'
+}
 
 def get_domestic_gold_price():
     """
     Fetches the domestic gold price (KRX Gold Spot) from Naver Finance.
     URL: https://m.stock.naver.com/marketindex/metals/M04020000
     """
-    url = "https://m.stock.naver.com/marketindex/metals/M04020000"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 13_2_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.0.3 Mobile/15E148 Safari/604.1'
-    }
     try:
-        r = requests.get(url, headers=headers, timeout=10)
-        # Search for "closePrice":"235,440" or similar
-        match = re.search(r'\"closePrice\":\"([\d,]+)\"', r.text)
-        if match:
-            price_str = match.group(1).replace(',', '')
-            return float(price_str)
-        
-        # Fallback: search for "nv":235440
-        match = re.search(r'\"nv\":(\d+)', r.text)
-        if match:
-            return float(match.group(1))
-            
+        _require_network("domestic gold price")
+        r = requests.get(NAVER_GOLD_URL, headers=NAVER_HEADERS, timeout=10)
+        return _record_gold_price(_parse_gold_price(r.text))
     except Exception as e:
         print(f"Error fetching domestic gold price: {e}")
     
+    return _read_pickle(_cache_path("gold", "last.pkl")) if OFFLINE else None
+
+def _record_gold_price(price):
+    # Last fetched price, replayed in offline mode
+    if price is not None:
+        _write_pickle(_cache_path("gold", "last.pkl"), price)
+    return price
+
+def _parse_gold_price(text):
+    # Search for "closePrice":"235,440" or similar
+    match = re.search(r'\"closePrice\":\"([\d,]+)\"', text)
+    if match:
+        price_str = match.group(1).replace(',', '')
+        return float(price_str)
+    
+    # Fallback: search for "nv":235440
+    match = re.search(r'\"nv\":(\d+)', text)
+    if match:
+        return float(match.group(1))
     return None
 
 # Target Indices
@@ -45,25 +76,156 @@ TARGET_INDICES = {
     "UK_FTSE": "^FTSE"
 }
 
-# Stock Universes (Subset for Performance)
-US_UNIVERSE = [
-    "AAPL", "MSFT", "AMZN", "NVDA", "GOOGL", "GOOG", "META", "TSLA", "BRK-B", "UNH",
-    "JNJ", "XOM", "V", "PG", "MA", "AVGO", "HD", "CVX", "LLY", "ABBV",
-    "COST", "PEP", "ADBE", "CSCO", "AMD", "QCOM", "TXN", "INTC", "AMGN", "HON",
-    "INTU", "SBUX", "MDLZ", "ISRG", "GILD", "BKNG", "AMAT", "ADP", "VRTX", "MU"
-]
+# Currencies used by holdings and TARGET_INDICES (rates are quoted per 1 FX_BASE)
+FX_BASE = "USD"
+FX_CURRENCIES = ["USD", "KRW", "JPY", "CNY", "HKD", "GBP"]
+# Used only when no rate has ever been cached (e.g. first start while offline)
+FX_FALLBACK_RATES = {"USD": 1.0, "KRW": 1450.0}
+FX_HISTORY_PERIOD = "5y"
+GRAMS_PER_TROY_OUNCE = 31.1035
 
-KR_UNIVERSE = [
-    "005930.KS", "000660.KS", "373220.KS", "207940.KS", "005380.KS", "005935.KS", "000270.KS", "068270.KS", "005490.KS", "105560.KS",
-    "051910.KS", "035420.KS", "000810.KS", "055550.KS", "012330.KS", "028260.KS", "032830.KS", "006400.KS", "035720.KS", "086790.KS",
-    "003550.KS", "066570.KS", "011200.KS", "009150.KS", "015760.KS", "003670.KS", "034730.KS", "017670.KS", "128940.KS", "010130.KS",
-    "011070.KS", "011170.KS", "000720.KS", "005070.KS", "004020.KS", "000100.KS", "011780.KS", "030240.KS", "001040.KS", "003470.KS"
-]
+# Quote currency by Yahoo ticker suffix / explicit ticker (default: USD)
+CURRENCY_SUFFIXES = {
+    ".KS": "KRW", ".KQ": "KRW", ".T": "JPY", ".SS": "CNY", ".SZ": "CNY", ".HK": "HKD", ".L": "GBP"
+}
+TICKER_CURRENCIES = {
+    "^KS11": "KRW", "^KQ11": "KRW", "^N225": "JPY", "^HSI": "HKD", "^FTSE": "GBP"
+}
+
+# Stock Universes
+# One CSV per index (ticker,name,name_en,exchange,sector), ordered by rank (largest first).
+# Drop in full constituent lists to widen the scan; nothing else needs to change.
+UNIVERSE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "universes")
+UNIVERSE_FILES = {
+    "KOSPI": "kospi.csv",
+    "KOSDAQ": "kosdaq.csv",
+    "SP500": "sp500.csv",
+    "NASDAQ100": "nasdaq100.csv"
+}
+MARKET_UNIVERSES = {
+    "US": ["SP500", "NASDAQ100"],
+    "KR": ["KOSPI", "KOSDAQ"]
+}
+UNIVERSE_COLUMNS = ["ticker", "name", "name_en", "exchange", "sector"]
+
+# Symbol index
+# Full exchange listings (same columns as the universe files, sector may be blank)
+# are optional; when present they widen the symbol search to every listing.
+# popular_listings.csv (shipped) covers common ETFs and stocks outside the universes.
+SYMBOL_LISTING_FILES = {
+    "KRX": "krx_listings.csv",
+    "US": "us_listings.csv",
+    "POPULAR": "popular_listings.csv"
+}
+# Holdings (portfolio.py) are always indexed, so the app's own tickers resolve
+PORTFOLIO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "portfolio.py")
+SYMBOL_SUFFIX_EXCHANGES = {".KS": "KOSPI", ".KQ": "KOSDAQ"}
+SYMBOL_FUZZY_MIN_SCORE = 0.4 # trigram Dice similarity of a search key for fuzzy matches
+
+# Screening defaults
+DEFAULT_MIN_MARKET_CAP = {
+    "US": 100_000_000_000, # 100,000M USD
+    "KR": 0
+}
+SCAN_WORKERS = None # Worker processes for screen_stocks (None = os.cpu_count()); read at call time
+SCAN_SHARD_SIZE = 20 # Tickers per shard handed to a worker
+# Bump whenever the screening criteria change so cached scans are not reused
+SCAN_CRITERIA_VERSION = 2
+
+# Fundamentals store (refreshed in bulk, read by the screener without network calls)
+# field -> key in yf.Ticker(...).info; dividend_yield is in percent as Yahoo reports it
+FUNDAMENTAL_FIELDS = {
+    "name": "shortName",
+    "sector": "sector",
+    "market_cap": "marketCap",
+    "per": "trailingPE",
+    "pbr": "priceToBook",
+    "dividend_yield": "dividendYield"
+}
+FUNDAMENTAL_NUMERIC = ["market_cap", "per", "pbr", "dividend_yield"]
+FUNDAMENTALS_MAX_AGE = 24 * 60 * 60 # seconds; refreshed once a day
+FUNDAMENTALS_WORKERS = 16 # concurrent .info requests during a bulk refresh
+FUNDAMENTALS_CHECK_INTERVAL = 60 * 60 # seconds between checks of the background refresher
+FUNDAMENTALS_RETRY_DELAY = 6 * 60 * 60 # seconds before a failed ticker is fetched again
+
+# Screening rules: every rule of a strategy must hold on the last bar.
+# Written in the rule language of parse_rule(); fields are open/high/low/close/volume/value
+# (value = close * volume). Add a strategy here and pass its name as `strategy`.
+SCREEN_RULES = {
+    "US": {
+        "breakout_20d": "high >= max(high, 20)",
+        "sma5_rising": "rising(sma(close, 5), 2)",
+        "sma200_rising": "rising(sma(close, 200), 1)"
+    },
+    "KR": {
+        "breakout_20d": "high >= max(high, 20)",
+        "volume_strong": "volume > sma(volume, 20)"
+    }
+}
+SCREEN_MIN_BARS = 200 # histories shorter than this are not screened
+
+# Local cache (scan results, price store, ...)
+CACHE_DIR = os.environ.get("STOCK_APP_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+# Offline (replay) mode: no network requests; everything is served from CACHE_DIR
+# as it was last recorded (stale stores included). Used for profiling and demos.
+OFFLINE = os.environ.get("STOCK_APP_OFFLINE") == "1"
+
+# Cached price histories are re-fetched after this many seconds while their market is trading;
+# otherwise only when a session has completed since the last fetch
+PRICE_CACHE_TTL = 15 * 60
+# A session's daily bar is considered final this many seconds after the close
+SESSION_SETTLE_DELAY = 30 * 60
+# Dividend series are re-fetched when a payment is due or the cache is older than this
+DIVIDEND_MAX_AGE_DAYS = 30
+
+# Regular trading session per market: (timezone, open, close)
+MARKET_SESSIONS = {
+    "US": ("America/New_York", datetime.time(9, 30), datetime.time(16, 0)),
+    "KR": ("Asia/Seoul", datetime.time(9, 0), datetime.time(15, 30))
+}
+
+# Trading calendars
+# One CSV of full-day closures (date,name) per exchange; extend the files each year.
+CALENDAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendars")
+CALENDARS = {
+    # code: (holiday file, weekmask, sessions per year)
+    "XKRX": ("xkrx.csv", "Mon Tue Wed Thu Fri", 246),
+    "XNYS": ("xnys.csv", "Mon Tue Wed Thu Fri", 252),
+    "XJPX": ("xjpx.csv", "Mon Tue Wed Thu Fri", 244),
+    "XSHG": ("xshg.csv", "Mon Tue Wed Thu Fri", 242),
+    "XHKG": ("xhkg.csv", "Mon Tue Wed Thu Fri", 247),
+    "XLON": ("xlon.csv", "Mon Tue Wed Thu Fri", 253),
+    "CRYPTO": (None, "Mon Tue Wed Thu Fri Sat Sun", 365)
+}
+CALENDAR_SUFFIXES = {
+    ".KS": "XKRX", ".KQ": "XKRX", ".T": "XJPX", ".SS": "XSHG", ".SZ": "XSHG", ".HK": "XHKG", ".L": "XLON", "-USD": "CRYPTO"
+}
+TICKER_CALENDARS = {
+    "^GSPC": "XNYS", "^IXIC": "XNYS",
+    "^KS11": "XKRX", "^KQ11": "XKRX", "^N225": "XJPX", "^HSI": "XHKG", "^FTSE": "XLON"
+}
+MARKET_CALENDARS = {"US": "XNYS", "KR": "XKRX"}
+# Regular session per exchange calendar: (timezone, open, close); lunch breaks are ignored
+EXCHANGE_SESSIONS = {
+    "XNYS": ("America/New_York", datetime.time(9, 30), datetime.time(16, 0)),
+    "XKRX": ("Asia/Seoul", datetime.time(9, 0), datetime.time(15, 30)),
+    "XJPX": ("Asia/Tokyo", datetime.time(9, 0), datetime.time(15, 30)),
+    "XSHG": ("Asia/Shanghai", datetime.time(9, 30), datetime.time(15, 0)),
+    "XHKG": ("Asia/Hong_Kong", datetime.time(9, 30), datetime.time(16, 0)),
+    "XLON": ("Europe/London", datetime.time(8, 0), datetime.time(16, 30))
+}
+# Bar-count windows in this module (20/60-day MAs, 252-day year) are in these sessions
+BASE_YEAR_SESSIONS = 252
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"] # date.weekday() order
 
 def fetch_data(ticker, period="2y"):
     """
     Fetches OHLCV data from yfinance usando Ticker().history for better reliability.
+    In offline mode the stored history is returned instead.
     """
+    if OFFLINE:
+        return load_history(ticker, period)
     try:
         tk = yf.Ticker(ticker)
         df = tk.history(period=period)
@@ -74,8 +236,518 @@ def fetch_data(ticker, period="2y"):
         print(f"Error fetching data for {ticker}: {e}")
         return None
 
+# Price store: raw (as-traded) OHLCV plus a corporate-actions table per ticker.
+# Adjusted series are derived on read, so a split or dividend never invalidates the store.
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+ACTION_COLUMNS = ["Dividends", "Stock Splits"]
+STORE_OVERLAP_DAYS = 7 # incremental fetches re-read this many days to check the stored tail
+STORE_TOLERANCE = 1e-6 # relative close mismatch on the overlap that forces a full re-download
+
+def _period_offset(period):
+    """pd.DateOffset for a yfinance period string ("5d" is handled as bars), None for "max"."""
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if match is None:
+        return None
+    n, unit = int(match.group(1)), match.group(2)
+    return {"d": pd.DateOffset(days=n), "wk": pd.DateOffset(weeks=n),
+            "mo": pd.DateOffset(months=n), "y": pd.DateOffset(years=n)}[unit]
+
+def _split_factors(index, actions):
+    """Product of split ratios with an ex-date after each date (1.0 when none)."""
+    splits = actions["Stock Splits"]
+    splits = splits[splits > 0].sort_index()
+    if splits.empty:
+        return np.ones(len(index))
+    # cumulative product from the latest split backwards; dates before a split carry it
+    after = np.append(np.cumprod(splits.to_numpy()[::-1])[::-1], 1.0)
+    return after[splits.index.searchsorted(index, side="right")]
+
+def _fetch_raw_history(ticker, period=None, start=None):
+    """
+    OHLCV + actions from yfinance with auto_adjust=False, converted to as-traded prices.
+    Yahoo's unadjusted Close is still split-adjusted to today; the splits inside the
+    fetched range are undone here. Returns (raw, actions) or None.
+    """
+    try:
+        _require_network(f"history for {ticker}")
+        tk = yf.Ticker(ticker)
+        if start is not None:
+            df = tk.history(start=start, auto_adjust=False, actions=True)
+        else:
+            df = tk.history(period=period, auto_adjust=False, actions=True)
+    except Exception as e:
+        print(f"Error fetching data for {ticker}: {e}")
+        return None
+    if df is None or df.empty:
+        return None
+
+    for col in ACTION_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0.0
+    actions = df.loc[(df["Dividends"] != 0) | (df["Stock Splits"] != 0), ACTION_COLUMNS].astype(np.float64)
+    factor = _split_factors(df.index, actions)
+    raw = df[PRICE_COLUMNS].astype(np.float64)
+    raw[["Open", "High", "Low", "Close"]] = raw[["Open", "High", "Low", "Close"]].mul(factor, axis=0)
+    raw["Volume"] = raw["Volume"] / factor
+    # dividends are quoted in today's share terms as well
+    actions["Dividends"] = actions["Dividends"] * _split_factors(actions.index, actions)
+    return raw, actions
+
+def adjusted_history(raw, actions):
+    """
+    Split- and dividend-adjusted OHLCV (what yfinance's auto_adjust returns), computed
+    from as-traded prices: prices before each split are divided by its ratio, and
+    before each ex-date multiplied by (1 - dividend / previous close).
+    Dividends / Stock Splits columns are included in adjusted terms.
+    """
+    split = _split_factors(raw.index, actions)
+    close = raw["Close"].to_numpy()
+
+    dividends = actions["Dividends"]
+    dividends = dividends[dividends > 0].sort_index()
+    div_factor = np.ones(len(raw))
+    if not dividends.empty:
+        pos = raw.index.searchsorted(dividends.index)
+        valid = (pos > 0) & (pos < len(raw))
+        mult = 1.0 - dividends.to_numpy()[valid] / close[pos[valid] - 1]
+        after = np.append(np.cumprod(mult[::-1])[::-1], 1.0)
+        div_factor = after[np.searchsorted(pos[valid], np.arange(len(raw)), side="right")]
+
+    factor = div_factor / split
+    adjusted = raw[["Open", "High", "Low", "Close"]].mul(factor, axis=0)
+    adjusted["Volume"] = raw["Volume"].to_numpy() * split
+    adjusted["Dividends"] = (actions["Dividends"] / _split_factors(actions.index, actions)).reindex(raw.index, fill_value=0.0)
+    adjusted["Stock Splits"] = actions["Stock Splits"].reindex(raw.index, fill_value=0.0)
+    return adjusted
+
+def _store_covers(stored, period):
+    offset = _period_offset(period)
+    if offset is None: # "max"
+        return stored["period"] == "max"
+    if stored["period"] == "max":
+        return True
+    return stored["covered_from"] <= pd.Timestamp.now(tz="UTC") - offset
+
+def _store_is_current(ticker, fetched_at, max_age):
+    """
+    True when nothing new can be fetched: younger than `max_age` seconds, or
+    fetched after the settled close of the last session of the ticker's exchange
+    while that exchange is shut. Tickers without a known exchange session
+    (crypto, futures, FX, other suffixes) only use `max_age`.
+    """
+    if time.time() - fetched_at < max_age:
+        return True
+    calendar = ticker_exchange(ticker)
+    if calendar not in EXCHANGE_SESSIONS:
+        return False
+    tz_name, open_time, close_time = EXCHANGE_SESSIONS[calendar]
+    now = datetime.datetime.now(ZoneInfo(tz_name))
+    if is_session(calendar, now.date()) and open_time <= now.time() < close_time:
+        return False
+    day = now.date() if now.time() >= close_time else now.date() - datetime.timedelta(days=1)
+    last_close = datetime.datetime.combine(previous_session(calendar, day), close_time, tzinfo=ZoneInfo(tz_name))
+    return fetched_at >= last_close.timestamp() + SESSION_SETTLE_DELAY
+
+def _longer_period(a, b):
+    offset_a, offset_b = _period_offset(a), _period_offset(b)
+    if offset_a is None or offset_b is None:
+        return "max"
+    now = pd.Timestamp.now()
+    return a if now - offset_a <= now - offset_b else b
+
+def _refresh_store(ticker, stored, period):
+    """Incremental append when the stored history is consistent with Yahoo, else a full fetch."""
+    if stored is not None and _store_covers(stored, period):
+        raw = stored["raw"]
+        start = (raw.index[-1] - pd.Timedelta(days=STORE_OVERLAP_DAYS)).strftime("%Y-%m-%d")
+        fetched = _fetch_raw_history(ticker, start=start)
+        if fetched is None:
+            return None
+        new_raw, new_actions = fetched
+        overlap = raw.index[:-1].intersection(new_raw.index) # the last stored bar may have been intraday
+        if len(overlap) and np.allclose(raw.loc[overlap, "Close"], new_raw.loc[overlap, "Close"], rtol=STORE_TOLERANCE):
+            merged = pd.concat([raw[raw.index < new_raw.index[0]], new_raw])
+            actions = pd.concat([stored["actions"][stored["actions"].index < new_raw.index[0]], new_actions])
+            return dict(stored, raw=merged, actions=actions, fetched_at=time.time())
+
+    # never shrink the stored span
+    fetch_period = _longer_period(period, stored["period"]) if stored is not None else period
+    fetched = _fetch_raw_history(ticker, period=fetch_period)
+    if fetched is None:
+        return None
+    raw, actions = fetched
+    offset = _period_offset(fetch_period)
+    covered_from = pd.Timestamp.now(tz="UTC") - offset if offset is not None else pd.Timestamp.min.tz_localize("UTC")
+    return {"raw": raw, "actions": actions, "period": fetch_period,
+            "covered_from": covered_from, "fetched_at": time.time()}
+
+def load_price_store(ticker, period="2y", max_age=PRICE_CACHE_TTL):
+    """
+    Stored (raw, actions) for a ticker covering at least `period`.
+
+    The store is refreshed once a session has completed since the last fetch
+    (at most every `max_age` seconds while the market is trading) by fetching
+    only the days since the last stored bar; a full download happens only when
+    the store is missing, too short, or its tail no longer matches Yahoo (a
+    restatement). Splits and dividends just add rows to the actions table.
+    Falls back to the stale copy if the refresh fails. Returns None without data.
+    """
+    path = _cache_path("store", f"{_safe_name(ticker)}.pkl")
+    stored = _read_pickle(path)
+    if stored is not None and _store_is_current(ticker, stored["fetched_at"], max_age) and _store_covers(stored, period):
+        return stored["raw"], stored["actions"]
+
+    refreshed = _refresh_store(ticker, stored, period)
+    if refreshed is None:
+        return (stored["raw"], stored["actions"]) if stored is not None else None
+    _write_pickle(path, refreshed)
+    return refreshed["raw"], refreshed["actions"]
+
+def load_history(ticker, period="2y", max_age=PRICE_CACHE_TTL, adjusted=True):
+    """
+    fetch_data()-shaped history from the local price store: adjusted OHLCV by
+    default (same as yfinance's auto_adjust), or the as-traded prices with
+    adjusted=False. Only the last `period` is returned. Repeat calls between
+    sessions are served from the store without a network request.
+    """
+    loaded = load_price_store(ticker, period=period, max_age=max_age)
+    if loaded is None:
+        return None
+    raw, actions = loaded
+    match = re.fullmatch(r"(\d+)d", period)
+    if match is not None:
+        raw = raw.tail(int(match.group(1)))
+    elif _period_offset(period) is not None:
+        raw = raw[raw.index >= raw.index[-1] - _period_offset(period)]
+    if not adjusted:
+        return raw.join(actions).fillna({col: 0.0 for col in ACTION_COLUMNS})
+    return adjusted_history(raw, actions)
+
+def corporate_actions(ticker, period="2y"):
+    """Stored dividends (as-traded per share) and split ratios by ex-date."""
+    loaded = load_price_store(ticker, period=period)
+    return loaded[1] if loaded is not None else pd.DataFrame(columns=ACTION_COLUMNS)
+
+# Multi-timeframe bars
+# Weekly bars run Monday-Sunday (so 24/7 crypto fits too); each bar is labelled
+# with the date of its last daily bar.
+TIMEFRAME_RULES = {"W": "W-SUN", "M": "M"}
+TIMEFRAME_PERIODS = {"D": "2y", "W": "5y", "M": "10y"} # daily history loaded per timeframe
+TIMEFRAME_YEAR_BARS = {"W": 52, "M": 12}
+
+def aggregate_bars(df, timeframe):
+    """
+    OHLCV daily history -> weekly ("W") or monthly ("M") bars, vectorized with
+    ufunc.reduceat over the group boundaries (no groupby / resample).
+    """
+    if df is None or df.empty:
+        return df
+    idx = pd.DatetimeIndex(df.index)
+    local = idx.tz_localize(None) if idx.tz is not None else idx
+    keys = local.to_period(TIMEFRAME_RULES[timeframe]).asi8
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+
+    bars = pd.DataFrame(index=idx[ends])
+    if "Open" in df.columns:
+        bars["Open"] = df["Open"].to_numpy()[starts]
+    if "High" in df.columns:
+        bars["High"] = np.fmax.reduceat(df["High"].to_numpy(dtype=np.float64), starts)
+    if "Low" in df.columns:
+        bars["Low"] = np.fmin.reduceat(df["Low"].to_numpy(dtype=np.float64), starts)
+    bars["Close"] = df["Close"].to_numpy()[ends]
+    if "Volume" in df.columns:
+        bars["Volume"] = np.add.reduceat(np.nan_to_num(df["Volume"].to_numpy(dtype=np.float64)), starts)
+    bars.attrs["timeframe"] = timeframe
+    return bars
+
+def as_timeframe(df, timeframe="D"):
+    """df at `timeframe`: daily input is aggregated, bars already at that timeframe pass through."""
+    if df is None or timeframe == "D" or df.attrs.get("timeframe") == timeframe:
+        return df
+    return aggregate_bars(df, timeframe)
+
+def load_bars(ticker, timeframe="W", period=None, df=None):
+    """
+    Weekly / monthly bars for a ticker, maintained incrementally next to the dailies.
+
+    The stored bars are kept up to the last *complete* bar that still matches the
+    daily history; only dailies after it are aggregated on each call. A mismatch
+    (re-adjusted closes) or a longer requested history rebuilds the bars.
+    `df` may pass the daily history already loaded; timeframe "D" returns it as is.
+    """
+    period = period or TIMEFRAME_PERIODS.get(timeframe, "2y")
+    daily = df if df is not None else load_history(ticker, period=period)
+    if timeframe == "D":
+        return daily
+
+    path = _cache_path("bars", f"{_safe_name(ticker)}_{timeframe}.pkl")
+    stored = _read_pickle(path)
+    if daily is None or daily.empty:
+        return stored["bars"] if stored is not None else None
+
+    bars = None
+    if stored is not None and len(stored["bars"]) > 1 and stored["first_date"] <= daily.index[0]:
+        checkpoint = stored["bars"].index[-2]
+        pos = daily.index.searchsorted(checkpoint)
+        if pos < len(daily) and daily.index[pos] == checkpoint and \
+                np.isclose(daily["Close"].iloc[pos], stored["bars"]["Close"].iloc[-2], rtol=1e-9):
+            new = aggregate_bars(daily.iloc[pos + 1:], timeframe)
+            bars = pd.concat([stored["bars"].iloc[:-1], new]) if new is not None and not new.empty else stored["bars"].iloc[:-1]
+            first_date = stored["first_date"]
+
+    if bars is None:
+        bars = aggregate_bars(daily, timeframe)
+        first_date = daily.index[0]
+    bars.attrs["timeframe"] = timeframe
+    _write_pickle(path, {"bars": bars, "first_date": first_date})
+    return bars
+
+# Columns the app actually reads from a price history (charts, ATR, MDD).
+# Dividends / Stock Splits returned by yfinance are dropped.
+COMPACT_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Max absolute error allowed when storing prices as float32 (half a cent / half a won).
+FLOAT32_PRICE_TOLERANCE = 0.005
+
+class CompactHistory:
+    """
+    Columnar, memory-lean container for an OHLCV price history.
+
+    - Index is kept as int64 epoch nanoseconds (UTC) plus the timezone name.
+    - Prices are float32 when the round trip stays within FLOAT32_PRICE_TOLERANCE,
+      otherwise float64. Volume is stored as the smallest fitting integer type.
+    - Chart columns (MA5/20/40/60, Peak, Drawdown, Recovery_Needed) are not stored;
+      they are computed on demand from Close.
+
+    Supports the small DataFrame surface the analysis functions use:
+    len(), .empty, .columns, ["Close"], .tail(n).
+    """
+
+    DERIVED_COLUMNS = ["MA5", "MA20", "MA40", "MA60", "Peak", "Drawdown", "Recovery_Needed"]
+
+    def __init__(self, index, columns, tz=None):
+        self._index = index
+        self._columns = columns
+        self._tz = tz
+        self._datetime_index = None
+
+    @classmethod
+    def from_frame(cls, df, columns=COMPACT_COLUMNS):
+        index = pd.DatetimeIndex(df.index)
+        tz = str(index.tz) if index.tz is not None else None
+        epoch = index.as_unit("ns").asi8.copy()
+
+        stored = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            values = df[col].to_numpy()
+            if col == "Volume":
+                stored[col] = _compact_int(values)
+            else:
+                stored[col] = _compact_float(values)
+        return cls(epoch, stored, tz)
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def empty(self):
+        return len(self._index) == 0
+
+    @property
+    def index(self):
+        if self._datetime_index is None:
+            idx = pd.to_datetime(self._index, unit="ns", utc=self._tz is not None)
+            if self._tz is not None:
+                idx = idx.tz_convert(self._tz)
+            self._datetime_index = pd.DatetimeIndex(idx)
+        return self._datetime_index
+
+    @property
+    def columns(self):
+        derived = self.DERIVED_COLUMNS if len(self) >= 60 else self.DERIVED_COLUMNS[4:]
+        return list(self._columns) + list(derived)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        # Stored columns are returned as they are; a derived column is computed alone
+        if name in self._columns:
+            values = self._columns[name]
+        elif name in self.columns:
+            values = self._derived(name, 0)
+        else:
+            raise KeyError(name)
+        return pd.Series(values, index=self.index, name=name)
+
+    def _derived(self, name, start):
+        """Derived chart column `name` for the rows from `start` on."""
+        close = self._columns["Close"].astype(np.float64)
+        if name.startswith("MA"):
+            # MAs only need `length - 1` bars of look-back before the slice
+            length = int(name[2:])
+            lo = max(0, start - length + 1)
+            ma = pd.Series(close[lo:]).rolling(length).mean().to_numpy()
+            return ma[start - lo:]
+
+        # Peak is a high-water mark over the whole stored history
+        peak = np.maximum.accumulate(close)[start:]
+        tail_close = close[start:]
+        if name == "Peak":
+            return peak
+        if name == "Drawdown":
+            return (tail_close - peak) / peak
+        return (peak - tail_close) / tail_close
+
+    def tail(self, n=5):
+        """Returns the last n rows as a DataFrame, including derived chart columns."""
+        n = max(0, min(int(n), len(self)))
+        start = len(self) - n
+
+        data = {col: values[start:] for col, values in self._columns.items()}
+        for name in self.columns[len(self._columns):]:
+            data[name] = self._derived(name, start)
+
+        return pd.DataFrame(data, index=self.index[start:])
+
+    def to_frame(self):
+        return self.tail(len(self))
+
+    def memory_usage(self):
+        """Bytes held by the stored arrays (index + columns)."""
+        return int(self._index.nbytes + sum(v.nbytes for v in self._columns.values()))
+
+def _compact_float(values):
+    values = np.asarray(values, dtype=np.float64)
+    as32 = values.astype(np.float32)
+    finite = np.isfinite(values)
+    if np.all(np.abs(as32[finite].astype(np.float64) - values[finite]) <= FLOAT32_PRICE_TOLERANCE):
+        return as32
+    return values
+
+def _compact_int(values):
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64)).astype(np.int64)
+    if len(values) and values.max() < np.iinfo(np.int32).max and values.min() >= 0:
+        return values.astype(np.int32)
+    return values
+
+def memory_report(results):
+    """
+    Memory usage of the price histories held in run_analysis() results.
+    Compares stored (compact) bytes with the equivalent expanded float64 DataFrame.
+    """
+    rows = []
+    for name, res in results.items():
+        data = res.get("data")
+        if data is None:
+            continue
+        if isinstance(data, CompactHistory):
+            stored = data.memory_usage()
+            # Index + every (stored and derived) column as float64
+            expanded = len(data) * 8 * (1 + len(data.columns))
+        else:
+            stored = expanded = int(data.memory_usage(deep=True).sum())
+        rows.append({
+            "name": name,
+            "rows": len(data),
+            "stored_bytes": stored,
+            "expanded_bytes": expanded,
+            "ratio": stored / expanded if expanded else 0.0
+        })
+    return pd.DataFrame(rows)
+
+
+def ticker_currency(ticker):
+    """Quote currency of a Yahoo ticker (suffix based, USD by default)."""
+    if ticker in TICKER_CURRENCIES:
+        return TICKER_CURRENCIES[ticker]
+    for suffix, currency in CURRENCY_SUFFIXES.items():
+        if ticker.endswith(suffix):
+            return currency
+    return "USD"
+
+_fx_memo = {}
+
+def load_fx_matrix(max_age=PRICE_CACHE_TTL):
+    """
+    Daily FX rate matrix: DataFrame (tz-naive date x currency) holding units of
+    each currency per 1 FX_BASE (FX_BASE column is 1.0).
+
+    All currencies are downloaded in one bulk request per refresh; after the
+    first load only the last few days are fetched and merged into the cached
+    matrix. Within `max_age` seconds the matrix is served from memory/disk; a
+    failed refresh is not retried for another `max_age` seconds either.
+    """
+    path = _cache_path("fx", "matrix.pkl")
+    cached = _fx_memo.get("matrix") or _read_pickle(path)
+    if cached is not None and time.time() - cached["fetched_at"] < max_age:
+        _fx_memo["matrix"] = cached
+        return cached["data"]
+    if time.time() - _fx_memo.get("failed_at", float("-inf")) < max_age:
+        return cached["data"] if cached is not None else None
+
+    symbols = {f"{ccy}=X": ccy for ccy in FX_CURRENCIES if ccy != FX_BASE}
+    try:
+        _require_network("FX rates")
+        if cached is not None:
+            start = (cached["data"].index[-1] - pd.Timedelta(days=7)).strftime("%Y-%m-%d")
+            raw = yf.download(list(symbols), start=start, progress=False, group_by="ticker", multi_level_index=True)
+        else:
+            raw = yf.download(list(symbols), period=FX_HISTORY_PERIOD, progress=False, group_by="ticker", multi_level_index=True)
+        fresh = pd.DataFrame({ccy: raw[sym]["Close"] for sym, ccy in symbols.items()
+                              if sym in raw.columns.get_level_values(0)})
+        fresh.index = pd.DatetimeIndex(fresh.index).tz_localize(None).normalize()
+        fresh[FX_BASE] = 1.0
+    except Exception as e:
+        print(f"Error fetching FX rates: {e}")
+        _fx_memo["failed_at"] = time.time()
+        return cached["data"] if cached is not None else None
+
+    matrix = fresh if cached is None else fresh.combine_first(cached["data"])
+    matrix = matrix.reindex(columns=FX_CURRENCIES).sort_index().ffill()
+    entry = {"data": matrix, "fetched_at": time.time()}
+    _write_pickle(path, entry)
+    _fx_memo["matrix"] = entry
+    return matrix
+
+def fx_rate(from_ccy, to_ccy, date=None):
+    """
+    Conversion rate from one currency to another (latest, or as of `date`).
+    Falls back to FX_FALLBACK_RATES when no rate history is available.
+    """
+    if from_ccy == to_ccy:
+        return 1.0
+    matrix = load_fx_matrix()
+    if matrix is None or matrix.empty:
+        if from_ccy in FX_FALLBACK_RATES and to_ccy in FX_FALLBACK_RATES:
+            return FX_FALLBACK_RATES[to_ccy] / FX_FALLBACK_RATES[from_ccy]
+        return None
+    row = matrix.iloc[-1] if date is None else matrix.asof(pd.Timestamp(date).tz_localize(None).normalize())
+    return float(row[to_ccy] / row[from_ccy])
+
+def convert_series(values, from_ccy, to_ccy):
+    """
+    Converts a date-indexed price Series/DataFrame between currencies using the
+    rate of each date (last known rate for dates the FX market was closed).
+    """
+    if from_ccy == to_ccy:
+        return values
+    matrix = load_fx_matrix()
+    if matrix is None or matrix.empty:
+        return values * fx_rate(from_ccy, to_ccy)
+
+    dates = pd.DatetimeIndex(values.index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    rates = (matrix[to_ccy] / matrix[from_ccy]).reindex(dates.normalize(), method="ffill").bfill().to_numpy()
+    if isinstance(values, pd.DataFrame):
+        return values.mul(rates, axis=0)
+    return values * rates
 
-def analyze_market_phase(df):
+def analyze_market_phase(df, calendar=None, timeframe="D"):
     """
     Analyzes the 'High Altitude' 6-Phase Market Cycle.
     
@@ -96,18 +768,26 @@ def analyze_market_phase(df):
        Phase 5 (Rebound in Downtrend): 60 > Price > 20
        Phase 6 (Bottom/Transition): Price > 60 > 20 (Golden Cross forming)
        
+    With a `calendar`, the 20/60 windows are scaled to the same calendar span
+    (e.g. 29/87 bars for 24/7 crypto). With timeframe "W" / "M" the phase is
+    computed on weekly / monthly bars (20/60 bars of that timeframe).
+
     Returns:
         int: Phase number (1-6)
         dict: Details including MA values
     """
-    if df is None or len(df) < 60:
+    if timeframe != "D":
+        calendar = None # weekly / monthly bars span the same time on every calendar
+    df = as_timeframe(df, timeframe)
+    short_len, long_len = calendar_bars(calendar, 20), calendar_bars(calendar, 60)
+    if df is None or len(df) < long_len:
         return None, {}
 
     # Calculate MAs
     # Ensure we use Close price
     close = df['Close']
-    ma20 = ta.sma(close, length=20)
-    ma60 = ta.sma(close, length=60)
+    ma20 = ta.sma(close, length=short_len)
+    ma60 = ta.sma(close, length=long_len)
     
     # Get latest values
     current_price = close.iloc[-1]
@@ -138,41 +818,33 @@ def analyze_market_phase(df):
         "ma60": curr_ma60
     }
 
-def track_mdd(df):
+def track_mdd(df, window=None, calendar=None, timeframe="D"):
     """
     Calculates MDD based on 1-year rolling max.
     Determines if recovery rate is >= 80%.
+    The 1-year window is 252 bars, or one year of `calendar` sessions
+    (52 / 12 bars for timeframe "W" / "M").
+
+    MDD = (Current - 1y High) / 1y High
+    Recovery Rate = (Current - Low) / (High - Low), where High is the 1-year High
+    and Low is the lowest close AFTER that High.
     """
-    if df is None or len(df) < 252: # Approx 1 year trading days
+    if timeframe != "D":
+        df = as_timeframe(df, timeframe)
+        window = window or TIMEFRAME_YEAR_BARS[timeframe]
+    window = window or calendar_bars(calendar, BASE_YEAR_SESSIONS)
+    if df is None or len(df) < window: # Approx 1 year trading days
         return None, {}
 
-    # Focus on last 1 year (approx 252 days) for the calculation window, 
-    # but we can just take the whole series if we want "recent 1 year MDD"
-    recent_df = df.tail(252).copy()
-    
-    # Roll max
-    # We want the max since the start of this 1 year window? 
-    # Or strict "Recent 1 year high" as the reference for MDD? 
-    # Usually MDD is (Price - RollingMax) / RollingMax.
-    # We will find the global Max in the last 1 year and calculate Drop from that Max.
-    
-    period_max = recent_df['Close'].max()
-    current_price = recent_df['Close'].iloc[-1]
-    
+    # Plain array slice of the last `window` closes (no frame copy / label lookups)
+    closes = np.asarray(df['Close'].to_numpy(), dtype=np.float64)[-window:]
+    peak_pos = int(np.argmax(closes)) # first occurrence, like idxmax
+    period_max = closes[peak_pos]
+    current_price = closes[-1]
+    period_low_after_peak = closes[peak_pos:].min()
+
     mdd = (current_price - period_max) / period_max
-    
-    # Recovery Rate
-    # Often defined as: (Current - Low) / (High - Low)
-    # where High is the 1-year High, and Low is the Lowest point AFTER that High.
-    # Let's find the Low after the Date of period_max.
-    
-    # Find index of max
-    period_max_idx = recent_df['Close'].idxmax()
-    
-    # Slice from max to end
-    after_peak = recent_df.loc[period_max_idx:]
-    period_low_after_peak = after_peak['Close'].min()
-    
+
     if period_max == period_low_after_peak:
         recovery_rate = 1.0 # No drop
     else:
@@ -187,11 +859,13 @@ def track_mdd(df):
         "is_recovered": is_recovered
     }
 
-def calculate_atr(df, length=20):
+def calculate_atr(df, length=20, timeframe="D"):
     """
     Calculates ATR (N-value) with length 20 using EMA smoothing.
     Uses the latest available data point (iloc[-1]) for real-time tracking.
+    With timeframe "W" / "M" the ATR is over weekly / monthly bars.
     """
+    df = as_timeframe(df, timeframe)
     if df is None or len(df) < length:
         return None
     
@@ -200,128 +874,2421 @@ def calculate_atr(df, length=20):
     
     return atr_series.iloc[-1]
 
+def _fetch_dividends(ticker):
+    _require_network(f"dividends for {ticker}")
+    divs = yf.Ticker(ticker).dividends
+    if divs.index.tz is not None:
+        divs.index = divs.index.tz_localize(None)
+    return divs.astype(np.float64)
+
+def _dividend_period_days(divs):
+    """Typical number of days between payments (median gap), None if unknown."""
+    if len(divs) < 2:
+        return None
+    gaps = np.diff(divs.index.values).astype("timedelta64[D]").astype(np.int64)
+    return int(np.median(gaps[-8:]))
+
+def load_dividends(ticker, today=None):
+    """
+    Full dividend series (tz-naive date index) from the local cache.
+
+    The network is only hit when a new payment is expected (last date + typical
+    gap has passed) or the cache is older than DIVIDEND_MAX_AGE_DAYS. Refreshed
+    data is merged into the cached series, so past entries are never lost.
+    Empty results are cached like any other; a failed fetch is recorded too and
+    retried the next day instead of on every call.
+    """
+    today = pd.Timestamp(today or datetime.date.today())
+    path = _cache_path("dividends", f"{_safe_name(ticker)}.pkl")
+    cached = _read_pickle(path)
+
+    if cached is not None:
+        divs = cached["data"]
+        age_days = (today - cached["fetched_at"]).days
+        if cached.get("failed"):
+            if age_days < 1:
+                return divs
+        else:
+            period = _dividend_period_days(divs)
+            payment_due = period is not None and today >= divs.index[-1] + pd.Timedelta(days=period)
+            if age_days < DIVIDEND_MAX_AGE_DAYS and not (payment_due and age_days >= 1):
+                return divs
+
+    try:
+        fresh = _fetch_dividends(ticker)
+    except OfflineError:
+        return cached["data"] if cached is not None else pd.Series(dtype=np.float64)
+    except Exception as e:
+        print(f"Error fetching dividends for {ticker}: {e}")
+        divs = cached["data"] if cached is not None else pd.Series(dtype=np.float64)
+        _write_pickle(path, {"data": divs, "fetched_at": today, "failed": True})
+        return divs
+
+    divs = fresh if cached is None else fresh.combine_first(cached["data"])
+    divs = divs.sort_index()
+    _write_pickle(path, {"data": divs, "fetched_at": today})
+    return divs
+
 def get_dividend_history(ticker, count=5):
     """
     Fetches historical dividend data for a ticker.
+    Served from the local dividend cache (see load_dividends).
+    """
+    divs = load_dividends(ticker)
+    if divs.empty:
+        return None
+
+    # Sort by date descending and take top N
+    latest_divs = divs.sort_index(ascending=False).head(count)
+
+    results = []
+    for date, value in latest_divs.items():
+        results.append({
+            "Date": date.strftime("%Y-%m-%d"),
+            "Amount": value
+        })
+    return results
+
+def dividend_analytics(holdings, prices, horizon_months=12, today=None):
+    """
+    Dividend analytics for a whole portfolio in one pass over all cached series.
+
+    holdings: list of {"ticker", "quantity"}; prices: {ticker: current price}.
+
+    Returns a dict of DataFrames:
+    - "summary": per ticker last payout, payments/year, TTM dividend per share,
+      TTM yield and projected annual income
+    - "calendar": projected payments over the next `horizon_months`
+      (last payout repeated at the typical payment interval)
+    - "monthly": projected income by month, one column per ticker plus "Total"
+    """
+    today = pd.Timestamp(today or datetime.date.today()).normalize()
+    horizon_end = today + pd.DateOffset(months=horizon_months)
+    qty = pd.Series({h['ticker']: h['quantity'] for h in holdings}, dtype=np.float64)
+
+    series = {ticker: load_dividends(ticker, today) for ticker in qty.index}
+    frames = [s.rename("amount").rename_axis("date").reset_index().assign(ticker=t)
+              for t, s in series.items() if not s.empty]
+    if not frames:
+        empty = pd.DataFrame()
+        return {"summary": empty, "calendar": empty, "monthly": empty}
+    long = pd.concat(frames, ignore_index=True)
+
+    grouped = long.groupby("ticker")
+    summary = pd.DataFrame({
+        "last_date": grouped["date"].max(),
+        "last_amount": grouped["amount"].last(),
+        "ttm_dividend": long[long["date"] > today - pd.Timedelta(days=365)].groupby("ticker")["amount"].sum()
+    })
+    summary["ttm_dividend"] = summary["ttm_dividend"].fillna(0.0)
+    summary["period_days"] = pd.Series({t: _dividend_period_days(s) for t, s in series.items() if not s.empty})
+    summary["payments_per_year"] = (365.0 / summary["period_days"]).round()
+    summary["quantity"] = qty.reindex(summary.index)
+    summary["price"] = pd.Series(prices, dtype=np.float64).reindex(summary.index)
+    summary["ttm_yield"] = summary["ttm_dividend"] / summary["price"]
+    summary["annual_income"] = summary["ttm_dividend"] * summary["quantity"]
+
+    # Projected calendar: k-th next payment = last_date + k * period, within the horizon
+    known = summary.dropna(subset=["period_days"])
+    max_k = int((horizon_end - today).days // max(known["period_days"].min(), 1)) + 1 if not known.empty else 0
+    k = np.arange(1, max_k + 1)
+    pay_dates = (known["last_date"].values[:, None]
+                 + (known["period_days"].values[:, None] * k).astype("timedelta64[D]"))
+    mask = (pay_dates > np.datetime64(today)) & (pay_dates <= np.datetime64(horizon_end))
+    rows, cols = np.nonzero(mask)
+    calendar = pd.DataFrame({
+        "ticker": known.index.values[rows],
+        "date": pay_dates[rows, cols],
+        "amount_per_share": known["last_amount"].values[rows],
+        "quantity": known["quantity"].values[rows]
+    })
+    calendar["income"] = calendar["amount_per_share"] * calendar["quantity"]
+    calendar = calendar.sort_values("date").reset_index(drop=True)
+
+    monthly = calendar.assign(month=calendar["date"].dt.to_period("M")).pivot_table(
+        index="month", columns="ticker", values="income", aggfunc="sum", fill_value=0.0
+    )
+    monthly["Total"] = monthly.sum(axis=1)
+
+    return {"summary": summary, "calendar": calendar, "monthly": monthly}
+
+@lru_cache(maxsize=None)
+def load_universe(index_name):
     """
+    Loads the constituent list of an index (see UNIVERSE_FILES) from disk.
+    Returns an empty frame if the file is missing.
+    """
+    path = os.path.join(UNIVERSE_DIR, UNIVERSE_FILES[index_name])
     try:
-        tk = yf.Ticker(ticker)
-        divs = tk.dividends
-        if divs.empty:
-            return None
-        
-        # Sort by date descending and take top N
-        latest_divs = divs.sort_index(ascending=False).head(count)
-        
-        results = []
-        for date, value in latest_divs.items():
-            results.append({
-                "Date": date.strftime("%Y-%m-%d"),
-                "Amount": value
-            })
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    except FileNotFoundError:
+        print(f"Universe file not found: {path}")
+        df = pd.DataFrame(columns=UNIVERSE_COLUMNS)
+    df["index"] = index_name
+    return df
+
+def get_universe(market_type="US", sectors=None):
+    """
+    Returns the screening universe for a market as a DataFrame
+    (ticker, name, name_en, exchange, sector, index, rank).
+
+    Tickers listed in several indices (e.g. S&P 500 and NASDAQ-100) are kept once,
+    at their first position. `rank` is the position in that merged order.
+    """
+    frames = [load_universe(name) for name in MARKET_UNIVERSES[market_type]]
+    df = pd.concat(frames, ignore_index=True).drop_duplicates("ticker")
+
+    if sectors:
+        df = df[df["sector"].isin(sectors)]
+
+    df = df.reset_index(drop=True)
+    df["rank"] = df.index
+    return df
+
+def _normalize_symbol(text):
+    """Search key: case-folded, letters / digits / Hangul only ("005930.KS" -> "005930ks")."""
+    return re.sub(r"[^0-9a-z\uac00-\ud7a3]", "", str(text).casefold())
+
+def _trigrams(key):
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _symbol_sources():
+    paths = [os.path.join(UNIVERSE_DIR, f) for f in UNIVERSE_FILES.values()]
+    paths += [os.path.join(UNIVERSE_DIR, f) for f in SYMBOL_LISTING_FILES.values()]
+    return [p for p in paths if os.path.exists(p)]
+
+def _portfolio_symbols():
+    """ticker / name / exchange of every holding and DCA target in portfolio.py."""
+    import portfolio
+    items = [item for value in vars(portfolio).values() if isinstance(value, list)
+             for item in value if isinstance(item, dict) and item.get("ticker")]
+    rows = pd.DataFrame({"ticker": [item["ticker"] for item in items], "name": [item.get("name", "") for item in items]})
+    rows["exchange"] = [next((ex for sfx, ex in SYMBOL_SUFFIX_EXCHANGES.items() if t.endswith(sfx)), "")
+                        for t in rows["ticker"]]
+    return rows
+
+def _build_symbol_index(sources):
+    """
+    Compact, array-only symbol index:
+    - rows: ticker / name / name_en / exchange (first occurrence of a ticker wins,
+      so the Korean names of the universe files beat the listing files)
+    - keys: sorted normalized search keys (ticker, code without suffix, names,
+      words of the English name)
+      as UTF-8 bytes with the owning row, for prefix search by binary search
+    - trigrams: sorted trigram vocabulary with CSR postings into the keys
+    """
+    frames = [pd.read_csv(p, dtype=str, keep_default_na=False) for p in sources]
+    frames.append(pd.DataFrame({"ticker": list(TARGET_INDICES.values()), "name": list(TARGET_INDICES.keys()), "exchange": "INDEX"}))
+    frames.append(_portfolio_symbols())
+    rows = pd.concat(frames, ignore_index=True).reindex(columns=UNIVERSE_COLUMNS).fillna("")
+    rows = rows[rows["ticker"] != ""].drop_duplicates("ticker").reset_index(drop=True)
+
+    entries = sorted(
+        (key.encode("utf-8"), i)
+        for i, (ticker, name, name_en) in enumerate(zip(rows["ticker"], rows["name"], rows["name_en"]))
+        for key in {_normalize_symbol(k) for k in (ticker, ticker.split(".")[0], name, name_en, *name_en.split())} - {""}
+    )
+    postings = {}
+    trigram_counts = np.zeros(len(entries), dtype=np.int16)
+    for k, (key, _) in enumerate(entries):
+        grams = _trigrams(key.decode("utf-8"))
+        trigram_counts[k] = len(grams)
+        for gram in grams:
+            postings.setdefault(gram.encode("utf-8"), []).append(k)
+
+    vocab = sorted(postings)
+    offsets = np.cumsum([0] + [len(postings[g]) for g in vocab]).astype(np.int32)
+    return {
+        "tickers": rows["ticker"].to_numpy(dtype=str),
+        "names": rows["name"].to_numpy(dtype=str),
+        "names_en": rows["name_en"].to_numpy(dtype=str),
+        "exchanges": rows["exchange"].to_numpy(dtype=str),
+        "keys": np.array([key for key, _ in entries], dtype=bytes),
+        "key_rows": np.array([row for _, row in entries], dtype=np.int32),
+        "trigrams": np.array(vocab, dtype=bytes),
+        "trigram_offsets": offsets,
+        "trigram_keys": np.array([k for g in vocab for k in postings[g]], dtype=np.int32),
+        "trigram_counts": trigram_counts,
+    }
+
+@lru_cache(maxsize=1)
+def _load_symbol_index(signature):
+    path = _cache_path("symbols", f"index_{signature}.npz")
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {k: data[k] for k in data.files}
+    except (FileNotFoundError, OSError, ValueError):
+        pass
+    index = _build_symbol_index(_symbol_sources())
+    _atomic_write(path, lambda f: np.savez_compressed(f, **index))
+    return index
+
+def symbol_index():
+    """
+    The symbol index over the universe / listing files, TARGET_INDICES and the
+    holdings in portfolio.py, loaded on first use. It is rebuilt (and written
+    to the cache as .npz) only when a source file changes.
+    """
+    stamp = "|".join(f"{p}:{os.stat(p).st_mtime_ns}:{os.stat(p).st_size}" for p in [*_symbol_sources(), PORTFOLIO_PATH])
+    return _load_symbol_index(hashlib.sha1(stamp.encode("utf-8")).hexdigest()[:16])
+
+def _symbol_record(index, row, score=1.0):
+    return {
+        "ticker": str(index["tickers"][row]),
+        "name": str(index["names"][row]),
+        "name_en": str(index["names_en"][row]),
+        "exchange": str(index["exchanges"][row]),
+        "score": float(score)
+    }
+
+def resolve_symbol(query):
+    """
+    Exact lookup of a ticker, a code without its suffix ("005930") or a name
+    ("삼성전자", "Apple Inc."). Returns the symbol record, or None if unknown.
+    """
+    index = symbol_index()
+    key = _normalize_symbol(query).encode("utf-8")
+    if not key:
+        return None
+    lo, hi = np.searchsorted(index["keys"], [key, key + b"\xff"])
+    exact = [int(index["key_rows"][i]) for i in range(lo, hi) if index["keys"][i] == key]
+    return _symbol_record(index, min(exact)) if exact else None
+
+def search_symbols(query, limit=10):
+    """
+    Symbol search over the index: prefix matches on tickers / names first
+    (exact key, then universe rank), then trigram fuzzy matches for typos.
+    Returns a list of symbol records with a `score` (1.0 for prefix matches).
+    """
+    index = symbol_index()
+    key = _normalize_symbol(query)
+    if not key:
+        return []
+
+    # UTF-8 byte order is code point order, and 0xff never occurs in UTF-8
+    lo, hi = np.searchsorted(index["keys"], [key.encode("utf-8"), key.encode("utf-8") + b"\xff"])
+    hits = sorted(zip(index["keys"][lo:hi] != key.encode("utf-8"), index["key_rows"][lo:hi]))
+    results, seen = [], set()
+    for _, row in hits:
+        if row not in seen:
+            seen.add(row)
+            results.append(_symbol_record(index, row))
+            if len(results) >= limit:
+                return results
+
+    grams = np.array(sorted(g.encode("utf-8") for g in _trigrams(key)), dtype=bytes)
+    pos = np.searchsorted(index["trigrams"], grams)
+    inside = pos < len(index["trigrams"])
+    pos = pos[inside][index["trigrams"][pos[inside]] == grams[inside]]
+    if len(pos) == 0:
         return results
+    offsets = index["trigram_offsets"]
+    matched = np.concatenate([index["trigram_keys"][offsets[p]:offsets[p + 1]] for p in pos])
+    shared = np.bincount(matched, minlength=len(index["keys"]))
+    candidates = np.flatnonzero(shared)
+    scores = 2 * shared[candidates] / (len(grams) + index["trigram_counts"][candidates])
+    for j in np.argsort(-scores, kind="stable"):
+        row = int(index["key_rows"][candidates[j]])
+        if scores[j] < SYMBOL_FUZZY_MIN_SCORE or len(results) >= limit:
+            break
+        if row not in seen:
+            seen.add(row)
+            results.append(_symbol_record(index, row, scores[j]))
+    return results
+
+def _fetch_fundamentals(ticker):
+    try:
+        _require_network(f"fundamentals for {ticker}")
+        info = yf.Ticker(ticker).info
     except Exception as e:
-        print(f"Error fetching dividends for {ticker}: {e}")
+        print(f"Error fetching fundamentals for {ticker}: {e}")
         return None
+    row = {field: info.get(key) for field, key in FUNDAMENTAL_FIELDS.items()}
+    for field in FUNDAMENTAL_NUMERIC:
+        try:
+            row[field] = float(row[field])
+        except (TypeError, ValueError):
+            row[field] = np.nan
+    row["fetched_at"] = time.time()
+    return row
 
-def screen_stocks(market_type="US"):
+def _read_fundamentals():
+    store = _read_pickle(_cache_path("fundamentals", "fundamentals.pkl"))
+    if store is None:
+        store = pd.DataFrame(columns=[*FUNDAMENTAL_FIELDS, "fetched_at", "failed_at"])
+    if "failed_at" not in store.columns: # stored before failures were recorded
+        store["failed_at"] = np.nan
+    return store
+
+def refresh_fundamentals(tickers=None, max_age=FUNDAMENTALS_MAX_AGE, workers=FUNDAMENTALS_WORKERS):
     """
-    Screens stocks from the universe based on Turtle Strategy criteria.
-    
-    Criteria (US):
-    - 20-day High breakout
-    - SMA5 rising for 2+ days
-    - SMA200 rising for 2+ days
-    - Market Cap >= 100,000M
-    
-    Criteria (KR):
-    - 20-day High breakout
-    - Strength/Volume confirmation (Proxy for Supply)
+    Bulk refresh of the fundamentals store (one row per ticker: name, sector,
+    market_cap, per, pbr, dividend_yield, fetched_at, failed_at).
+
+    Only tickers missing from the store or older than `max_age` seconds are
+    fetched, `workers` at a time; a failed fetch keeps the previous row (or adds
+    an empty one) with its failed_at time, and is not retried for
+    FUNDAMENTALS_RETRY_DELAY seconds.
+    Defaults to every ticker of the US and KR universes. Fetched rows are merged
+    into the store as it is at write time, so concurrent refreshes keep each
+    other's rows.
     """
-    universe = US_UNIVERSE if market_type == "US" else KR_UNIVERSE
-    results = []
-    
-    for ticker in universe:
+    if tickers is None:
+        tickers = list(get_universe("US")["ticker"]) + list(get_universe("KR")["ticker"])
+    store = _read_fundamentals()
+    now = time.time()
+    fetched_at = pd.to_numeric(store["fetched_at"]).reindex(list(tickers))
+    failed_at = pd.to_numeric(store["failed_at"]).reindex(list(tickers))
+    stale = list(fetched_at.index[~(now - fetched_at <= max_age) & ~(now - failed_at < FUNDAMENTALS_RETRY_DELAY)].unique())
+    if not stale:
+        return store
+
+    rows, failed = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(stale)))) as executor:
+        futures = {executor.submit(_fetch_fundamentals, ticker): ticker for ticker in stale}
+        for future in as_completed(futures):
+            row = future.result()
+            if row is not None:
+                rows[futures[future]] = row
+            else:
+                failed.append(futures[future])
+    if OFFLINE: # nothing was attempted; keep the replay set as recorded
+        failed = []
+    if rows or failed:
+        fresh = pd.DataFrame.from_dict(rows, orient="index")
+        with _fundamentals_lock:
+            store = _read_fundamentals()
+            store = pd.concat([store.drop(fresh.index, errors="ignore"), fresh])
+            store = store.reindex(store.index.union(failed, sort=False))
+            store.loc[failed, "failed_at"] = now
+            _write_pickle(_cache_path("fundamentals", "fundamentals.pkl"), store)
+    return store
+
+_fundamentals_lock = threading.Lock()
+_fundamentals_refresher = None
+
+def _refresh_fundamentals_forever(interval):
+    while True:
         try:
-            df = yf.download(ticker, period="1y", progress=False, multi_level_index=False)
-            if df is None or len(df) < 200: continue
-            
-            # 1. 20-day High Breakout
-            # Today's high must be the highest in the last 20 days
-            high_20 = df['High'].tail(20)
-            is_20d_high = high_20.iloc[-1] >= high_20.max()
-            
-            if not is_20d_high: continue
-            
-            # 2. SMA Trends (US)
-            sma5 = ta.sma(df['Close'], length=5)
-            sma200 = ta.sma(df['Close'], length=200)
-            
-            sma5_rising = sma5.iloc[-1] > sma5.iloc[-2] > sma5.iloc[-3]
-            sma200_rising = sma200.iloc[-1] > sma200.iloc[-2]
-            
-            # 3. Market Cap / Supply Filters
-            info = yf.Ticker(ticker).info
-            market_cap = info.get('marketCap', 0)
-            
-            if market_type == "US":
-                # Market Cap >= 100,000M (100 Billion)
-                # Note: yfinance cap is in absolute units (USD)
-                if market_cap < 100_000_000_000: continue
-                if not (sma5_rising and sma200_rising): continue
-            else: # KR
-                # Supply Proxy: Volume > 20d Avg Volume + Positive Price Action
-                avg_vol = df['Volume'].tail(20).mean()
-                curr_vol = df['Volume'].iloc[-1]
-                vol_strong = curr_vol > avg_vol
-                if not vol_strong: continue
-                
-            # If all passed, calculate Turtle metrics
-            n_val = calculate_atr(df)
-            
-            results.append({
-                "ticker": ticker,
-                "name": info.get('shortName', ticker),
-                "current_price": df['Close'].iloc[-1],
-                "1N": n_val,
-                "market_cap": market_cap,
-                "status": "Breakout"
-            })
+            refresh_fundamentals()
         except Exception as e:
-            print(f"Error screening {ticker}: {e}")
-            continue
-            
-    return pd.DataFrame(results)
+            print(f"Error refreshing fundamentals: {e}")
+        time.sleep(interval)
 
-def run_analysis():
-    results = {}
-    print(f"Starting Analysis for: {', '.join(TARGET_INDICES.keys())}")
+def start_fundamentals_refresher(interval=FUNDAMENTALS_CHECK_INTERVAL):
+    """
+    Starts (once per process) a daemon thread that warms the fundamentals store
+    and keeps every universe ticker younger than FUNDAMENTALS_MAX_AGE, checking
+    every `interval` seconds, so scans never wait for a bulk refresh.
+    Does nothing in offline mode.
+    """
+    global _fundamentals_refresher
+    with _fundamentals_lock:
+        if OFFLINE or _fundamentals_refresher is not None:
+            return
+        _fundamentals_refresher = threading.Thread(target=_refresh_fundamentals_forever, args=(interval,),
+                                                   name="fundamentals-refresher", daemon=True)
+        _fundamentals_refresher.start()
+
+def load_fundamentals(tickers, refresh_missing=True):
+    """
+    Fundamentals for `tickers` from the store (rows in the given order, NaN when unknown).
+    Stale rows are served as they are; only tickers never tried are fetched
+    (once, in bulk) unless refresh_missing=False. Failed tickers are retried by
+    the background refresher only (see start_fundamentals_refresher).
+    """
+    tickers = list(tickers)
+    store = _read_fundamentals()
+    missing = [t for t in tickers if t not in store.index]
+    if missing and refresh_missing:
+        store = refresh_fundamentals(missing, max_age=float("inf"))
+    fundamentals = store.reindex(tickers)
+    fundamentals[FUNDAMENTAL_NUMERIC] = fundamentals[FUNDAMENTAL_NUMERIC].astype(float)
+    return fundamentals
+
+def fundamental_mask(fundamentals, filters):
+    """
+    Vectorized valuation filter: boolean array over the rows of `fundamentals`.
+    `filters` maps a numeric field to (low, high) bounds, None for an open side,
+    e.g. {"per": (None, 15), "dividend_yield": (3, None)}. Unknown values fail
+    any bounded field.
+    """
+    mask = np.ones(len(fundamentals), dtype=bool)
+    for field, (low, high) in (filters or {}).items():
+        values = fundamentals[field].to_numpy(dtype=np.float64)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+    return mask
+
+def _screen_filters(min_market_cap, fundamental_filters):
+    """Valuation filters of a scan, with the market cap threshold folded in."""
+    filters = {field: tuple(bounds) for field, bounds in (fundamental_filters or {}).items()}
+    if min_market_cap:
+        low, high = filters.get("market_cap", (None, None))
+        filters["market_cap"] = (max(low or 0, min_market_cap), high)
+    return filters
+
+def _screen_rows(market_type, sectors, tickers, min_market_cap, fundamental_filters):
+    """
+    (rank, ticker, sector, fundamentals) rows of a scan after the vectorized
+    valuation filters, and the number of universe tickers considered.
+    """
+    universe = get_universe(market_type, sectors=sectors)
+    if tickers is not None:
+        universe = universe[universe["ticker"].isin(tickers)]
+    if min_market_cap is None:
+        min_market_cap = DEFAULT_MIN_MARKET_CAP.get(market_type, 0)
+
+    fundamentals = load_fundamentals(universe["ticker"])
+    mask = fundamental_mask(fundamentals, _screen_filters(min_market_cap, fundamental_filters))
+    records = fundamentals[mask].to_dict(orient="records")
+    rows = list(zip(universe["rank"][mask], universe["ticker"][mask], universe["sector"][mask], records))
+    return rows, len(universe)
+
+class Expr:
+    """
+    Node of a screening rule over a price panel (T bars x N tickers).
+
+    Compose with the primitives below (field, sma, ema, rolling_max, rolling_min,
+    shift, rising, falling) and the operators + - * / < <= > >= & | ~.
+    Nodes are identified by their structure (`key`), so a sub-expression shared
+    by several rules (e.g. one sma(close, 20)) is evaluated once per panel.
+    """
+
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+        self.key = (op, *(a.key if isinstance(a, Expr) else a for a in args))
+
+    def __repr__(self):
+        return f"Expr{self.key}"
+
+    def evaluate(self, panel, memo):
+        if self.key in memo:
+            return memo[self.key]
+        values = [a.evaluate(panel, memo) if isinstance(a, Expr) else a for a in self.args]
+        result = RULE_OPS[self.op](panel, *values)
+        memo[self.key] = result
+        return result
+
+    def shift(self, bars=1):
+        return Expr("shift", self, int(bars))
+
+    def _binary(self, op, other, swap=False):
+        other = other if isinstance(other, Expr) else Expr("const", float(other))
+        return Expr(op, other, self) if swap else Expr(op, self, other)
+
+    __add__ = lambda self, other: self._binary("add", other)
+    __radd__ = lambda self, other: self._binary("add", other, swap=True)
+    __sub__ = lambda self, other: self._binary("sub", other)
+    __rsub__ = lambda self, other: self._binary("sub", other, swap=True)
+    __mul__ = lambda self, other: self._binary("mul", other)
+    __rmul__ = lambda self, other: self._binary("mul", other, swap=True)
+    __truediv__ = lambda self, other: self._binary("div", other)
+    __rtruediv__ = lambda self, other: self._binary("div", other, swap=True)
+    __gt__ = lambda self, other: self._binary("gt", other)
+    __ge__ = lambda self, other: self._binary("ge", other)
+    __lt__ = lambda self, other: self._binary("lt", other)
+    __le__ = lambda self, other: self._binary("le", other)
+    __and__ = lambda self, other: self._binary("and", other)
+    __or__ = lambda self, other: self._binary("or", other)
+    __invert__ = lambda self: Expr("not", self)
+    __neg__ = lambda self: Expr("neg", self)
+
+def _window_view(x, bars, reduce):
+    """Trailing `bars`-bar reduction per column, NaN until a full window (NaNs propagate)."""
+    out = np.full(x.shape, np.nan)
+    if bars <= x.shape[0]:
+        out[bars - 1:] = reduce(np.lib.stride_tricks.sliding_window_view(x, bars, axis=0), axis=-1)
+    return out
+
+def _shift_panel(x, bars):
+    out = np.full(x.shape, np.nan) if x.dtype.kind == "f" else np.zeros(x.shape, dtype=x.dtype)
+    if bars < x.shape[0]:
+        out[bars:] = x[:x.shape[0] - bars]
+    return out
+
+def _ema_panel(x, span):
+    return pd.DataFrame(x).ewm(span=span, adjust=False, min_periods=span).mean().to_numpy()
+
+RULE_OPS = {
+    "field": lambda panel, name: panel[name],
+    "const": lambda panel, value: value,
+    "sma": lambda panel, x, bars: _window_view(x, bars, np.mean),
+    "ema": lambda panel, x, span: _ema_panel(x, span),
+    "max": lambda panel, x, bars: _window_view(x, bars, np.max),
+    "min": lambda panel, x, bars: _window_view(x, bars, np.min),
+    "shift": lambda panel, x, bars: _shift_panel(x, bars),
+    "add": lambda panel, a, b: a + b,
+    "sub": lambda panel, a, b: a - b,
+    "mul": lambda panel, a, b: a * b,
+    "div": lambda panel, a, b: a / b,
+    "gt": lambda panel, a, b: np.greater(a, b),
+    "ge": lambda panel, a, b: np.greater_equal(a, b),
+    "lt": lambda panel, a, b: np.less(a, b),
+    "le": lambda panel, a, b: np.less_equal(a, b),
+    "and": lambda panel, a, b: np.logical_and(a, b),
+    "or": lambda panel, a, b: np.logical_or(a, b),
+    "not": lambda panel, a: np.logical_not(a),
+    "neg": lambda panel, a: -a,
+}
+RULE_FIELDS = ["open", "high", "low", "close", "volume", "value"]
+
+def field(name):
+    if name not in RULE_FIELDS:
+        raise ValueError(f"Unknown field '{name}' (fields: {', '.join(RULE_FIELDS)})")
+    return Expr("field", name)
+
+def sma(x, bars):
+    return Expr("sma", x, int(bars))
+
+def ema(x, span):
+    return Expr("ema", x, int(span))
+
+def rolling_max(x, bars):
+    return Expr("max", x, int(bars))
+
+def rolling_min(x, bars):
+    return Expr("min", x, int(bars))
+
+def shift(x, bars=1):
+    return x.shift(bars)
+
+def rising(x, bars=1):
+    """x rose on each of the last `bars` bars (x[-1] > x[-2] > ... > x[-bars-1])."""
+    rule = x > x.shift(1)
+    for i in range(1, int(bars)):
+        rule = rule & (x.shift(i) > x.shift(i + 1))
+    return rule
+
+def falling(x, bars=1):
+    """x fell on each of the last `bars` bars."""
+    rule = x < x.shift(1)
+    for i in range(1, int(bars)):
+        rule = rule & (x.shift(i) < x.shift(i + 1))
+    return rule
+
+RULE_FUNCTIONS = {
+    "sma": sma, "ema": ema, "max": rolling_max, "min": rolling_min,
+    "shift": shift, "rising": rising, "falling": falling
+}
+
+def parse_rule(text):
+    """
+    Parses a rule such as "rising(sma(close, 5), 2) and volume > sma(volume, 20)"
+    into an Expr. Supported: the RULE_FIELDS names, numbers, RULE_FUNCTIONS calls,
+    + - * /, comparisons (chained too), and / or / not. Nothing is eval'd.
+    Function calls take a series and positive integer literal windows; any other
+    argument list raises ValueError naming the call.
+    """
+    def build(node):
+        if isinstance(node, ast.Name):
+            return field(node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return node.value
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in RULE_FUNCTIONS and not node.keywords:
+            return call(node)
+        if isinstance(node, ast.BinOp) and type(node.op) in binary_ops:
+            return binary_ops[type(node.op)](as_expr(build(node.left)), build(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -build(node.operand)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = build(node.operand)
+            if not isinstance(operand, Expr):
+                raise ValueError(f"'not' needs a condition, not a number: {ast.unparse(node)}")
+            return ~operand
+        if isinstance(node, ast.BoolOp):
+            parts = [as_expr(build(v)) for v in node.values]
+            rule = parts[0]
+            for part in parts[1:]:
+                rule = rule & part if isinstance(node.op, ast.And) else rule | part
+            return rule
+        if isinstance(node, ast.Compare) and all(type(op) in compare_ops for op in node.ops):
+            operands = [build(node.left), *(build(c) for c in node.comparators)]
+            rule = None
+            for op, left, right in zip(node.ops, operands, operands[1:]):
+                part = compare_ops[type(op)](as_expr(left), right)
+                rule = part if rule is None else rule & part
+            return rule
+        raise ValueError(f"Unsupported rule syntax: {ast.unparse(node)}")
+
+    def call(node):
+        name, func = node.func.id, RULE_FUNCTIONS[node.func.id]
+        params = list(inspect.signature(func).parameters.values())
+        required = sum(p.default is inspect.Parameter.empty for p in params)
+        if not required <= len(node.args) <= len(params):
+            count = str(required) if required == len(params) else f"{required} to {len(params)}"
+            raise ValueError(f"{name}() takes {count} arguments: {ast.unparse(node)}")
+        series = build(node.args[0])
+        if not isinstance(series, Expr):
+            raise ValueError(f"{name}() needs a price series as its first argument: {ast.unparse(node)}")
+        windows = []
+        for arg in node.args[1:]:
+            if not (isinstance(arg, ast.Constant) and type(arg.value) is int and arg.value > 0):
+                raise ValueError(f"{name}() window must be a positive integer: {ast.unparse(node)}")
+            windows.append(arg.value)
+        return func(series, *windows)
+
+    def as_expr(value):
+        return value if isinstance(value, Expr) else Expr("const", float(value))
+
+    binary_ops = {ast.Add: Expr.__add__, ast.Sub: Expr.__sub__, ast.Mult: Expr.__mul__, ast.Div: Expr.__truediv__}
+    compare_ops = {ast.Gt: Expr.__gt__, ast.GtE: Expr.__ge__, ast.Lt: Expr.__lt__, ast.LtE: Expr.__le__}
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid rule '{text}': {e.msg}")
+    def uses_field(key):
+        return key[0] == "field" or any(isinstance(k, tuple) and uses_field(k) for k in key[1:])
+
+    rule = build(tree.body)
+    if not isinstance(rule, Expr) or not uses_field(rule.key):
+        raise ValueError(f"Rule '{text}' has no price field")
+    return rule
+
+def compile_rules(rules):
+    """{name: rule text or Expr} -> {name: Expr}."""
+    return {name: parse_rule(rule) if isinstance(rule, str) else rule for name, rule in rules.items()}
+
+def bar_panel(frames):
+    """
+    {ticker: OHLCV frame} -> {field: T x N array} with the histories stacked
+    right-aligned by bar (shorter histories are NaN-padded at the start).
+    """
+    tickers = list(frames)
+    T = max((len(df) for df in frames.values()), default=0)
+    panel = {"tickers": tickers}
+    for name, column in (("open", "Open"), ("high", "High"), ("low", "Low"), ("close", "Close"), ("volume", "Volume")):
+        stacked = np.full((T, len(tickers)), np.nan)
+        for j, ticker in enumerate(tickers):
+            df = frames[ticker]
+            if column in df.columns:
+                stacked[T - len(df):, j] = df[column].to_numpy(dtype=np.float64)
+        panel[name] = stacked
+    panel["value"] = panel["close"] * panel["volume"]
+    return panel
+
+def evaluate_rules(rules, panel):
+    """
+    Evaluates compiled rules on the last bar of every ticker of the panel in one
+    vectorized pass with shared sub-expressions computed once.
+    Returns a boolean DataFrame (tickers x rules) with an extra "passed" column.
+    """
+    memo = {}
+    last = {name: np.asarray(rule.evaluate(panel, memo), dtype=bool)[-1] if len(panel["close"]) else
+            np.zeros(len(panel["tickers"]), dtype=bool) for name, rule in rules.items()}
+    table = pd.DataFrame(last, index=pd.Index(panel["tickers"], name="ticker"))
+    table["passed"] = table.all(axis=1)
+    return table
+
+@lru_cache(maxsize=None)
+def _compiled_strategy(strategy, min_avg_value=None):
+    rules = compile_rules(SCREEN_RULES[strategy])
+    if min_avg_value:
+        # Liquidity: average traded value over 20 days
+        rules["min_avg_value"] = sma(field("value"), 20) >= min_avg_value
+    return rules
+
+def _screen_strategy(market_type, strategy=None):
+    """Validated SCREEN_RULES name of a scan (default: the market's own strategy), compiled once here."""
+    strategy = strategy or market_type
+    if strategy not in SCREEN_RULES:
+        raise ValueError(f"Unknown screening strategy '{strategy}' (strategies: {', '.join(SCREEN_RULES)})")
+    _compiled_strategy(strategy)
+    return strategy
+
+def _screen_result(ticker, df, fundamentals):
+    """Result row of a ticker that passed the screen; `fundamentals` is its fundamentals store row."""
+    # If all passed, calculate Turtle metrics
+    n_val = calculate_atr(df)
+
+    return {
+        "ticker": ticker,
+        "name": fundamentals.get("name") if isinstance(fundamentals.get("name"), str) else ticker,
+        "current_price": df['Close'].iloc[-1],
+        "1N": n_val,
+        **{field: fundamentals.get(field) for field in FUNDAMENTAL_NUMERIC},
+        "status": "Breakout"
+    }
+
+def _screen_shard(shard):
+    """
+    Worker entry point: screens a shard of (rank, ticker, sector, fundamentals) rows.
+    The histories of the shard are stacked into one panel and the strategy's rules
+    (SCREEN_RULES) are evaluated on all of them at once; valuation filters were
+    applied beforehand (see _screen_rows).
+    Module-level so it can be pickled into a ProcessPoolExecutor.
+    """
+    rows, strategy, min_avg_value = shard
+    frames = {}
+    for rank, ticker, sector, fundamentals in rows:
+        try:
+            if OFFLINE:
+                df = load_history(ticker, "1y")
+            else:
+                df = yf.download(ticker, period="1y", progress=False, multi_level_index=False)
+        except Exception as e:
+            print(f"Error screening {ticker}: {e}")
+            continue
+        if df is not None and len(df) >= SCREEN_MIN_BARS:
+            frames[ticker] = df
+    if not frames:
+        return []
+
+    passed = evaluate_rules(_compiled_strategy(strategy, min_avg_value), bar_panel(frames))["passed"]
+    results = []
+    for rank, ticker, sector, fundamentals in rows:
+        if ticker in frames and passed[ticker]:
+            res = _screen_result(ticker, frames[ticker], fundamentals)
+            res["sector"] = sector
+            res["rank"] = rank
+            results.append(res)
+    return results
+
+def iter_screen_stocks(market_type="US", sectors=None, min_market_cap=None, min_avg_value=None,
+                       workers=None, shard_size=1, tickers=None, fundamental_filters=None,
+                       strategy=None):
+    """
+    Streaming variant of screen_stocks().
+
+    Yields a progress dict every time a shard finishes:
+        {"done": tickers evaluated so far, "total": universe size,
+         "results": passing result dicts from that shard}
+    With the default shard_size=1 the first result arrives after roughly one
+    ticker's fetch. Results arrive in completion order; each carries its `rank`.
+    Closing the generator early cancels the shards that have not started yet.
+    `tickers` restricts the scan to a subset of the universe (ranks are kept).
+    Tickers failing the valuation filters count as done before any download.
+    `workers` defaults to SCAN_WORKERS; 1 screens in this process.
+    """
+    strategy = _screen_strategy(market_type, strategy)
+    rows, total = _screen_rows(market_type, sectors, tickers, min_market_cap, fundamental_filters)
+    shards = [
+        (rows[i:i + shard_size], strategy, min_avg_value)
+        for i in range(0, len(rows), shard_size)
+    ]
+    done = total - len(rows)
+    if not shards:
+        yield {"done": done, "total": total, "results": []}
+        return
+
+    workers = min(workers or SCAN_WORKERS or os.cpu_count() or 1, len(shards))
+    if workers <= 1:
+        for shard in shards:
+            results = _screen_shard(shard)
+            done += len(shard[0])
+            yield {"done": done, "total": total, "results": results}
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(_screen_shard, shard): len(shard[0]) for shard in shards}
+        for future in as_completed(futures):
+            done += futures[future]
+            yield {"done": done, "total": total, "results": future.result()}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def screen_stocks(market_type="US", sectors=None, min_market_cap=None, min_avg_value=None, workers=None,
+                  fundamental_filters=None, strategy=None):
+    """
+    Screens stocks from the universe based on Turtle Strategy criteria.
+    The rules are SCREEN_RULES[strategy] (default: the market's own strategy).
     
+    Criteria (US):
+    - 20-day High breakout
+    - SMA5 rising for 2+ days
+    - SMA200 rising
+    - Market Cap >= 100,000M
+    
+    Criteria (KR):
+    - 20-day High breakout
+    - Strength/Volume confirmation (Proxy for Supply)
+
+    Universe filters:
+    - sectors: keep only these sectors (from the universe files)
+    - min_market_cap: overrides DEFAULT_MIN_MARKET_CAP for the market
+    - min_avg_value: minimum 20-day average traded value (Close * Volume)
+    - fundamental_filters: {field: (low, high)} on market_cap / per / pbr /
+      dividend_yield, evaluated on the fundamentals store (see fundamental_mask)
+
+    The universe is split into shards of SCAN_SHARD_SIZE tickers screened in
+    `workers` processes; results are merged back in universe rank order.
+    See iter_screen_stocks() for the streaming variant.
+    """
+    results = []
+    for progress in iter_screen_stocks(market_type, sectors, min_market_cap, min_avg_value,
+                                       workers=workers, shard_size=SCAN_SHARD_SIZE,
+                                       fundamental_filters=fundamental_filters, strategy=strategy):
+        results.extend(progress["results"])
+
+    results.sort(key=lambda res: res["rank"])
+    return pd.DataFrame(results)
+
+class OfflineError(RuntimeError):
+    pass
+
+def _require_network(what):
+    """Raises OfflineError in offline mode; callers fall back to their cached copy."""
+    if OFFLINE:
+        raise OfflineError(f"{what} not fetched (STOCK_APP_OFFLINE=1)")
+
+def _cache_path(*parts):
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def _safe_name(ticker):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", ticker)
+
+def _read_pickle(path):
+    try:
+        return pd.read_pickle(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading cache {path}: {e}")
+        return None
+
+def _atomic_write(path, write):
+    # Write to a unique temp file first so concurrent readers never see a partial file
+    # and concurrent writers (threads of one process included) never share a temp file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        tmp_path = f.name
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+def _write_pickle(path, obj):
+    _atomic_write(path, lambda f: pd.to_pickle(obj, f))
+
+def ticker_exchange(ticker):
+    """
+    Exchange calendar code of a Yahoo ticker, or None when it cannot be told:
+    listed indices, known suffixes, and plain symbols (US listings) are known;
+    other suffixes, futures ("GC=F") and FX ("KRW=X") are not.
+    """
+    if ticker in TICKER_CALENDARS:
+        return TICKER_CALENDARS[ticker]
+    for suffix, calendar in CALENDAR_SUFFIXES.items():
+        if ticker.endswith(suffix):
+            return calendar
+    return "XNYS" if re.fullmatch(r"[A-Z0-9\-]+", ticker) else None
+
+def ticker_calendar(ticker):
+    """Trading calendar code of a Yahoo ticker (suffix based, XNYS by default)."""
+    if ticker in TICKER_CALENDARS:
+        return TICKER_CALENDARS[ticker]
+    for suffix, calendar in CALENDAR_SUFFIXES.items():
+        if ticker.endswith(suffix):
+            return calendar
+    return "XNYS"
+
+@lru_cache(maxsize=None)
+def exchange_holidays(calendar):
+    """Full-day closures of a calendar as a sorted tz-naive DatetimeIndex."""
+    filename = CALENDARS[calendar][0]
+    if filename is None:
+        return pd.DatetimeIndex([])
+    try:
+        df = pd.read_csv(os.path.join(CALENDAR_DIR, filename), parse_dates=["date"])
+    except Exception as e:
+        print(f"Error loading holidays for {calendar}: {e}")
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(df["date"]).normalize().sort_values()
+
+@lru_cache(maxsize=None)
+def _holiday_set(calendar):
+    return frozenset(d.date() for d in exchange_holidays(calendar))
+
+@lru_cache(maxsize=None)
+def _weekdays(calendar):
+    """Trading weekdays of a calendar as date.weekday() indices (locale independent)."""
+    return frozenset(WEEKDAY_NAMES.index(day) for day in CALENDARS[calendar][1].split())
+
+@lru_cache(maxsize=None)
+def _check_holiday_coverage(calendar, year):
+    # Printed once per (calendar, year): sessions outside the holiday file count every weekday
+    holidays = exchange_holidays(calendar)
+    if CALENDARS[calendar][0] is None or holidays.empty:
+        return
+    if not holidays[0].year <= year <= holidays[-1].year:
+        print(f"Warning: {calendar} holidays cover {holidays[0].year}-{holidays[-1].year} only; "
+              f"{year} is treated as having no holidays")
+
+@lru_cache(maxsize=256)
+def _sessions(calendar, start, end):
+    _, weekmask, _ = CALENDARS[calendar]
+    for year in range(start.year, end.year + 1):
+        _check_holiday_coverage(calendar, year)
+    return pd.bdate_range(start, end, freq="C", weekmask=weekmask, holidays=list(exchange_holidays(calendar)))
+
+def sessions(calendar, start, end):
+    """Session dates of a calendar between two dates (inclusive), cached per (calendar, span)."""
+    return _sessions(calendar, pd.Timestamp(start).date(), pd.Timestamp(end).date())
+
+def is_session(calendar, day):
+    """True if `day` (date) is a full trading day on the calendar."""
+    _check_holiday_coverage(calendar, day.year)
+    return day.weekday() in _weekdays(calendar) and day not in _holiday_set(calendar)
+
+def previous_session(calendar, day):
+    """Latest session date on or before `day`."""
+    while not is_session(calendar, day):
+        day -= datetime.timedelta(days=1)
+    return day
+
+def calendar_bars(calendar, trading_days):
+    """
+    Bars covering the calendar span of `trading_days` base sessions, e.g.
+    252 -> 365 bars for 24/7 crypto. Exchange calendars (five-day weeks) keep the
+    count unchanged, so MA20/MA60 and the 252-bar MDD window stay as charted.
+    """
+    if calendar is None or len(_weekdays(calendar)) == 5:
+        return trading_days
+    return int(round(trading_days * CALENDARS[calendar][2] / BASE_YEAR_SESSIONS))
+
+def align_panel(series, how="ffill", calendar=None):
+    """
+    Aligns {name: Series} on one tz-naive daily index (date x name).
+
+    - how="ffill": union of all dates, gaps (one market's holidays) forward-filled.
+      With a `calendar`, the panel is re-indexed onto its sessions instead.
+    - how="intersection": only dates every series has, nothing filled.
+    """
+    cleaned = {}
+    for name, values in series.items():
+        if values is None or len(values) == 0:
+            continue
+        idx = pd.DatetimeIndex(values.index)
+        if idx.tz is not None:
+            idx = idx.tz_localize(None)
+        values = pd.Series(values.to_numpy(), index=idx.normalize())
+        cleaned[name] = values[~values.index.duplicated(keep="last")]
+    if not cleaned:
+        return pd.DataFrame()
+
+    if how == "intersection":
+        return pd.concat(cleaned, axis=1, join="inner").sort_index()
+    if how != "ffill":
+        raise ValueError(f"Unknown alignment: {how}")
+
+    panel = pd.concat(cleaned, axis=1).sort_index().ffill()
+    if calendar is not None:
+        target = sessions(calendar, panel.index[0], panel.index[-1])
+        panel = panel.reindex(panel.index.union(target)).ffill().reindex(target)
+    return panel
+
+def market_now(market_type):
+    tz_name, _, _ = MARKET_SESSIONS[market_type]
+    return datetime.datetime.now(ZoneInfo(tz_name))
+
+def is_market_open(market_type, now=None):
+    """True during the regular session on a trading day (market local time)."""
+    _, open_time, close_time = MARKET_SESSIONS[market_type]
+    now = now or market_now(market_type)
+    return is_session(MARKET_CALENDARS[market_type], now.date()) and open_time <= now.time() < close_time
+
+def last_session_date(market_type, now=None):
+    """Date of the most recent *completed* regular session (market local time)."""
+    _, _, close_time = MARKET_SESSIONS[market_type]
+    now = now or market_now(market_type)
+    day = now.date()
+    if now.time() < close_time:
+        day -= datetime.timedelta(days=1)
+    return previous_session(MARKET_CALENDARS[market_type], day)
+
+def latest_bars(tickers):
+    """
+    Latest daily bar signature per ticker, (date, close, volume), from one bulk download.
+    Used to detect which tickers actually changed since a cached scan.
+    """
+    tickers = list(tickers)
+    if not tickers:
+        return {}
+    try:
+        _require_network("latest bars")
+        df = yf.download(tickers, period="5d", progress=False, group_by="ticker", multi_level_index=True)
+    except Exception as e:
+        print(f"Error fetching latest bars: {e}")
+        return {}
+
+    bars = {}
+    for ticker in tickers:
+        if ticker not in df.columns.get_level_values(0):
+            continue
+        sub = df[ticker].dropna(subset=["Close"])
+        if sub.empty:
+            continue
+        bars[ticker] = (
+            sub.index[-1].strftime("%Y-%m-%d"),
+            round(float(sub["Close"].iloc[-1]), 6),
+            float(sub["Volume"].iloc[-1])
+        )
+    return bars
+
+def _scan_cache_file(market_type, session_key, min_market_cap, min_avg_value, fundamental_filters=None, strategy=None):
+    params = f"_{strategy}" if strategy and strategy != market_type else ""
+    if min_market_cap != DEFAULT_MIN_MARKET_CAP.get(market_type, 0) or min_avg_value:
+        params += f"_cap{min_market_cap:g}_val{(min_avg_value or 0):g}"
+    if fundamental_filters:
+        key = json.dumps({field: list(bounds) for field, bounds in sorted(fundamental_filters.items())})
+        params += "_f" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    name = f"{market_type}_v{SCAN_CRITERIA_VERSION}_{session_key}{params}.pkl"
+    return _cache_path("scans", name)
+
+def iter_cached_scan(market_type="US", sectors=None, min_market_cap=None, min_avg_value=None,
+                     workers=None, now=None, fundamental_filters=None, strategy=None):
+    """
+    iter_screen_stocks() backed by a scan cache keyed by
+    (market, SCAN_CRITERIA_VERSION, session date[, non-default thresholds]).
+
+    - After the close: results for the last completed session are computed once
+      and then served instantly (a single progress dict with everything).
+    - During the session (intraday variant, keyed by today's date): only tickers
+      whose latest bar changed since the cached run are re-evaluated.
+    Tickers are screened in shards of SCAN_SHARD_SIZE, each evaluated as one panel.
+
+    The full universe is always cached; `sectors` is applied to what is yielded,
+    so every sector selection shares one cache entry; valuation filters get their
+    own entry. A scan that is cancelled before finishing is not written to the cache.
+    """
+    if min_market_cap is None:
+        min_market_cap = DEFAULT_MIN_MARKET_CAP.get(market_type, 0)
+    now = now or market_now(market_type)
+    intraday = is_market_open(market_type, now)
+    session_key = f"{now.date():%Y%m%d}_intraday" if intraday else f"{last_session_date(market_type, now):%Y%m%d}"
+    strategy = _screen_strategy(market_type, strategy)
+    path = _scan_cache_file(market_type, session_key, min_market_cap, min_avg_value, fundamental_filters, strategy)
+
+    universe = get_universe(market_type)
+    total = len(universe)
+    keep = set(universe["ticker"])
+    if sectors:
+        keep = set(universe.loc[universe["sector"].isin(sectors), "ticker"])
+
+    def selected(results):
+        return [res for res in results if res["ticker"] in keep]
+
+    cached = _read_pickle(path)
+    if cached is not None and not intraday:
+        yield {"done": total, "total": total, "results": selected(cached["results"])}
+        return
+
+    bars = latest_bars(universe["ticker"]) if intraday else {}
+    if cached is not None:
+        # Intraday refresh: keep results of unchanged tickers, re-evaluate the rest
+        changed = {t for t in universe["ticker"] if bars.get(t) is None or bars[t] != cached["bars"].get(t)}
+        results = [res for res in cached["results"] if res["ticker"] not in changed]
+        yield {"done": total - len(changed), "total": total, "results": selected(results)}
+    else:
+        changed = set(universe["ticker"])
+        results = []
+
+    base_done = total - len(changed)
+    for progress in iter_screen_stocks(market_type, None, min_market_cap, min_avg_value,
+                                       workers=workers, shard_size=SCAN_SHARD_SIZE, tickers=changed,
+                                       fundamental_filters=fundamental_filters, strategy=strategy):
+        results.extend(progress["results"])
+        yield {"done": base_done + progress["done"], "total": total, "results": selected(progress["results"])}
+
+    results.sort(key=lambda res: res["rank"])
+    _write_pickle(path, {"results": results, "bars": bars, "created": datetime.datetime.now().isoformat()})
+
+def get_scan_results(market_type="US", sectors=None, **kwargs):
+    """Cached, rank-ordered scan results as a DataFrame (see iter_cached_scan)."""
+    results = []
+    for progress in iter_cached_scan(market_type, sectors, **kwargs):
+        results.extend(progress["results"])
+    results.sort(key=lambda res: res["rank"])
+    return pd.DataFrame(results)
+
+def latest_cached_scan(market_type="US"):
+    """
+    Most recent completed scan for the default thresholds, read from the scan cache
+    without scanning: {"results", "created", "session"} or None.
+    """
+    scan_dir = os.path.join(CACHE_DIR, "scans")
+    pattern = re.compile(rf"{re.escape(market_type)}_v{SCAN_CRITERIA_VERSION}_(\d{{8}}(?:_intraday)?)\.pkl")
+    try:
+        names = [name for name in os.listdir(scan_dir) if pattern.fullmatch(name)]
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    latest = max(names, key=lambda name: os.path.getmtime(os.path.join(scan_dir, name)))
+    cached = _read_pickle(os.path.join(scan_dir, latest))
+    if cached is None:
+        return None
+    return {"results": cached["results"], "created": cached["created"], "session": pattern.fullmatch(latest).group(1)}
+
+def close_panel(tickers, period="2y", how="ffill", calendar=None):
+    """
+    Aligned panel of daily closes (tz-naive date x ticker) from the cached histories.
+    By default dates are the union over all tickers and gaps (holidays of one market)
+    are forward-filled; see align_panel() for intersection / calendar alignment.
+    """
+    closes = {}
+    for ticker, df in fetch_many(tickers, period=period).items():
+        if df is None or df.empty:
+            continue
+        closes[ticker] = df['Close'].astype(np.float64)
+    return align_panel(closes, how=how, calendar=calendar)
+
+def portfolio_lots(accounts):
+    """
+    Flattens {account: [holdings]} into one lots table
+    (account, ticker, quantity, cost, currency, unit, buy_date).
+
+    Holdings use buy_price (local currency) or buy_price_usd; optional fields:
+    - buy_date: lot counts only from that date (without it the lot is held over the whole history)
+    - unit: "g" for a lot priced per gram of an ounce-quoted ticker (domestic gold vs GC=F), cost in KRW
+    """
+    rows = []
+    for account, holdings in accounts.items():
+        for item in holdings:
+            unit = item.get("unit")
+            if unit == "g":
+                currency = "KRW"
+            elif "buy_price_usd" in item:
+                currency = "USD"
+            else:
+                currency = ticker_currency(item['ticker'])
+            rows.append({
+                "account": account,
+                "ticker": item['ticker'],
+                "quantity": float(item['quantity']),
+                "cost": float(item.get('buy_price', item.get('buy_price_usd', 0.0))) * item['quantity'],
+                "currency": currency,
+                "unit": unit,
+                "buy_date": pd.Timestamp(item['buy_date']) if item.get('buy_date') else pd.NaT
+            })
+    return pd.DataFrame(rows)
+
+def _currency_rates(currencies, index, base_ccy):
+    """(dates x len(currencies)) rates from each currency to base_ccy, one FX lookup per currency."""
+    rates = np.empty((len(index), len(currencies)))
+    for ccy in set(currencies):
+        cols = np.array([c == ccy for c in currencies])
+        rates[:, cols] = convert_series(pd.Series(1.0, index=index), ccy, base_ccy).to_numpy()[:, None]
+    return rates
+
+def _lot_values(lots, panel, base_ccy):
+    """
+    Daily value of each lot in base_ccy: (dates x lots) array.
+    Before its ticker's first price a lot is held at its cost basis (converted at
+    each date's rate), so a history starting later does not show up as a jump.
+    """
+    prices = panel.reindex(columns=lots["ticker"]).to_numpy(dtype=np.float64)
+    unpriced = np.isnan(prices) # panels are forward-filled: only before the first bar
+    prices = np.nan_to_num(prices)
+
+    # Vectorized FX: one rate series per quote currency, applied column-wise
+    prices *= _currency_rates([ticker_currency(t) for t in lots["ticker"]], panel.index, base_ccy)
+
+    per_gram = (lots["unit"] == "g").to_numpy()
+    prices[:, per_gram] /= GRAMS_PER_TROY_OUNCE
+
+    values = prices * lots["quantity"].to_numpy()
+    if unpriced.any():
+        cost = lots["cost"].to_numpy() * _currency_rates(list(lots["currency"]), panel.index, base_ccy)
+        values = np.where(unpriced, cost, values)
+
+    held = np.ones((len(panel), len(lots)), dtype=bool)
+    dated = lots["buy_date"].notna().to_numpy()
+    if dated.any():
+        held[:, dated] = panel.index.values[:, None] >= lots.loc[dated, "buy_date"].values[None, :]
+    return values * held
+
+def _add_drawdown_columns(curve, peak_start=None):
+    total = curve["Total"].to_numpy()
+    peak = np.maximum.accumulate(np.maximum(total, peak_start) if peak_start is not None else total)
+    curve["Peak"] = peak
+    curve["Drawdown"] = (total - peak) / np.where(peak > 0, peak, np.nan)
+    return curve
+
+# Bump when the valuation rules change so stored curves are recomputed
+EQUITY_CURVE_VERSION = 2
+
+def portfolio_equity_curve(accounts, base_ccy="KRW", period="5y", cash=None):
+    """
+    Daily portfolio value across accounts, in base_ccy, with drawdown.
+
+    Returns (curve, info):
+    - curve: one column per account plus Total, Peak (high-water mark), Drawdown
+    - info: current drawdown, max drawdown and recovery rate like track_mdd
+      (recovery = (current - low since peak) / (peak - low since peak))
+
+    The computation is one (dates x lots) array product. The result is stored
+    per lot set; later calls only compute the dates after the stored last row
+    (the last stored row is recomputed, as it may have been intraday).
+    A lot whose ticker has no price yet counts at its cost basis (see _lot_values).
+    """
+    cash = cash or {}
+    lots = portfolio_lots(accounts)
+    if lots.empty:
+        return pd.DataFrame(), {}
+
+    key_src = json.dumps([lots.astype(str).values.tolist(), base_ccy, sorted(cash.items()), EQUITY_CURVE_VERSION])
+    key = hashlib.sha1(key_src.encode()).hexdigest()[:16]
+    path = _cache_path("equity", f"{key}.pkl")
+    stored = _read_pickle(path)
+
+    panel = close_panel(lots["ticker"], period=period)
+    if panel.empty:
+        return pd.DataFrame(), {}
+
+    if stored is not None and not stored.empty:
+        start = stored.index[-1]
+        panel_new = panel[panel.index >= start]
+        base = stored[stored.index < start]
+    else:
+        panel_new = panel
+        base = None
+
+    values = _lot_values(lots, panel_new, base_ccy)
+    new_rows = pd.DataFrame(index=panel_new.index)
+    for account in lots["account"].unique():
+        cols = (lots["account"] == account).to_numpy()
+        new_rows[account] = values[:, cols].sum(axis=1) + cash.get(account, 0.0)
+    new_rows["Total"] = new_rows.sum(axis=1)
+
+    if base is not None and not base.empty:
+        new_rows = _add_drawdown_columns(new_rows, peak_start=base["Peak"].iloc[-1])
+        curve = pd.concat([base, new_rows])
+    else:
+        curve = _add_drawdown_columns(new_rows)
+    _write_pickle(path, curve)
+
+    total = curve["Total"].to_numpy()
+    peak_pos = int(np.argmax(total))
+    low_since_peak = total[peak_pos:].min()
+    peak_val = total[peak_pos]
+    info = {
+        "current_value": float(total[-1]),
+        "current_drawdown": float(curve["Drawdown"].iloc[-1]),
+        "max_drawdown": float(curve["Drawdown"].min()),
+        "peak_date": curve.index[peak_pos],
+        "recovery_rate": 1.0 if peak_val == low_since_peak else float((total[-1] - low_since_peak) / (peak_val - low_since_peak))
+    }
+    return curve, info
+
+ROLLING_STATS_COLUMNS = [
+    "close", "high_52w", "low_52w", "pos_pct", "mdd", "low_since_high",
+    "recovery_rate", "peak_date", "days_since_peak", "full_window"
+]
+
+def _new_rolling_state(window):
+    # Deques hold (position, close); positions count bars since the start of the history.
+    # "dates" holds the date of each max_q entry and is pushed/popped together with it.
+    return {"window": window, "pos": 0, "max_q": deque(), "min_q": deque(), "low_q": deque(), "dates": deque()}
+
+def _advance_rolling_stats(state, dates, closes):
+    """
+    Feeds new bars through the monotonic deques and returns their stats rows.
+
+    - max_q: decreasing closes in the window; front = 52w high (earliest on ties, like idxmax)
+    - min_q: increasing closes in the window; front = 52w low
+    - low_q: increasing closes since the 52w high; front = low since high.
+      The high's position only moves forward, so this is also a sliding minimum.
+    Each bar is pushed/popped at most once per deque: O(1) amortized per bar.
+    """
+    window = state["window"]
+    max_q, min_q, low_q, peak_dates = state["max_q"], state["min_q"], state["low_q"], state["dates"]
+    rows = []
+    for date, close in zip(dates, closes):
+        i = state["pos"]
+        state["pos"] += 1
+
+        while max_q and max_q[-1][1] < close:
+            max_q.pop()
+            peak_dates.pop()
+        max_q.append((i, close))
+        peak_dates.append(date)
+        while max_q[0][0] <= i - window:
+            max_q.popleft()
+            peak_dates.popleft()
+
+        while min_q and min_q[-1][1] > close:
+            min_q.pop()
+        min_q.append((i, close))
+        while min_q[0][0] <= i - window:
+            min_q.popleft()
+
+        peak_pos, high = max_q[0]
+        while low_q and low_q[-1][1] >= close:
+            low_q.pop()
+        low_q.append((i, close))
+        while low_q[0][0] < peak_pos:
+            low_q.popleft()
+
+        low = min_q[0][1]
+        low_since_high = low_q[0][1]
+        peak_date = peak_dates[0]
+        rows.append((
+            close, high, low,
+            (close - low) / (high - low) * 100 if high != low else 0.0,
+            (close - high) / high,
+            low_since_high,
+            1.0 if high == low_since_high else (close - low_since_high) / (high - low_since_high),
+            peak_date,
+            (date - peak_date).days,
+            i + 1 >= window
+        ))
+    return rows
+
+def rolling_stats(ticker, df=None, period="2y", window=None):
+    """
+    Rolling 52-week statistics table for a ticker, maintained incrementally.
+
+    Columns: close, high_52w, low_52w, pos_pct (position in the 52w range, %),
+    mdd, low_since_high, recovery_rate, peak_date, days_since_peak and
+    full_window (False while fewer than `window` bars are available).
+    Values match track_mdd() / the valuation page for every date.
+    `window` defaults to one year of sessions on the ticker's calendar
+    (252 bars, 365 for crypto).
+
+    The table and the deque state are stored per ticker. Each call only feeds
+    bars newer than the stored ones. The last stored bar is re-evaluated, as it
+    may have been intraday. If stored history no longer matches (e.g.
+    re-adjusted prices), the table is rebuilt.
+    """
+    window = window or calendar_bars(ticker_calendar(ticker), BASE_YEAR_SESSIONS)
+    path = _cache_path("rolling_stats", f"{_safe_name(ticker)}_{window}.pkl")
+    stored = _read_pickle(path)
+
+    if df is None:
+        df = load_history(ticker, period=period)
+    if df is None or df.empty:
+        return stored["table"] if stored is not None else pd.DataFrame(columns=ROLLING_STATS_COLUMNS)
+
+    close = df['Close'].astype(np.float64)
+    dates = pd.DatetimeIndex(close.index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    dates = dates.normalize()
+
+    table, state, start = None, None, 0
+    # States pickled before "dates" became a deque are rebuilt
+    if stored is not None and len(stored["table"]) > 1 and isinstance(stored["state"]["dates"], deque):
+        # Resume from the checkpoint taken before the last stored bar
+        checkpoint_date = stored["table"].index[-2]
+        pos = dates.searchsorted(checkpoint_date)
+        if pos < len(dates) and dates[pos] == checkpoint_date and \
+                np.isclose(close.iloc[pos], stored["table"]["close"].iloc[-2], rtol=1e-9):
+            table = stored["table"].iloc[:-1]
+            state = stored["state"]
+            start = pos + 1
+
+    if state is None:
+        table = pd.DataFrame(columns=ROLLING_STATS_COLUMNS)
+        state = _new_rolling_state(window)
+
+    new_dates, new_closes = list(dates[start:]), close.to_numpy()[start:].tolist()
+    # Checkpoint = state after every bar but the newest one
+    rows = _advance_rolling_stats(state, new_dates[:-1], new_closes[:-1])
+    checkpoint = {k: deque(v) if isinstance(v, deque) else v for k, v in state.items()}
+    rows += _advance_rolling_stats(state, new_dates[-1:], new_closes[-1:])
+
+    new_table = pd.DataFrame(rows, columns=ROLLING_STATS_COLUMNS, index=pd.DatetimeIndex(new_dates))
+    table = new_table if table.empty else pd.concat([table, new_table])
+    _write_pickle(path, {"table": table, "state": checkpoint})
+    return table
+
+def rolling_stats_asof(ticker, date, **kwargs):
+    """Stats row as of a date (last bar on or before it), or None."""
+    table = rolling_stats(ticker, **kwargs)
+    pos = table.index.searchsorted(pd.Timestamp(date), side="right") - 1
+    return table.iloc[pos] if pos >= 0 else None
+
+def rolling_stats_range(ticker, start=None, end=None, **kwargs):
+    """Stats rows between two dates (inclusive)."""
+    return rolling_stats(ticker, **kwargs).loc[start:end]
+
+def rolling_stats_latest(tickers, **kwargs):
+    """Latest stats row per ticker, plus the 1-day change (%), as one DataFrame."""
+    tickers = list(tickers)
+    histories = fetch_many(tickers, period=kwargs.pop("period", "2y"))
+    rows = {}
+    for ticker in tickers:
+        table = rolling_stats(ticker, df=histories.get(ticker), **kwargs)
+        if table.empty:
+            continue
+        row = table.iloc[-1].copy()
+        prev = table["close"].iloc[-2] if len(table) > 1 else row["close"]
+        row["change_pct"] = (row["close"] - prev) / prev * 100
+        rows[ticker] = row
+    return pd.DataFrame(rows).T.infer_objects()
+
+def mdd_from_rolling_stats(row):
+    """track_mdd()-shaped (mdd, mdd_info) from a rolling_stats row."""
+    if row is None or not row["full_window"]:
+        return None, {}
+    return row["mdd"], {
+        "high_1y": row["high_52w"],
+        "low_since_high": row["low_since_high"],
+        "recovery_rate": row["recovery_rate"],
+        "is_recovered": row["recovery_rate"] >= 0.8
+    }
+
+# Size of each pyramiding add relative to the first unit
+PYRAMID_SIZING = {
+    "half": 0.5,  # 1st = full unit, later adds = half unit (previous roadmap behaviour)
+    "equal": 1.0
+}
+
+def pyramiding_roadmaps(positions, units=5, spacing_n=2.0, stop_n=2.0, sizing="half", risk_cap=None, base_ccy="KRW"):
+    """
+    Pyramiding roadmaps for many positions at once, computed as (positions x units) arrays.
+
+    positions: DataFrame or list of dicts with ticker, buy_price, quantity, n_val, last_close.
+    - units: number of buys including the initial one
+    - spacing_n: distance between adds in N (entry k = buy_price + k * spacing_n * N)
+    - stop_n: stop distance below the latest entry in N
+    - sizing: key of PYRAMID_SIZING, or a list of per-add weights relative to the first unit
+    - risk_cap: max loss at stop per position in base_ccy; later stages are marked
+      within_cap=False and do not count towards the aggregate risk
+
+    Returns (roadmap, stage_risk):
+    - roadmap: one row per (position, stage) with entry_price, add_qty, total_qty,
+      total_cost, avg_price, stop_price, loss_at_stop (P&L if the stop is hit: negative = loss),
+      loss_at_stop_base (loss only, in base_ccy), reached, within_cap
+    - stage_risk: per stage, total risk at stop across the book in base_ccy (positions
+      capped earlier keep their last allowed stage) and the number of positions at that stage
+    """
+    pos = pd.DataFrame(positions).reset_index(drop=True)
+    if pos.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    buy = pos["buy_price"].to_numpy(dtype=np.float64)[:, None]
+    n_val = pos["n_val"].to_numpy(dtype=np.float64)[:, None]
+    qty = pos["quantity"].to_numpy(dtype=np.float64)[:, None]
+    last = pos["last_close"].to_numpy(dtype=np.float64)[:, None]
+    fx = np.array([fx_rate(ticker_currency(t), base_ccy) or 1.0 for t in pos["ticker"]])[:, None]
+
+    k = np.arange(units)[None, :]
+    if isinstance(sizing, str):
+        weights = np.where(k == 0, 1.0, PYRAMID_SIZING[sizing])
+    else:
+        weights = np.resize(np.asarray(sizing, dtype=np.float64), units)[None, :]
+    add_qty = np.maximum(1.0, np.round(qty * weights))
+
+    entry = buy + k * spacing_n * n_val
+    total_qty = np.cumsum(add_qty, axis=1)
+    total_cost = np.cumsum(entry * add_qty, axis=1)
+    avg_price = total_cost / total_qty
+    stop = entry - stop_n * n_val
+    loss = (avg_price - stop) * total_qty
+    # Risk at stop in base currency (0 once the stop is above the average price)
+    loss_base = np.maximum(loss, 0.0) * fx
+
+    within_cap = np.ones_like(loss, dtype=bool) if risk_cap is None else np.cumprod(loss_base <= risk_cap, axis=1).astype(bool)
+    # Stage index each position actually reaches under the cap (-1 if even the first buy exceeds it)
+    allowed_stage = within_cap.sum(axis=1) - 1
+
+    P, U = loss.shape
+    roadmap = pd.DataFrame({
+        "ticker": np.repeat(pos["ticker"].to_numpy(), U),
+        "stage": np.tile(np.arange(1, U + 1), P),
+        "entry_price": entry.ravel(),
+        "add_qty": add_qty.ravel().astype(np.int64),
+        "total_qty": total_qty.ravel().astype(np.int64),
+        "total_cost": total_cost.ravel(),
+        "avg_price": avg_price.ravel(),
+        "stop_price": stop.ravel(),
+        "loss_at_stop": -loss.ravel(),
+        "loss_at_stop_base": -loss_base.ravel(),
+        "reached": (last >= entry).ravel(),
+        "within_cap": within_cap.ravel()
+    })
+
+    # Aggregate risk per stage: each position contributes min(stage, its allowed stage)
+    stage_idx = np.minimum(np.arange(U)[None, :], allowed_stage[:, None])
+    rows = np.arange(P)[:, None]
+    risk = np.where(stage_idx >= 0, loss_base[rows, np.maximum(stage_idx, 0)], 0.0)
+    stage_risk = pd.DataFrame({
+        "stage": np.arange(1, U + 1),
+        "total_risk": risk.sum(axis=0),
+        "positions_at_stage": (allowed_stage[:, None] >= np.arange(U)[None, :]).sum(axis=0)
+    })
+    return roadmap, stage_risk
+
+# Turtle money management: 1 unit risks TURTLE_RISK_PER_UNIT of equity per 1N move
+TURTLE_RISK_PER_UNIT = 0.01
+# Max units per ticker / correlated group / market / whole book (original Turtle rules: 4 / 6 / 10 / 12)
+TURTLE_UNIT_LIMITS = {"ticker": 4, "group": 6, "market": 10, "total": 12}
+
+def _ticker_market(ticker):
+    return "KR" if ticker_currency(ticker) == "KRW" else "US"
+
+def ticker_sectors():
+    """ticker -> sector from all universe files (used as the default correlated group)."""
+    frames = [load_universe(name) for name in UNIVERSE_FILES]
+    df = pd.concat(frames, ignore_index=True).drop_duplicates("ticker")
+    return dict(zip(df["ticker"], df["sector"]))
+
+def turtle_unit_sizes(equity, n_values, fx=1.0, risk_pct=TURTLE_RISK_PER_UNIT):
+    """
+    Turtle unit size (shares) = floor(equity * risk_pct / (N * fx)), vectorized.
+    `equity` is in the base currency, N in the quote currency, fx = quote -> base rate.
+    """
+    dollar_vol = np.asarray(n_values, dtype=np.float64) * np.asarray(fx, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        units = np.floor(equity * risk_pct / dollar_vol)
+    return np.where(np.isfinite(units) & (units > 0), units, 0).astype(np.int64)
+
+def size_candidates(candidates, equity, base_ccy="KRW", held=None, groups=None,
+                    risk_pct=TURTLE_RISK_PER_UNIT, limits=TURTLE_UNIT_LIMITS, stop_n=2.0):
+    """
+    Sizes screen_stocks() candidates as one turtle unit each and applies unit limits.
+
+    - candidates: DataFrame with ticker, current_price, 1N (and rank/sector if available)
+    - held: DataFrame/list of current positions with ticker and units (already used budget)
+    - groups: ticker -> correlated group (default: sector from the universe files)
+
+    Unit sizes, cost and risk at stop are computed vectorized; the limit check then
+    walks candidates once in rank order on integer-coded arrays.
+    Adds columns: market, group, fx, unit_qty, unit_cost_base, risk_at_stop_base, accepted, reason.
+    """
+    df = pd.DataFrame(candidates).reset_index(drop=True).copy()
+    if df.empty:
+        return df
+    if "rank" in df.columns:
+        df = df.sort_values("rank").reset_index(drop=True)
+    groups = groups or ticker_sectors()
+
+    df["market"] = [_ticker_market(t) for t in df["ticker"]]
+    df["group"] = [groups.get(t) or t for t in df["ticker"]]
+    rates = {ccy: fx_rate(ccy, base_ccy) or 1.0 for ccy in {ticker_currency(t) for t in df["ticker"]}}
+    df["fx"] = [rates[ticker_currency(t)] for t in df["ticker"]]
+
+    n_vals = df["1N"].to_numpy(dtype=np.float64)
+    df["unit_qty"] = turtle_unit_sizes(equity, n_vals, df["fx"].to_numpy(), risk_pct)
+    df["unit_cost_base"] = df["unit_qty"] * df["current_price"] * df["fx"]
+    df["risk_at_stop_base"] = df["unit_qty"] * stop_n * n_vals * df["fx"]
+
+    # Units already in the book
+    counts = {"ticker": {}, "group": {}, "market": {}, "total": {}}
+    for pos in (pd.DataFrame(held).to_dict("records") if held is not None else []):
+        t = pos["ticker"]
+        u = pos.get("units", 1)
+        for level, key in (("ticker", t), ("group", groups.get(t) or t), ("market", _ticker_market(t)), ("total", "all")):
+            counts[level][key] = counts[level].get(key, 0) + u
+
+    accepted = np.zeros(len(df), dtype=bool)
+    reasons = [""] * len(df)
+    keys = list(zip(df["ticker"], df["group"], df["market"]))
+    for i, (ticker, group, market) in enumerate(keys):
+        if df.at[i, "unit_qty"] <= 0:
+            reasons[i] = "unit < 1"
+            continue
+        levels = (("ticker", ticker), ("group", group), ("market", market), ("total", "all"))
+        full = [level for level, key in levels if counts[level].get(key, 0) + 1 > limits[level]]
+        if full:
+            reasons[i] = f"{full[0]} limit"
+            continue
+        accepted[i] = True
+        for level, key in levels:
+            counts[level][key] = counts[level].get(key, 0) + 1
+
+    df["accepted"] = accepted
+    df["reason"] = reasons
+    return df
+
+def portfolio_heat(positions, equity, base_ccy="KRW", stop_n=2.0):
+    """
+    Book heat: total loss if every position hits its stop (buy_price - stop_n * N),
+    as a fraction of equity. Vectorized over all positions; re-run on each price update.
+
+    positions: DataFrame/list with ticker, quantity, buy_price, n_val, last_close.
+    Returns (per_position DataFrame, summary dict with total heat and heat per market).
+    """
+    pos = pd.DataFrame(positions).reset_index(drop=True)
+    if pos.empty:
+        return pos, {"risk_base": 0.0, "heat": 0.0, "by_market": {}}
+
+    rates = {ccy: fx_rate(ccy, base_ccy) or 1.0 for ccy in {ticker_currency(t) for t in pos["ticker"]}}
+    fx = np.array([rates[ticker_currency(t)] for t in pos["ticker"]])
+    stop = pos["buy_price"].to_numpy(dtype=np.float64) - stop_n * pos["n_val"].to_numpy(dtype=np.float64)
+    last = pos["last_close"].to_numpy(dtype=np.float64)
+    qty = pos["quantity"].to_numpy(dtype=np.float64)
+
+    pos["stop_price"] = stop
+    pos["risk_base"] = np.maximum(last - stop, 0.0) * qty * fx
+    pos["units"] = qty / np.maximum(turtle_unit_sizes(equity, pos["n_val"], fx), 1)
+    pos["market"] = [_ticker_market(t) for t in pos["ticker"]]
+    pos["heat"] = pos["risk_base"] / equity if equity else np.nan
+
+    summary = {
+        "risk_base": float(pos["risk_base"].sum()),
+        "heat": float(pos["risk_base"].sum() / equity) if equity else float("nan"),
+        "by_market": (pos.groupby("market")["risk_base"].sum() / equity).to_dict() if equity else {}
+    }
+    return pos, summary
+
+# DCA rebalancing
+def _greedy_buys(qty, gap, cash, prices, valid):
+    """Adds the single best share while it lowers the objective (in place). Returns the cash left."""
+    price_sq = prices ** 2
+    while True:
+        # objective change of one more share of i: (gap_i - p_i)^2 - gap_i^2
+        delta = np.where(valid & (prices <= cash + 1e-9), price_sq - 2 * prices * gap, np.inf)
+        i = int(np.argmin(delta))
+        if delta[i] >= -1e-9:
+            return cash
+        qty[i] += 1
+        gap[i] -= prices[i]
+        cash -= prices[i]
+
+def solve_integer_buys(prices, values, weights, budget, max_rounds=1000):
+    """
+    Integer share purchases (buy-only) that bring holdings closest to target weights.
+
+    Minimizes sum_i (values_i + q_i * prices_i - weights_i * (sum(values) + budget))^2
+    subject to sum(q_i * prices_i) <= budget. Targets include the whole budget, so
+    leaving cash unspent counts as deviation too.
+    Greedy: buy the single share with the largest objective decrease until none helps.
+    Local search: for every item bought, try handing one share back and refilling
+    greedily (covers 1-for-1 swaps and 1-for-many trades); keep the best improvement
+    and repeat until nothing improves.
+    Returns an int64 array of share counts.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / weights.sum()
+    qty = np.zeros(len(prices), dtype=np.int64)
+    valid = prices > 0
+    if not valid.any() or budget <= 0:
+        return qty
+
+    gap = weights * (values.sum() + budget) - values # value still missing per item
+    cash = _greedy_buys(qty, gap, float(budget), prices, valid)
+    best_obj = float(gap @ gap)
+
+    for _ in range(max_rounds):
+        best = None
+        for i in np.flatnonzero(qty > 0):
+            cand_qty, cand_gap = qty.copy(), gap.copy()
+            cand_qty[i] -= 1
+            cand_gap[i] += prices[i]
+            # the returned share may not be bought straight back
+            blocked = valid.copy()
+            blocked[i] = False
+            cand_cash = _greedy_buys(cand_qty, cand_gap, cash + prices[i], prices, blocked)
+            cand_cash = _greedy_buys(cand_qty, cand_gap, cand_cash, prices, valid)
+            obj = float(cand_gap @ cand_gap)
+            if obj < best_obj - 1e-6 and (best is None or obj < best[0]):
+                best = (obj, cand_qty, cand_gap, cand_cash)
+        if best is None:
+            break
+        best_obj, qty, gap, cash = best
+    return qty
+
+def plan_dca_buys(plan, holdings, prices, budget):
+    """
+    Monthly buy guide for a target-weight plan.
+
+    - plan: [{"ticker", "name", "weight", optional "equivalents": [tickers]}]; holdings of
+      an equivalent ticker (e.g. another issuer's ETF on the same index) count toward the item
+    - holdings: [{"ticker", "quantity"}] (DCA_PORTFOLIO)
+    - prices: ticker -> current price for plan and held tickers
+    - budget: cash available for the plan
+
+    Returns (DataFrame per plan item, summary dict with spent, leftover and the
+    weight deviation (sum of absolute differences) before and after).
+    """
+    held = {}
+    for h in holdings:
+        held[h["ticker"]] = held.get(h["ticker"], 0) + h["quantity"]
+
+    rows = []
+    for item in plan:
+        tickers = [item["ticker"]] + list(item.get("equivalents", []))
+        value = sum(held.get(t, 0) * prices.get(t, 0.0) for t in tickers)
+        rows.append({"ticker": item["ticker"], "name": item["name"], "price": prices.get(item["ticker"], 0.0),
+                     "weight": item["weight"], "current_value": value})
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df, {}
+
+    df["weight"] = df["weight"] / df["weight"].sum()
+    df["qty"] = solve_integer_buys(df["price"], df["current_value"], df["weight"], budget)
+    df["cost"] = df["qty"] * df["price"]
+    df["final_value"] = df["current_value"] + df["cost"]
+
+    current_total = df["current_value"].sum()
+    final_total = df["final_value"].sum()
+    df["current_weight"] = df["current_value"] / current_total if current_total > 0 else 0.0
+    df["final_weight"] = df["final_value"] / final_total if final_total > 0 else 0.0
+    summary = {
+        "spent": float(df["cost"].sum()),
+        "leftover": float(budget - df["cost"].sum()),
+        "deviation_before": float((df["current_weight"] - df["weight"]).abs().sum()),
+        "deviation_after": float((df["final_weight"] - df["weight"]).abs().sum())
+    }
+    return df, summary
+
+# DCA backtesting
+DCA_BACKTEST_PERIOD = "5y"
+DCA_GOLD_TICKER = "GC=F"
+
+def dca_price_panel(tickers, period=DCA_BACKTEST_PERIOD, base_ccy="KRW"):
+    """
+    Daily prices in base_ccy for a DCA backtest: the plan tickers plus a "GOLD_G"
+    column (GC=F per gram, the unit the domestic gold account buys).
+    Rows are the sessions of the base currency's market; earlier gaps stay NaN
+    (not yet listed), later gaps are forward-filled.
+    """
+    panel = close_panel(list(tickers) + [DCA_GOLD_TICKER], period=period)
+    if panel.empty:
+        return panel
+    for ticker in panel.columns:
+        panel[ticker] = convert_series(panel[ticker], ticker_currency(ticker), base_ccy)
+    panel = panel.rename(columns={DCA_GOLD_TICKER: "GOLD_G"})
+    panel["GOLD_G"] = panel["GOLD_G"] / GRAMS_PER_TROY_OUNCE
+    calendar = MARKET_CALENDARS.get("KR" if base_ccy == "KRW" else "US")
+    return align_panel({col: panel[col] for col in panel.columns}, calendar=calendar)
+
+def _buy_schedule(dates, buy_days):
+    """
+    (T x D) bool: True on the first session on/after each buy day of the month
+    (last session if none). In the partial first / last month of `dates` only buys
+    that really fall inside the data are kept: none when the buy day came before the
+    first date, and no last-session fallback while the month is still running.
+    """
+    dates = pd.DatetimeIndex(dates)
+    is_buy = np.zeros((len(dates), len(buy_days)), dtype=bool)
+    if dates.empty:
+        return is_buy
+    period = dates.to_period("M")
+    month_start = np.flatnonzero(np.r_[True, period[1:] != period[:-1]])
+    month_end = np.r_[month_start[1:], len(dates)]
+    day = dates.day.to_numpy()
+    first, last = dates[0].date(), dates[-1].date()
+    # partial = weekdays of the month lie outside the data
+    partial_first = np.busday_count(first.replace(day=1), first) > 0
+    partial_last = np.busday_count(last + datetime.timedelta(days=1), (dates[-1] + pd.offsets.MonthBegin()).date()) > 0
+    for d, buy_day in enumerate(buy_days):
+        for a, b in zip(month_start, month_end):
+            hits = np.flatnonzero(day[a:b] >= buy_day)
+            if len(hits):
+                if a == 0 and partial_first and hits[0] == 0 and day[0] > buy_day:
+                    continue # the buy day was before the first date
+                is_buy[a + hits[0], d] = True
+            elif not (b == len(dates) and partial_last):
+                is_buy[b - 1, d] = True
+    return is_buy
+
+def _irr(times, flows, final_value, iterations=50):
+    """
+    Annual money-weighted return per column, by Newton's method.
+    times: (K + 1,) years of each deposit, then of the valuation date;
+    flows: (K x S) deposits; final_value: (S,) value on the valuation date.
+    """
+    t_end = times[-1]
+    rate = np.full(flows.shape[1], 0.05)
+    for _ in range(iterations):
+        growth = (1 + rate)[None, :] ** (t_end - times[:-1, None])
+        f = final_value - (flows * growth).sum(axis=0)
+        df = -(flows * (t_end - times[:-1, None]) * growth / (1 + rate)[None, :]).sum(axis=0)
+        step = np.where(df != 0, f / df, 0)
+        rate = np.clip(rate - step, -0.99, 10)
+        if np.all(np.abs(step) < 1e-10):
+            break
+    return rate
+
+def dca_backtest(prices, buy_days=(15,), weight_sets=None, budgets=(500000,), gold_units=(1,)):
+    """
+    Simulates monthly DCA for every combination of buy day x weights x budget x gold units
+    at once (variants are columns of one array; the loop runs over days only).
+
+    - prices: dca_price_panel() output (base currency, "GOLD_G" column per gram)
+    - buy_days: day of month; the buy happens on the first session on/after it
+    - weight_sets: [{ticker: weight}] over the ETF columns (default: equal weights)
+    - budgets: monthly ETF budget; gold_units: grams bought each month on top of it
+
+    Each month the deposit is budget + gold cost. ETF shares are floor(cash * weight / price)
+    with leftover cash carried to the next month (a ticker without a price yet keeps
+    its share in cash). Reports invested, final value, profit, IRR (money-weighted),
+    max drawdown of the time-weighted NAV and average cost per ETF.
+    Gold is valued at its last known price on days without one; no gold is bought
+    before its first price.
+    """
+    if prices.empty:
+        return pd.DataFrame()
+    etfs = [c for c in prices.columns if c != "GOLD_G"]
+    if weight_sets is None:
+        weight_sets = [{t: 1 / len(etfs) for t in etfs}]
+    grid = [(d, w, b, g) for d in range(len(buy_days)) for w in range(len(weight_sets))
+            for b in budgets for g in gold_units]
+    day_idx = np.array([v[0] for v in grid])
+    weights = np.array([[weight_sets[v[1]].get(t, 0.0) for t in etfs] for v in grid])
+    weights = weights / np.where(weights.sum(axis=1, keepdims=True) > 0, weights.sum(axis=1, keepdims=True), 1)
+    budget = np.array([v[2] for v in grid], dtype=np.float64)
+    grams = np.array([v[3] for v in grid], dtype=np.float64)
+
+    px = prices[etfs].to_numpy(dtype=np.float64)
+    gold = prices["GOLD_G"].ffill().to_numpy(dtype=np.float64) if "GOLD_G" in prices.columns else np.zeros(len(prices))
+    is_buy = _buy_schedule(prices.index, list(buy_days))
+    S, n = len(grid), len(etfs)
+
+    shares = np.zeros((S, n))
+    spent = np.zeros((S, n))
+    gold_held = np.zeros(S)
+    cash = np.zeros(S)
+    nav = np.ones(S)
+    nav_peak = np.ones(S)
+    max_dd = np.zeros(S)
+    prev_value = np.zeros(S)
+    flow_times, flows = [], []
+    start = prices.index[0]
+
+    for t in range(len(prices)):
+        p = np.nan_to_num(px[t])
+        g = 0.0 if np.isnan(gold[t]) else gold[t]
+        buy = is_buy[t, day_idx]
+        bought_grams = grams if g > 0 else np.zeros(S)
+        deposit = np.where(buy, budget + bought_grams * g, 0.0)
+        if buy.any():
+            cash += np.where(buy, budget, 0.0)
+            gold_held += np.where(buy, bought_grams, 0.0)
+            alloc = cash[:, None] * weights
+            qty = np.where(p > 0, np.floor(alloc / np.where(p > 0, p, 1)), 0) * buy[:, None]
+            shares += qty
+            spent += qty * p
+            cash -= (qty * p).sum(axis=1)
+            flow_times.append((prices.index[t] - start).days / 365.25)
+            flows.append(deposit)
+
+        value = shares @ p + gold_held * g + cash
+        live = prev_value > 0
+        ret = np.where(live, (value - deposit) / np.where(live, prev_value, 1), 1.0)
+        nav *= ret
+        nav_peak = np.maximum(nav_peak, nav)
+        max_dd = np.minimum(max_dd, nav / nav_peak - 1)
+        prev_value = value
+
+    invested = np.sum(flows, axis=0) if flows else np.zeros(S)
+    times = np.array(flow_times + [(prices.index[-1] - start).days / 365.25])
+    irr = _irr(times, np.array(flows), prev_value) if flows else np.zeros(S)
+
+    result = pd.DataFrame({
+        "buy_day": [buy_days[v[0]] for v in grid],
+        "weights": ["/".join(f"{weight_sets[v[1]].get(t, 0) * 100:.0f}" for t in etfs) for v in grid],
+        "budget": budget,
+        "gold_units": grams,
+        "invested": invested,
+        "final_value": prev_value,
+        "profit_pct": np.where(invested > 0, prev_value / np.where(invested > 0, invested, 1) - 1, 0.0),
+        "irr": irr,
+        "max_drawdown": max_dd,
+        "cash": cash
+    })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_cost = spent / shares
+    for j, ticker in enumerate(etfs):
+        result[f"avg_cost_{ticker}"] = avg_cost[:, j]
+    return result
+
+# Market-phase history
+PHASE_HISTORY_PERIOD = "5y"
+PHASE_FORWARD_HORIZONS = [5, 20, 60] # bars
+PHASES = [1, 2, 3, 4, 5, 6]
+
+def _ragged_rolling_mean(stacked, starts, windows):
+    """Rolling mean per column with its own window; NaN until a column has `window` bars."""
+    T = stacked.shape[0]
+    csum = np.vstack([np.zeros((1, stacked.shape[1])), np.cumsum(np.nan_to_num(stacked), axis=0)])
+    rows = np.arange(T)[:, None]
+    lag = np.clip(rows + 1 - windows[None, :], 0, None)
+    window_sum = csum[rows + 1, np.arange(stacked.shape[1])] - np.take_along_axis(csum, lag, axis=0)
+    mean = window_sum / windows[None, :]
+    mean[rows < starts[None, :] + windows[None, :] - 1] = np.nan
+    return mean
+
+def phase_labels(closes, calendars=None):
+    """
+    Vectorized analyze_market_phase() for every bar of every series.
+
+    closes: {name: 1-D array of closes}; calendars: {name: calendar} for the
+    calendar-scaled 20/60 windows. The series are stacked right-aligned by bar
+    (not by date) into one T x k array, so all indices are labelled in one pass
+    each with its own bars. Returns {name: int8 array}, 0 while the long MA is undefined.
+    """
+    names = list(closes)
+    if not names:
+        return {}
+    calendars = calendars or {}
+    lengths = np.array([len(closes[n]) for n in names])
+    T = lengths.max()
+    stacked = np.full((T, len(names)), np.nan)
+    for j, name in enumerate(names):
+        stacked[T - lengths[j]:, j] = closes[name]
+    starts = T - lengths
+    short = _ragged_rolling_mean(stacked, starts, np.array([calendar_bars(calendars.get(n), 20) for n in names]))
+    long = _ragged_rolling_mean(stacked, starts, np.array([calendar_bars(calendars.get(n), 60) for n in names]))
+
+    price = stacked
+    up = short > long
+    labels = np.select(
+        [up & (price > short), up & (price > long), up,
+         ~up & (price < short), ~up & (price < long), ~up],
+        [1, 2, 3, 4, 5, 6], default=0
+    ).astype(np.int8)
+    labels[np.isnan(long)] = 0
+    return {name: labels[T - lengths[j]:, j] for j, name in enumerate(names)}
+
+def _close_series(df):
+    close = df['Close'].astype(np.float64).dropna()
+    idx = pd.DatetimeIndex(close.index)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    close.index = idx.normalize()
+    return close[~close.index.duplicated(keep="last")]
+
+def phase_history(indices=None, period=PHASE_HISTORY_PERIOD):
+    """
+    Phase label per bar for each index: {name: DataFrame(date -> close, phase)}.
+
+    Tables are stored per ticker and only bars newer than the stored ones are
+    labelled (with the preceding long-MA window as context); the last stored bar
+    is re-evaluated, and a table whose closes no longer match is relabelled.
+    All pending work, full or incremental, goes through one phase_labels() call.
+    """
+    indices = indices or TARGET_INDICES
+    histories = fetch_many(indices.values(), period=period)
+    tables, pending = {}, {}
+    for name, ticker in indices.items():
+        df = histories.get(ticker)
+        path = _cache_path("phases", f"{_safe_name(ticker)}.pkl")
+        stored = _read_pickle(path)
+        if df is None or df.empty:
+            if stored is not None:
+                tables[name] = stored
+            continue
+        close = _close_series(df)
+        calendar = ticker_calendar(ticker)
+        context = calendar_bars(calendar, 60) - 1
+
+        keep, start = None, 0
+        if stored is not None and len(stored) > 1:
+            checkpoint_date = stored.index[-2]
+            pos = close.index.searchsorted(checkpoint_date)
+            if pos < len(close) and close.index[pos] == checkpoint_date and \
+                    np.isclose(close.iloc[pos], stored["close"].iloc[-2], rtol=1e-9):
+                keep, start = stored.iloc[:-1], pos + 1
+        pending[name] = (ticker, calendar, close, keep, start, max(start - context, 0), path)
+
+    labels = phase_labels({name: p[2].to_numpy()[p[5]:] for name, p in pending.items()},
+                          {name: p[1] for name, p in pending.items()})
+    for name, (ticker, calendar, close, keep, start, ctx_start, path) in pending.items():
+        new = close.iloc[start:]
+        table = pd.DataFrame({"close": new.to_numpy(), "phase": labels[name][start - ctx_start:]}, index=new.index)
+        if keep is not None:
+            table = pd.concat([keep, table])
+        _write_pickle(path, table)
+        tables[name] = table
+    return tables
+
+def phase_runs(table):
+    """Consecutive runs of one phase: phase, start, end, bars and return over the run (close to close)."""
+    table = table[table["phase"] > 0]
+    if table.empty:
+        return pd.DataFrame(columns=["phase", "start", "end", "bars", "return"])
+    phase = table["phase"].to_numpy()
+    close = table["close"].to_numpy()
+    breaks = np.flatnonzero(np.diff(phase)) + 1
+    first = np.concatenate([[0], breaks])
+    last = np.concatenate([breaks - 1, [len(phase) - 1]])
+    # a run is entered at the close of the bar before its first bar
+    entry = close[np.maximum(first - 1, 0)]
+    return pd.DataFrame({
+        "phase": phase[first],
+        "start": table.index[first],
+        "end": table.index[last],
+        "bars": last - first + 1,
+        "return": close[last] / entry - 1
+    })
+
+def phase_transitions(runs):
+    """6x6 probabilities of the next phase given the current one (from consecutive runs)."""
+    counts = pd.crosstab(runs["phase"].iloc[:-1].to_numpy(), runs["phase"].iloc[1:].to_numpy())
+    counts = counts.reindex(index=PHASES, columns=PHASES, fill_value=0)
+    counts = counts.rename_axis(index="from", columns="to")
+    return counts.div(counts.sum(axis=1).replace(0, np.nan), axis=0)
+
+def phase_forward_returns(table, horizons=PHASE_FORWARD_HORIZONS):
+    """Mean forward return after `h` bars for the bars labelled with each phase (phase x horizon)."""
+    close = table["close"].to_numpy()
+    out = {}
+    for h in horizons:
+        fwd = np.full(len(close), np.nan)
+        if len(close) > h:
+            fwd[:-h] = close[h:] / close[:-h] - 1
+        out[f"fwd_{h}"] = pd.Series(fwd).groupby(table["phase"].to_numpy()).mean()
+    return pd.DataFrame(out).reindex(PHASES)
+
+def phase_regime_stats(indices=None, period=PHASE_HISTORY_PERIOD):
+    """
+    Per index: {"runs", "transitions", "forward", "current"} where current holds the
+    live phase, its run length in bars and the run's return so far.
+    """
+    stats = {}
+    for name, table in phase_history(indices, period=period).items():
+        runs = phase_runs(table)
+        if runs.empty:
+            continue
+        stats[name] = {
+            "runs": runs,
+            "transitions": phase_transitions(runs),
+            "forward": phase_forward_returns(table),
+            "current": runs.iloc[-1].to_dict()
+        }
+    return stats
+
+# Correlation engine
+CORRELATION_WINDOW = 63 # ~3 months of daily returns
+CORRELATION_BLOCK_SIZE = 512 # columns per block in blockwise products
+CORRELATION_MEMORY_BUDGET = 256 * 1024 * 1024 # bytes; larger matrices are memory-mapped under CACHE_DIR
+
+def return_panel(tickers, period="1y"):
+    """Aligned daily log returns (date x ticker) as float32; first row dropped."""
+    panel = close_panel(tickers, period=period)
+    if panel.empty:
+        return panel
+    returns = np.log(panel).diff().iloc[1:]
+    return returns.astype(np.float32)
+
+def _correlation_output(k, name):
+    nbytes = k * k * 4
+    if nbytes <= CORRELATION_MEMORY_BUDGET:
+        return np.empty((k, k), dtype=np.float32)
+    path = _cache_path("correlation", f"{name}.f32")
+    return np.memmap(path, dtype=np.float32, mode="w+", shape=(k, k))
+
+def _blocked_correlation(k, block, block_size=CORRELATION_BLOCK_SIZE, name="corr"):
+    """
+    k x k float32 correlation filled from block(i_slice, j_slice) over the upper
+    triangle (mirrored below), so temporaries stay at block_size x block_size.
+    Matrices above CORRELATION_MEMORY_BUDGET are written to a memory-mapped file.
+    """
+    out = _correlation_output(k, name)
+    for i in range(0, k, block_size):
+        rows = slice(i, i + block_size)
+        for j in range(i, k, block_size):
+            cols = slice(j, j + block_size)
+            values = np.nan_to_num(block(rows, cols)).astype(np.float32)
+            out[rows, cols] = values
+            if j != i:
+                out[cols, rows] = values.T
+    np.fill_diagonal(out, 1.0)
+    return out
+
+def correlation_matrix(returns, block_size=CORRELATION_BLOCK_SIZE, name="corr"):
+    """
+    Pearson correlation of the return columns, computed blockwise in float32.
+
+    Missing returns count as 0 (no price change, as on forward-filled days; the
+    rolling state uses the same rule). Columns are standardized once, then the
+    result is filled block by block from Z[:, i].T @ Z[:, j] (see _blocked_correlation).
+    Returns (ndarray, tickers).
+    """
+    values = np.nan_to_num(np.asarray(returns, dtype=np.float32))
+    tickers = list(returns.columns)
+    T, k = values.shape
+    z = values - values.mean(axis=0)
+    std = np.sqrt((z * z).sum(axis=0) / max(T - 1, 1))
+    z /= np.where(std > 0, std, np.inf)
+    return _blocked_correlation(k, lambda i, j: (z[:, i].T @ z[:, j]) / max(T - 1, 1), block_size, name), tickers
+
+def _new_correlation_state(returns, window, block_size=CORRELATION_BLOCK_SIZE):
+    window_rows = np.nan_to_num(np.asarray(returns.tail(window), dtype=np.float32))
+    k = window_rows.shape[1]
+    cross = np.empty((k, k), dtype=np.float32)
+    for i in range(0, k, block_size):
+        cross[i:i + block_size] = window_rows[:, i:i + block_size].T @ window_rows
+    return {
+        "tickers": list(returns.columns),
+        "window": window,
+        "rows": window_rows, # ring buffer, kept to subtract rows leaving the window
+        "head": 0, # position of the oldest row
+        "dates": list(returns.index[-window:]),
+        "sum": window_rows.sum(axis=0, dtype=np.float64),
+        "sumsq": (window_rows.astype(np.float64) ** 2).sum(axis=0),
+        "cross": cross # float32 sum of outer products
+    }
+
+def _update_correlation_state(state, new_returns, block_size=CORRELATION_BLOCK_SIZE):
+    """
+    Slides the window by one day per row: a rank-1 add and a rank-1 remove, O(k^2)
+    per day, applied in place block by block (temporaries of block_size x k).
+    """
+    cross = state["cross"]
+    for date, row in zip(new_returns.index, np.nan_to_num(np.asarray(new_returns, dtype=np.float32))):
+        head = state["head"]
+        old = state["rows"][head].copy()
+        state["sum"] += row.astype(np.float64) - old
+        state["sumsq"] += row.astype(np.float64) ** 2 - old.astype(np.float64) ** 2
+        for i in range(0, len(row), block_size):
+            block = cross[i:i + block_size]
+            block += np.multiply.outer(row[i:i + block_size], row)
+            block -= np.multiply.outer(old[i:i + block_size], old)
+        state["rows"][head] = row
+        state["head"] = (head + 1) % len(state["rows"])
+        state["dates"] = state["dates"][1:] + [date]
+
+def _copy_correlation_state(state):
+    return {k: v.copy() if isinstance(v, (np.ndarray, list)) else v for k, v in state.items()}
+
+def _correlation_from_state(state, block_size=CORRELATION_BLOCK_SIZE, name="corr"):
+    n = len(state["rows"])
+    mean = state["sum"] / n
+    var = np.maximum(state["sumsq"] / n - mean ** 2, 0)
+    std = np.sqrt(var)
+    cross = state["cross"]
+
+    def block(i, j):
+        cov = cross[i, j] / n - np.multiply.outer(mean[i], mean[j])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return cov / np.multiply.outer(std[i], std[j])
+
+    return _blocked_correlation(len(mean), block, block_size, name)
+
+def rolling_correlation(tickers, window=CORRELATION_WINDOW, period="1y"):
+    """
+    Rolling `window`-day correlation matrix of daily returns, updated incrementally.
+
+    The window's running sums (sum, sum of squares, cross products) are stored per
+    ticker set as a checkpoint taken before the newest day, which may have been
+    intraday; each call resumes from the checkpoint and re-adds the newest day.
+    The state is rebuilt every `window` days to shed rounding drift.
+    Returns a DataFrame (ticker x ticker, float32).
+    """
+    tickers = list(dict.fromkeys(tickers))
+    key = hashlib.sha1(json.dumps([tickers, window]).encode()).hexdigest()[:16]
+    path = _cache_path("correlation", f"state_{key}.pkl")
+    returns = return_panel(tickers, period=period)
+    if returns.empty:
+        return pd.DataFrame()
+
+    state = _read_pickle(path)
+    if state is not None and not state.get("checkpoint"):
+        state = None # stored before checkpoints (may include an intraday day)
+    if state is not None and state["tickers"] == list(returns.columns) and state["dates"][-1] in returns.index:
+        new = returns[returns.index > state["dates"][-1]]
+        state["updates"] = state.get("updates", 0) + max(len(new) - 1, 0)
+        if state["updates"] >= window:
+            state = None
+        else:
+            _update_correlation_state(state, new.iloc[:-1])
+    else:
+        state = None
+
+    if state is None and len(returns) > window:
+        state = _new_correlation_state(returns.iloc[:-1], window)
+        state["checkpoint"] = True
+    if state is None: # no full window before the newest day yet
+        live = _new_correlation_state(returns, window)
+    else:
+        _write_pickle(path, state)
+        live = _copy_correlation_state(state)
+        _update_correlation_state(live, returns[returns.index > state["dates"][-1]])
+    state = live
+    corr = _correlation_from_state(state, name=f"rolling_{key}")
+    return pd.DataFrame(corr, index=state["tickers"], columns=state["tickers"], copy=False)
+
+def single_linkage_mst(corr):
+    """
+    Single-linkage hierarchy of a correlation matrix as its minimum spanning tree
+    on distance 1 - corr (Prim's algorithm, O(k^2) time, O(k) extra memory).
+    Returns edges (i, j, distance) sorted by distance; merging them in order
+    reproduces the single-linkage dendrogram.
+    """
+    corr = np.asarray(corr)
+    k = corr.shape[0]
+    if k == 0:
+        return []
+    in_tree = np.zeros(k, dtype=bool)
+    best = np.full(k, np.inf)
+    parent = np.full(k, -1)
+    in_tree[0] = True
+    best[:] = 1.0 - corr[0]
+    parent[:] = 0
+    edges = []
+    for _ in range(k - 1):
+        cand = np.where(in_tree, np.inf, best)
+        j = int(np.argmin(cand))
+        edges.append((int(parent[j]), j, float(best[j])))
+        in_tree[j] = True
+        dist_j = 1.0 - corr[j]
+        closer = ~in_tree & (dist_j < best)
+        best[closer] = dist_j[closer]
+        parent[closer] = j
+    edges.sort(key=lambda e: e[2])
+    return edges
+
+def cluster_correlations(corr, threshold=0.7):
+    """
+    Groups tickers whose correlation chains stay >= threshold (single linkage cut
+    at distance 1 - threshold). Returns {ticker: "cluster-N"} for a DataFrame input.
+    """
+    tickers = list(corr.index)
+    labels = list(range(len(tickers)))
+
+    def find(x):
+        while labels[x] != x:
+            labels[x] = labels[labels[x]]
+            x = labels[x]
+        return x
+
+    for i, j, dist in single_linkage_mst(corr.to_numpy()):
+        if dist > 1.0 - threshold:
+            break
+        labels[find(i)] = find(j)
+
+    roots = {}
+    return {t: f"cluster-{roots.setdefault(find(i), len(roots))}" for i, t in enumerate(tickers)}
+
+def correlation_groups(tickers, threshold=0.7, window=CORRELATION_WINDOW):
+    """
+    Correlated groups for size_candidates(groups=...): tickers in a correlation
+    cluster of two or more share a "corr-N" group; the rest keep their sector
+    (the default grouping).
+    """
+    tickers = list(dict.fromkeys(tickers))
+    groups = {t: s for t, s in ticker_sectors().items() if t in tickers and s}
+    corr = rolling_correlation(tickers, window=window)
+    if corr.empty:
+        return groups
+    clusters = cluster_correlations(corr, threshold)
+    sizes = pd.Series(clusters).value_counts()
+    for ticker, label in clusters.items():
+        if sizes[label] > 1:
+            groups[ticker] = f"corr-{label.split('-')[1]}"
+    return groups
+
+# Async API
+# yfinance is blocking, so its calls run on a shared thread pool; ASYNC_IO_WORKERS
+# bounds how many requests are in flight at once. Every coroutine has a sync
+# counterpart (fetch_data, load_history, ...) that existing callers keep using.
+ASYNC_IO_WORKERS = 32
+_io_executor = None
+
+def _get_io_executor():
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix="engine-io")
+    return _io_executor
+
+async def _in_thread(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_executor(), func, *args)
+
+def run_sync(coro):
+    """Runs a coroutine from sync code, also when the calling thread already runs an event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+async def afetch_data(ticker, period="2y"):
+    return await _in_thread(fetch_data, ticker, period)
+
+async def aload_history(ticker, period="2y", max_age=PRICE_CACHE_TTL):
+    return await _in_thread(load_history, ticker, period, max_age)
+
+async def aget_dividend_history(ticker, count=5):
+    return await _in_thread(get_dividend_history, ticker, count)
+
+async def aget_domestic_gold_price():
+    """get_domestic_gold_price() over httpx when installed, otherwise in a worker thread."""
+    if httpx is None or OFFLINE:
+        return await _in_thread(get_domestic_gold_price)
+    try:
+        async with httpx.AsyncClient(headers=NAVER_HEADERS, timeout=10) as client:
+            r = await client.get(NAVER_GOLD_URL)
+        return _record_gold_price(_parse_gold_price(r.text))
+    except Exception as e:
+        print(f"Error fetching domestic gold price: {e}")
+        return None
+
+async def afetch_many(tickers, period="2y", cached=True):
+    """{ticker: history or None} for many tickers with all downloads overlapped (cached=False bypasses the store)."""
+    tickers = list(dict.fromkeys(tickers))
+    load = aload_history if cached else afetch_data
+    frames = await asyncio.gather(*(load(ticker, period) for ticker in tickers))
+    return dict(zip(tickers, frames))
+
+def fetch_many(tickers, period="2y", cached=True):
+    return run_sync(afetch_many(tickers, period=period, cached=cached))
+
+async def aiter_screen_stocks(market_type="US", sectors=None, min_market_cap=None, min_avg_value=None, tickers=None,
+                              fundamental_filters=None, strategy=None):
+    """
+    Async iter_screen_stocks(): shards of SCAN_SHARD_SIZE tickers are screened on
+    the I/O thread pool (each as one panel) and progress dicts are yielded as
+    shards complete.
+    """
+    strategy = _screen_strategy(market_type, strategy)
+    rows, total = await _in_thread(_screen_rows, market_type, sectors, tickers, min_market_cap, fundamental_filters)
+    shards = [rows[i:i + SCAN_SHARD_SIZE] for i in range(0, len(rows), SCAN_SHARD_SIZE)]
+    tasks = {asyncio.ensure_future(_in_thread(_screen_shard, (shard, strategy, min_avg_value))): len(shard)
+             for shard in shards}
+    done = total - len(rows)
+    if not tasks:
+        yield {"done": done, "total": total, "results": []}
+
+    async def finished(task):
+        return await task, tasks[task]
+
+    try:
+        for next_done in asyncio.as_completed([finished(task) for task in tasks]):
+            results, count = await next_done
+            done += count
+            yield {"done": done, "total": total, "results": results}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def ascreen_stocks(market_type="US", sectors=None, min_market_cap=None, min_avg_value=None, fundamental_filters=None,
+                         strategy=None):
+    """Async screen_stocks(): same criteria and rank-ordered DataFrame."""
+    results = []
+    async for progress in aiter_screen_stocks(market_type, sectors, min_market_cap, min_avg_value,
+                                              fundamental_filters=fundamental_filters, strategy=strategy):
+        results.extend(progress["results"])
+    results.sort(key=lambda res: res["rank"])
+    return pd.DataFrame(results)
+
+def _analyze_indices(histories, timeframe="D"):
+    results = {}
     for name, ticker in TARGET_INDICES.items():
-        print(f"Fetching {name} ({ticker})...")
-        df = fetch_data(ticker)
+        df = histories.get(ticker)
         
         if df is None:
             print(f"Failed to fetch data for {name}")
             continue
             
-        # Add MAs for Charting
-        if len(df) >= 60:
-            df['MA5'] = ta.sma(df['Close'], length=5)
-            df['MA20'] = ta.sma(df['Close'], length=20)
-            df['MA40'] = ta.sma(df['Close'], length=40)
-            df['MA60'] = ta.sma(df['Close'], length=60)
-            
-        # Add MDD & Recovery Calculation (Time Series)
-        # Using cumulative max as 'Peak' (High Water Mark) for the fetched period (2y)
-        df['Peak'] = df['Close'].cummax()
-        df['Drawdown'] = (df['Close'] - df['Peak']) / df['Peak']
-        # Required Gain to recover to Peak: (Peak - Close) / Close
-        df['Recovery_Needed'] = (df['Peak'] - df['Close']) / df['Close']
-            
-        phase, phase_info = analyze_market_phase(df)
-        mdd, mdd_info = track_mdd(df)
-        n_val = calculate_atr(df)
+        if timeframe == "D":
+            phase, phase_info = analyze_market_phase(df, calendar=ticker_calendar(ticker))
+            # MDD / recovery from the incrementally maintained 52-week stats table
+            mdd, mdd_info = mdd_from_rolling_stats(rolling_stats(ticker, df=df).iloc[-1])
+        else:
+            df = load_bars(ticker, timeframe, df=df)
+            phase, phase_info = analyze_market_phase(df, timeframe=timeframe)
+            mdd, mdd_info = track_mdd(df, timeframe=timeframe)
+        n_val = calculate_atr(df, timeframe=timeframe)
         
         results[name] = {
             "phase": phase,
@@ -329,11 +3296,24 @@ def run_analysis():
             "mdd": mdd,
             "mdd_info": mdd_info,
             "n_value": n_val,
-            "data": df  # Return DataFrame for charting
+            # Compact columnar copy for charting; MAs and Peak/Drawdown are derived on read
+            "data": CompactHistory.from_frame(df)
         }
         
     return results
 
+async def arun_analysis(timeframe="D"):
+    """
+    run_analysis() with every index history loaded concurrently.
+    timeframe "W" / "M" analyzes weekly / monthly bars over a longer history.
+    """
+    print(f"Starting Analysis for: {', '.join(TARGET_INDICES.keys())}")
+    histories = await afetch_many(TARGET_INDICES.values(), period=TIMEFRAME_PERIODS[timeframe])
+    return _analyze_indices(histories, timeframe)
+
+def run_analysis(timeframe="D"):
+    return run_sync(arun_analysis(timeframe))
+
 if __name__ == "__main__":
     # If run directly, perform a quick test
     data = run_analysis()
@@ -342,4 +3322,9 @@ if __name__ == "__main__":
         print(f"  Phase: {res['phase']} ({res['phase_info']})")
         print(f"  MDD: {res['mdd']:.2%} (Recovery: {res['mdd_info'].get('recovery_rate', 0):.2%}, Recovered: {res['mdd_info'].get('is_recovered')})")
         print(f"  N-Value (ATR): {res['n_value']:.4f}")
+
+    report = memory_report(data)
+    if not report.empty:
+        print(f"\nPrice history memory: {report['stored_bytes'].sum():,} bytes "
+              f"(expanded: {report['expanded_bytes'].sum():,} bytes)")
         
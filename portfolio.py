@@ -0,0 +1,44 @@
+# 보유 종목 데이터 (app.py 화면과 alerts.py 백그라운드 알림 엔진이 공유)
+
+# --- Turtle (터틀) Portfolio Data ---
+TURTLE_EQUITY = 10_000_000.0 # 터틀 계좌 기준 자산 (원) - 유닛 사이즈/리스크 한도 계산 기준
+
+DOMESTIC_PORTFOLIO = [
+    {"ticker": "005930.KS", "buy_price": 77800.0, "quantity": 2, "name": "삼성전자"},
+    {"ticker": "015760.KS", "buy_price": 44600.0, "quantity": 6, "name": "한국전력"},
+]
+
+OVERSEAS_PORTFOLIO = [
+    {"ticker": "AMZN", "buy_price": 216.20, "quantity": 1, "name": "아마존닷컴"},
+    {"ticker": "GOOGL", "buy_price": 265.11, "quantity": 2, "name": "알파벳 A"},
+]
+
+# DCA (적립식) Portfolio Data
+DCA_PORTFOLIO = [
+    {"ticker": "133690.KS", "buy_price": 108900, "quantity": 3, "name": "TIGER 미국나스닥100"},
+    {"ticker": "360750.KS", "buy_price": 18125.78, "quantity": 32, "name": "TIGER 미국S&P500"},
+    {"ticker": "453870.KS", "buy_price": 13439.32, "quantity": 125, "name": "TIGER 인도니프티50"},
+    {"ticker": "102110.KS", "buy_price": 31460, "quantity": 16, "name": "TIGER 200"},
+    {"ticker": "GC=F", "buy_price": 181778.91, "quantity": 11, "name": "금 99.99K", "unit": "g"}, # 1g 단위 국내 금 (GC=F 온스 가격 환산)
+]
+DCA_CASH = 2073504.0 + 294975.0 # 이전에 있던 예수금 + 금 계좌의 예수금
+
+# 적립식 월 매수 계획 (ETF 목표 비중, 금은 별도 고정 수량)
+# equivalents: 같은 지수를 추종하는 기존 보유 ETF (목표 비중 계산 시 합산)
+DCA_MONTHLY_BUDGET = 500000
+DCA_BUY_WINDOW = (15, 20) # 매월 매수 기간 (일)
+DCA_GOLD_UNITS = 1
+DCA_TARGET_PLAN = [
+    {"name": "ACE 미국나스닥100", "ticker": "368590.KS", "weight": 0.30, "equivalents": ["133690.KS"]},
+    {"name": "TIGER 미국S&P500", "ticker": "360750.KS", "weight": 0.30},
+    {"name": "TIGER 인도니프티50", "ticker": "453870.KS", "weight": 0.20},
+    {"name": "TIGER 200", "ticker": "102110.KS", "weight": 0.20},
+]
+
+# Dividend (배당주) Portfolio Data
+DIVIDEND_PORTFOLIO = [
+    {"ticker": "JEPI", "buy_price_usd": 54.4955, "quantity": 29, "name": "JP Morgan Equity Premium Income"},
+    {"ticker": "SCHD", "buy_price_usd": 25.5364, "quantity": 305, "name": "Schwab US Dividend Equity"},
+    {"ticker": "SCHG", "buy_price_usd": 22.59, "quantity": 33, "name": "Schwab US Large-Cap Growth"},
+    {"ticker": "SPYM", "buy_price_usd": 58.9975, "quantity": 16, "name": "SPDR Portfolio S&P 500 ETF"},
+]
@@ -0,0 +1,261 @@
+"""
+Memory / latency profile of a full dashboard session.
+
+Every page of app.py is run headlessly through streamlit's AppTest (no server,
+no browser), one fresh session with cold in-process caches per page, and the
+page's action buttons (scans, backtest) are clicked, while tracemalloc records
+the peak and retained memory and the top allocation sites. Wall time is
+measured per page. The report is JSON with stable key order, so two versions can be diffed
+with --compare.
+
+By default the session runs in offline (replay) mode against the local cache:
+STOCK_APP_OFFLINE=1 and STOCK_APP_CACHE_DIR (or --cache-dir). Record a replay
+set by using the app normally once, then keep a copy of its cache directory.
+
+    python profile_session.py --cache-dir replay/ --out profile.json
+    python profile_session.py --compare old.json profile.json
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import sysconfig
+import subprocess
+import tracemalloc
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# Navigation entries of app.main(), selected through the ?page= query parameter
+PAGES = ["Market Board", "터틀 보유 종목", "터틀 불타기", "터틀 종목 검색", "적립식", "배당주", "지수가치", "자산 추이"]
+# Buttons clicked (in order) after the first render, so the work behind them is profiled too
+PAGE_ACTIONS = {
+    "터틀 종목 검색": ["🇺🇸 미장 종목 스캔", "🇰🇷 국장 종목 스캔"],
+    "적립식": ["백테스트 실행"],
+}
+PAGE_TIMEOUT = 600 # seconds per page
+TOP_ALLOCATIONS = 15 # allocation sites kept per page
+REGRESSION_THRESHOLD = 0.2 # relative increase reported as a regression by --compare
+STDLIB = sysconfig.get_paths()["stdlib"]
+
+# Allocations of the profiler / import machinery are not part of the app's footprint
+TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(APP_PATH), timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def _location(stat):
+    frame = stat.traceback[0]
+    filename = frame.filename
+    root = os.path.dirname(APP_PATH)
+    if filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    elif "site-packages" in filename:
+        # .../site-packages/pandas/core/frame.py -> pandas/core/frame.py
+        filename = filename.replace("\\", "/").split("/site-packages/")[-1]
+    elif filename.startswith(STDLIB):
+        filename = os.path.relpath(filename, STDLIB)
+    return f"{filename}:{frame.lineno}"
+
+def reset_caches():
+    """
+    Empties the streamlit caches and engine's in-process memos, so every page
+    starts cold and its numbers do not depend on the pages profiled before it.
+    The on-disk cache (the replay set) is left alone.
+    """
+    import streamlit as st
+    import engine
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    for value in vars(engine).values():
+        if callable(getattr(value, "cache_clear", None)):
+            value.cache_clear()
+    engine._fx_memo.clear()
+
+def _click(at, label, timeout):
+    buttons = [button for button in at.button if button.label == label]
+    if not buttons:
+        return [f"button not found: {label}"]
+    buttons[0].click().run(timeout=timeout)
+    return []
+
+def run_page(page, timeout=PAGE_TIMEOUT, top=TOP_ALLOCATIONS):
+    """
+    Runs one page in a fresh AppTest session (cold caches), clicks its
+    PAGE_ACTIONS buttons and returns the measurements: wall_s,
+    peak_bytes / retained_bytes (above the pre-run baseline),
+    top_allocations (net new memory per source line) and exceptions.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    reset_caches()
+    gc.collect()
+    before = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    started = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.query_params["page"] = page
+    try:
+        at.run()
+        missing = []
+        for label in PAGE_ACTIONS.get(page, []):
+            missing += _click(at, label, timeout)
+        exceptions = [e.message for e in at.exception] + missing
+    except Exception as e:
+        exceptions = [f"{type(e).__name__}: {e}"]
+    wall = time.perf_counter() - started
+
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    hot = [stat for stat in after.compare_to(before, "lineno") if stat.size_diff > 0][:top]
+    del at
+    gc.collect()
+
+    return {
+        "wall_s": round(wall, 3),
+        "peak_bytes": peak - baseline,
+        "retained_bytes": current - baseline,
+        "top_allocations": [
+            {"location": _location(stat), "size_bytes": stat.size_diff, "count": stat.count_diff}
+            for stat in hot
+        ],
+        "exceptions": exceptions
+    }
+
+def profile_session(pages=PAGES, timeout=PAGE_TIMEOUT, top=TOP_ALLOCATIONS, warmup=True):
+    """Profiles `pages` in order and returns the report dict."""
+    import engine
+    # tracemalloc only sees this process: scans must not run in worker processes
+    engine.SCAN_WORKERS = 1
+    tracemalloc.start()
+    try:
+        if warmup:
+            # Module imports and one-time caches would otherwise be charged to the first page
+            run_page(pages[0], timeout=timeout, top=0)
+        report_pages = {}
+        for page in pages:
+            print(f"Profiling {page} ...", file=sys.stderr)
+            report_pages[page] = run_page(page, timeout=timeout, top=top)
+    finally:
+        tracemalloc.stop()
+
+    import pandas as pd
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "offline": engine.OFFLINE,
+            "cache_dir": engine.CACHE_DIR,
+            "scan_workers": engine.SCAN_WORKERS,
+            "warmup": warmup
+        },
+        "pages": report_pages,
+        "total": {
+            "wall_s": round(sum(p["wall_s"] for p in report_pages.values()), 3),
+            "max_peak_bytes": max((p["peak_bytes"] for p in report_pages.values()), default=0)
+        }
+    }
+
+def _change(old, new):
+    if not old:
+        return None
+    return (new - old) / old
+
+def compare_reports(base, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Per-page wall time / peak memory changes between two reports.
+    Returns (rows, regressions): regressions are rows where either grew by more than `threshold`.
+    """
+    rows, regressions = [], []
+    for page in dict.fromkeys([*base["pages"], *new["pages"]]):
+        old_page, new_page = base["pages"].get(page), new["pages"].get(page)
+        if old_page is None or new_page is None:
+            rows.append({"page": page, "status": "added" if old_page is None else "removed"})
+            continue
+        row = {
+            "page": page,
+            "wall_s": (old_page["wall_s"], new_page["wall_s"], _change(old_page["wall_s"], new_page["wall_s"])),
+            "peak_bytes": (old_page["peak_bytes"], new_page["peak_bytes"], _change(old_page["peak_bytes"], new_page["peak_bytes"])),
+            "new_exceptions": [e for e in new_page["exceptions"] if e not in old_page["exceptions"]]
+        }
+        rows.append(row)
+        if any(change is not None and change > threshold for _, _, change in (row["wall_s"], row["peak_bytes"])) \
+                or row["new_exceptions"]:
+            regressions.append(page)
+    return rows, regressions
+
+def print_comparison(rows, regressions):
+    def fmt_change(change):
+        return "   n/a" if change is None else f"{change:+6.1%}"
+
+    print(f"{'page':<16} {'wall (s)':>22} {'peak (MiB)':>26}")
+    for row in rows:
+        if "status" in row:
+            print(f"{row['page']:<16} {row['status']}")
+            continue
+        old_wall, new_wall, wall_change = row["wall_s"]
+        old_peak, new_peak, peak_change = row["peak_bytes"]
+        flag = "  <-- regression" if row["page"] in regressions else ""
+        print(f"{row['page']:<16} {old_wall:7.2f} -> {new_wall:7.2f} {fmt_change(wall_change)} "
+              f"{old_peak / 2**20:8.1f} -> {new_peak / 2**20:8.1f} {fmt_change(peak_change)}{flag}")
+        for message in row["new_exceptions"]:
+            print(f"    new exception: {message}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless memory / latency profile of every dashboard page")
+    parser.add_argument("--out", default="profile.json", help="Report file (JSON)")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES)
+    parser.add_argument("--cache-dir", help="Cache / replay directory (sets STOCK_APP_CACHE_DIR)")
+    parser.add_argument("--online", action="store_true", help="Allow network requests instead of replaying the cache")
+    parser.add_argument("--timeout", type=int, default=PAGE_TIMEOUT, help="Seconds per page")
+    parser.add_argument("--top", type=int, default=TOP_ALLOCATIONS, help="Allocation sites kept per page")
+    parser.add_argument("--no-warmup", action="store_true", help="Charge imports to the first page")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT",
+                        help="Compare BASE [NEW] reports instead of profiling (NEW defaults to --out)")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative increase counted as a regression by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        base_path, new_path = (args.compare + [args.out])[:2]
+        with open(base_path, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(new_path, encoding="utf-8") as f:
+            new = json.load(f)
+        rows, regressions = compare_reports(base, new, args.threshold)
+        print_comparison(rows, regressions)
+        sys.exit(1 if regressions else 0)
+
+    # Must be set before engine is imported (read at import time)
+    if args.cache_dir:
+        os.environ["STOCK_APP_CACHE_DIR"] = os.path.abspath(args.cache_dir)
+    if not args.online:
+        os.environ["STOCK_APP_OFFLINE"] = "1"
+
+    report = profile_session(args.pages, timeout=args.timeout, top=args.top, warmup=not args.no_warmup)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+    for page, result in report["pages"].items():
+        status = f"  ({len(result['exceptions'])} exception(s))" if result["exceptions"] else ""
+        print(f"{page:<16} {result['wall_s']:8.2f}s  peak {result['peak_bytes'] / 2**20:8.1f} MiB  "
+              f"retained {result['retained_bytes'] / 2**20:8.1f} MiB{status}")
+    print(f"Report written to {args.out}")
@@ -0,0 +1,32 @@
+"""
+Shared test setup: engine runs offline against a throwaway cache directory
+(both are read when engine is imported, so they are set before any import).
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["STOCK_APP_CACHE_DIR"] = tempfile.mkdtemp(prefix="stock_app_tests_")
+os.environ["STOCK_APP_OFFLINE"] = "1"
+
+@pytest.fixture
+def make_history():
+    """Factory of daily OHLCV random walks on business days: make_history(bars, seed=0, start="2020-01-01")."""
+    def make(bars, seed=0, start="2020-01-01"):
+        rng = np.random.default_rng(seed)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+        spread = close * rng.uniform(0, 0.02, bars)
+        return pd.DataFrame({
+            "Open": close + rng.uniform(-1, 1, bars) * spread,
+            "High": close + spread,
+            "Low": close - spread,
+            "Close": close,
+            "Volume": rng.integers(1_000, 100_000, bars).astype(np.float64)
+        }, index=pd.bdate_range(start, periods=bars))
+    return make
@@ -0,0 +1,84 @@
+import gzip
+import json
+import threading
+import http.client
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import api_server
+
+class FixedStore:
+    """SnapshotStore stand-in serving one prebuilt snapshot."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def get(self, name):
+        return self.snapshot["documents"].get(name)
+
+def make_snapshot(generated_at, phases):
+    return {"generated_at": generated_at, "documents": {
+        "phases": api_server._encode(generated_at, "data", phases),
+        "index": api_server._encode(generated_at, "endpoints", [f"{api_server.API_PREFIX}/phases"]),
+    }}
+
+@pytest.fixture
+def server():
+    store = FixedStore(make_snapshot("2024-01-02T09:00:00", {"KOSPI": {"phase": 1}}))
+    handler = type("TestApiHandler", (api_server.ApiHandler,), {"store": store})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1], store
+    httpd.shutdown()
+    httpd.server_close()
+
+def request(port, path, method="GET", headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(method, path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+def test_document_is_served_with_etag(server):
+    port, store = server
+    status, headers, body = request(port, "/api/v1/phases")
+    assert status == 200
+    assert headers["ETag"] == store.get("phases")["etag"]
+    assert json.loads(body)["data"] == {"KOSPI": {"phase": 1}}
+
+def test_matching_if_none_match_returns_304(server):
+    port, store = server
+    etag = store.get("phases")["etag"]
+    for tag in (etag, f'W/{etag}', f'"other", {etag}', "*"):
+        status, headers, body = request(port, "/api/v1/phases", headers={"If-None-Match": tag})
+        assert status == 304 and body == b""
+        assert headers["ETag"] == etag
+    status, _, _ = request(port, "/api/v1/phases", headers={"If-None-Match": '"stale"'})
+    assert status == 200
+
+def test_gzip_body_decodes_to_the_plain_body(server):
+    port, _ = server
+    _, _, plain = request(port, "/api/v1/phases")
+    status, headers, body = request(port, "/api/v1/phases", headers={"Accept-Encoding": "gzip"})
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == plain
+
+def test_head_and_unknown_paths(server):
+    port, _ = server
+    status, headers, body = request(port, "/api/v1/phases", method="HEAD")
+    assert status == 200 and body == b"" and int(headers["Content-Length"]) > 0
+    assert request(port, "/api/v1/nothing")[0] == 404
+    assert request(port, "/api/v1/portfolio")[0] == 503 # known payload, not in the snapshot
+    status, _, body = request(port, "/api/v1")
+    assert status == 200 and json.loads(body)["endpoints"] == ["/api/v1/phases"]
+
+def test_etag_depends_on_the_data_only():
+    first = make_snapshot("2024-01-02T09:00:00", {"KOSPI": {"phase": 1}})["documents"]["phases"]
+    rebuilt = make_snapshot("2024-01-02T09:05:00", {"KOSPI": {"phase": 1}})["documents"]["phases"]
+    changed = make_snapshot("2024-01-02T09:05:00", {"KOSPI": {"phase": 2}})["documents"]["phases"]
+    assert first["body"] != rebuilt["body"]
+    assert first["etag"] == rebuilt["etag"] != changed["etag"]
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+
+@pytest.mark.parametrize("timeframe, rule", [("W", "W-SUN"), ("M", "ME")])
+def test_aggregate_bars_matches_resample(make_history, timeframe, rule):
+    df = make_history(400, seed=8)
+    bars = engine.aggregate_bars(df, timeframe)
+    expected = df.resample(rule).agg({"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"})
+    expected = expected.dropna(subset=["Close"])
+    np.testing.assert_allclose(bars[["Open", "High", "Low", "Close", "Volume"]].to_numpy(), expected.to_numpy())
+    # bars are labelled with their last session, not the period end
+    last_sessions = df.index.to_series().groupby(df.index.to_period(rule[0])).max()
+    assert list(bars.index) == list(last_sessions)
+
+@pytest.mark.parametrize("timeframe", ["W", "M"])
+def test_incremental_load_bars_equals_full_aggregation(make_history, timeframe):
+    df = make_history(500, seed=9)
+    ticker = f"TEST_BARS_{timeframe}"
+    engine.load_bars(ticker, timeframe, df=df.iloc[:300])
+    # the newest daily may change (intraday) before the next call
+    intraday = df.iloc[:333].copy()
+    intraday.iloc[-1, intraday.columns.get_loc("Close")] *= 0.9
+    intraday.iloc[-1, intraday.columns.get_loc("High")] *= 1.2
+    engine.load_bars(ticker, timeframe, df=intraday)
+    bars = engine.load_bars(ticker, timeframe, df=df)
+    pd.testing.assert_frame_equal(bars, engine.aggregate_bars(df, timeframe), check_freq=False)
+
+def test_restated_history_rebuilds_the_bars(make_history):
+    df = make_history(300, seed=10)
+    engine.load_bars("TEST_BARS_RESTATED", "W", df=df)
+    adjusted = df * 0.5 # e.g. re-adjusted for a split
+    bars = engine.load_bars("TEST_BARS_RESTATED", "W", df=adjusted)
+    pd.testing.assert_frame_equal(bars, engine.aggregate_bars(adjusted, "W"), check_freq=False)
+
+def test_daily_timeframe_is_passed_through(make_history):
+    df = make_history(30, seed=11)
+    assert engine.load_bars("TEST_BARS_D", "D", df=df) is df
@@ -0,0 +1,43 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import engine
+
+def objective(prices, values, weights, budget, qty):
+    weights = np.asarray(weights) / np.sum(weights)
+    gap = weights * (values.sum() + budget) - values - qty * prices
+    return float(gap @ gap)
+
+def brute_force_optimum(prices, values, weights, budget):
+    best = np.inf
+    for qty in itertools.product(*(range(int(budget // p) + 1) for p in prices)):
+        qty = np.array(qty)
+        if qty @ prices <= budget:
+            best = min(best, objective(prices, values, weights, budget, qty))
+    return best
+
+@pytest.mark.parametrize("seed", range(60))
+def test_solver_matches_brute_force_optimum(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 5))
+    prices = rng.uniform(10, 200, n).round(2)
+    values = rng.uniform(0, 1000, n).round(2)
+    weights = rng.uniform(0.1, 1, n)
+    budget = float(rng.uniform(100, 600))
+
+    qty = engine.solve_integer_buys(prices, values, weights, budget)
+    assert qty.dtype == np.int64 and (qty >= 0).all()
+    assert qty @ prices <= budget + 1e-9
+    assert objective(prices, values, weights, budget, qty) == pytest.approx(
+        brute_force_optimum(prices, values, weights, budget), abs=1e-6)
+
+def test_no_budget_or_no_prices_buys_nothing():
+    values = np.array([100.0, 200.0])
+    assert engine.solve_integer_buys([10, 20], values, [1, 1], 0).tolist() == [0, 0]
+    assert engine.solve_integer_buys([0, np.nan], values, [1, 1], 500).tolist() == [0, 0]
+
+def test_unpriced_item_is_never_bought():
+    qty = engine.solve_integer_buys([50.0, 0.0], np.zeros(2), [0.5, 0.5], 500)
+    assert qty[1] == 0 and qty[0] > 0
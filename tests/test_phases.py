@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+
+def expected_labels(close, calendar=None):
+    """analyze_market_phase() on every prefix of the series (0 while undefined)."""
+    labels = []
+    for end in range(1, len(close) + 1):
+        phase, _ = engine.analyze_market_phase(pd.DataFrame({"Close": close[:end]}), calendar=calendar)
+        labels.append(phase or 0)
+    return np.array(labels)
+
+@pytest.mark.parametrize("calendar", [None, "CRYPTO"])
+def test_phase_labels_match_analyze_market_phase(make_history, calendar):
+    close = make_history(260, seed=5)["Close"].to_numpy()
+    labels = engine.phase_labels({"A": close}, {"A": calendar})["A"]
+    np.testing.assert_array_equal(labels, expected_labels(close, calendar))
+
+def test_ragged_series_are_labelled_independently(make_history):
+    long = make_history(300, seed=6)["Close"].to_numpy()
+    short = make_history(120, seed=7)["Close"].to_numpy()
+    together = engine.phase_labels({"long": long, "short": short})
+    assert len(together["long"]) == len(long) and len(together["short"]) == len(short)
+    np.testing.assert_array_equal(together["long"], engine.phase_labels({"long": long})["long"])
+    np.testing.assert_array_equal(together["short"], expected_labels(short))
+
+def test_phase_runs_cover_every_labelled_bar():
+    index = pd.bdate_range("2024-01-01", periods=8)
+    table = pd.DataFrame({"close": [10, 11, 12, 11, 10, 11, 12, 13.0], "phase": [0, 1, 1, 2, 2, 2, 1, 1]}, index=index)
+    runs = engine.phase_runs(table)
+    assert runs["phase"].tolist() == [1, 2, 1]
+    assert runs["bars"].tolist() == [2, 3, 2]
+    # a run is entered at the previous labelled close (the first run at its own first close)
+    assert runs["return"].tolist() == pytest.approx([12 / 11 - 1, 11 / 12 - 1, 13 / 11 - 1])
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+
+WINDOW = 252
+
+def test_matches_track_mdd_on_every_full_window(make_history):
+    df = make_history(700, seed=1)
+    table = engine.rolling_stats("TEST_RS_MDD", df=df, window=WINDOW)
+    assert len(table) == len(df)
+    for end in range(WINDOW, len(df) + 1, 23):
+        mdd, info = engine.track_mdd(df.iloc[:end], window=WINDOW)
+        row_mdd, row_info = engine.mdd_from_rolling_stats(table.iloc[end - 1])
+        assert row_mdd == pytest.approx(mdd)
+        for key in ("high_1y", "low_since_high", "recovery_rate"):
+            assert row_info[key] == pytest.approx(info[key])
+        assert row_info["is_recovered"] == info["is_recovered"]
+
+def test_partial_window_is_flagged(make_history):
+    df = make_history(WINDOW + 5, seed=2)
+    table = engine.rolling_stats("TEST_RS_PARTIAL", df=df, window=WINDOW)
+    assert not table["full_window"].iloc[:WINDOW - 1].any()
+    assert table["full_window"].iloc[WINDOW - 1:].all()
+    assert engine.mdd_from_rolling_stats(table.iloc[WINDOW - 2]) == (None, {})
+
+def test_peak_date_is_first_high_of_the_window(make_history):
+    df = make_history(600, seed=3)
+    table = engine.rolling_stats("TEST_RS_PEAK", df=df, window=WINDOW)
+    closes = df["Close"].to_numpy()
+    for i in range(0, len(df), 17):
+        lo = max(0, i - WINDOW + 1)
+        assert table["peak_date"].iloc[i] == df.index[lo + int(np.argmax(closes[lo:i + 1]))]
+
+def test_incremental_update_equals_full_build(make_history):
+    df = make_history(650, seed=4)
+    full = engine.rolling_stats("TEST_RS_FULL", df=df, window=WINDOW)
+
+    engine.rolling_stats("TEST_RS_INC", df=df.iloc[:400], window=WINDOW)
+    # the last stored bar may have been intraday: feed a different close for it first
+    intraday = df.iloc[:451].copy()
+    intraday.iloc[-1, intraday.columns.get_loc("Close")] *= 1.05
+    engine.rolling_stats("TEST_RS_INC", df=intraday, window=WINDOW)
+    incremental = engine.rolling_stats("TEST_RS_INC", df=df, window=WINDOW)
+    pd.testing.assert_frame_equal(incremental, full, check_freq=False)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+
+def legacy_screen(df, market_type, min_avg_value=None):
+    """The per-ticker if-branches the rule language replaced (ta.sma == rolling mean)."""
+    high_20 = df['High'].tail(20)
+    if not high_20.iloc[-1] >= high_20.max():
+        return False
+    if min_avg_value:
+        if (df['Close'] * df['Volume']).tail(20).mean() < min_avg_value:
+            return False
+    sma5 = df['Close'].rolling(5).mean()
+    sma200 = df['Close'].rolling(200).mean()
+    if market_type == "US":
+        return bool(sma5.iloc[-1] > sma5.iloc[-2] > sma5.iloc[-3] and sma200.iloc[-1] > sma200.iloc[-2])
+    return bool(df['Volume'].iloc[-1] > df['Volume'].tail(20).mean())
+
+@pytest.fixture
+def frames(make_history):
+    frames = {}
+    for seed in range(120):
+        df = make_history(200 + seed % 60, seed=100 + seed)
+        if seed % 3 == 0: # strong uptrends, so that some tickers pass every rule
+            df = df.mul(np.linspace(1, 2, len(df)), axis=0)
+        frames[f"T{seed}"] = df
+    return frames
+
+@pytest.mark.parametrize("market_type", ["US", "KR"])
+@pytest.mark.parametrize("min_avg_value", [None, 5_000_000])
+def test_rules_match_legacy_branches(frames, market_type, min_avg_value):
+    table = engine.evaluate_rules(engine._compiled_strategy(market_type, min_avg_value), engine.bar_panel(frames))
+    expected = {ticker: legacy_screen(df, market_type, min_avg_value) for ticker, df in frames.items()}
+    assert table["passed"].to_dict() == expected
+    assert 0 < sum(expected.values()) < len(frames)
+
+def test_operators_and_precedence_build_the_same_tree():
+    close = engine.field("close")
+    parsed = engine.parse_rule("close > 2 * sma(close, 3) + 1 and not volume < 10")
+    built = (close > 2 * engine.sma(close, 3) + 1) & ~(engine.field("volume") < 10)
+    assert parsed.key == built.key
+
+def test_chained_comparison_is_a_conjunction():
+    assert engine.parse_rule("low < close < high").key == \
+        (engine.parse_rule("low < close") & engine.parse_rule("close < high")).key
+
+def test_shared_subexpressions_are_evaluated_once(frames):
+    rules = engine.compile_rules({"a": "close > sma(close, 20)", "b": "volume > sma(volume, 20) and close > sma(close, 20)"})
+    memo = {}
+    for rule in rules.values():
+        rule.evaluate(engine.bar_panel(frames), memo)
+    assert sum(key[0] == "sma" for key in memo) == 2
+
+@pytest.mark.parametrize("text", [
+    "", "close >", "__import__('os')", "close.real > 1", "foo(close)", "price > 1", "1 > 0",
+    "not 1", "sma(close)", "sma(close, 5, 6)", "sma(close, x)", "sma(close, 2.5)", "sma(close, 0)", "sma(5, 3)",
+    "sma(close, bars=5)", "close ** 2 > 1",
+])
+def test_invalid_rules_raise_value_error(text):
+    with pytest.raises(ValueError):
+        engine.parse_rule(text)
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        engine._screen_strategy("US", "no_such_strategy")